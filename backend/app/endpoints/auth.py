@@ -8,7 +8,6 @@ License: MIT
 """
 
 from fastapi import APIRouter, HTTPException, status
-import jwt
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 from app.config import settings
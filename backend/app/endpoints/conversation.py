@@ -9,7 +9,8 @@ License: MIT
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
 from datetime import datetime
 
+router = APIRouter(prefix="/conversations", tags=["conversations"])
+
 # Later we will need to import the models and the crud functions from the database module.
\ No newline at end of file
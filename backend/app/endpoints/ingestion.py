@@ -7,12 +7,106 @@ Our Own Work
 License: MIT
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, HttpUrl
-from app.dependencies import verify_token
-from app.utils import scraper
-from app.models.document import DocumentInDB
+import asyncio
+import os
+import socket
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from app import test as api
+from app.utils import metrics
+from app.worker import MAX_REPORTED_FAILURES
 
 router = APIRouter(prefix="/ingest", tags=["ingestion"])
 
-# Later, we might need this ingestion file to handle the ingestion of new documents.
\ No newline at end of file
+ARCHIVE_IMPORTS = metrics.REGISTRY.counter(
+    "docs_archive_imports_total", "Archive uploads ingested, by outcome (completed, failed, cancelled)."
+)
+
+
+@router.post("/archive")
+async def ingest_archive_endpoint(
+    request: Request,
+    user_id: str,
+    doc_id: Optional[str] = None,
+    base_url: Optional[str] = None,
+    strip_components: int = 0,
+    incremental: bool = False,
+):
+    """
+    Ingest a zip or tar(.gz) of HTML/Markdown files sent as the raw request
+    body (e.g. curl --data-binary @site.tar.gz). The upload is read and
+    ingested as it arrives, never stored whole; the response comes once the
+    import is done, and progress can be followed on /document_progress/{doc_id}/stream
+    meanwhile. Pages get their entry paths under base_url as URLs (see
+    app/utils/archive.py); strip_components drops leading directories first.
+
+    The import runs in this process, not the worker pool, since its input is
+    the open request. It is recorded as an "archive" job, so it shows up on
+    /jobs and can be cancelled there. Refused while another job of doc_id is
+    queued or running, since both would write the same pages.
+    """
+    if strip_components < 0:
+        raise HTTPException(status_code=400, detail="strip_components must not be negative.")
+    if doc_id is not None:
+        job = await asyncio.to_thread(api.job_store.active_job, doc_id)
+        if job is not None:
+            raise HTTPException(status_code=409, detail=f"Job {job['id']} is still {job['status']} for this doc_id.")
+    new_document = doc_id is None
+    doc_id = doc_id or str(uuid.uuid4())
+    if new_document:
+        await asyncio.to_thread(api.create_document, doc_id, base_url or "archive://", user_id)
+    payload = {"base_url": base_url, "strip_components": strip_components, "incremental": incremental}
+    job_id = await asyncio.to_thread(
+        api.job_store.start, doc_id, user_id, payload, "archive", f"{socket.gethostname()}:{os.getpid()}:api"
+    )
+    if job_id is None:
+        # A crawl was queued since the check above.
+        raise HTTPException(status_code=409, detail="Another job is queued or running for this doc_id.")
+    print(f"[INFO] Started archive import job {job_id} for doc_id: {doc_id}")
+    cancelled = asyncio.Event()
+
+    async def watch():
+        while not cancelled.is_set():
+            await asyncio.sleep(api.JOB_HEARTBEAT_INTERVAL)
+            if await asyncio.to_thread(api.job_store.heartbeat, job_id):
+                print(f"[INFO] Job {job_id} was cancelled, stopping.")
+                cancelled.set()
+
+    job_trace = metrics.start_trace("archive_job", trace_id=job_id, keep=False, doc_id=doc_id)
+    watcher = asyncio.create_task(watch())
+    try:
+        with job_trace.activate():
+            result = await api.ingest_archive(
+                doc_id,
+                request.stream(),
+                base_url=base_url,
+                strip_components=strip_components,
+                incremental=incremental and not new_document,
+                cancelled=cancelled,
+                on_url_done=lambda url, ok: api.job_store.checkpoint(job_id, url, ok),
+            )
+    except Exception as e:
+        job_trace.finish(error=type(e).__name__)
+        print(f"[ERROR] Archive import job {job_id} failed: {e}")
+        await asyncio.to_thread(api.job_store.finish, job_id, "failed", error=str(e))
+        await asyncio.to_thread(api.finish_document_status, doc_id, "failed")
+        ARCHIVE_IMPORTS.inc(outcome="failed")
+        # A ValueError means the upload itself was bad (not an archive, too many pages).
+        raise HTTPException(status_code=400 if isinstance(e, ValueError) else 500, detail=str(e))
+    finally:
+        watcher.cancel()
+    job_trace.finish()
+    status = "cancelled" if cancelled.is_set() else "completed"
+    if status == "cancelled":
+        await asyncio.to_thread(api.finish_document_status, doc_id, "cancelled")
+    failures = result["failed"]
+    result["failed"] = len(failures)
+    result["failures"] = failures[:MAX_REPORTED_FAILURES]
+    result["trace"] = job_trace.to_dict(spans=False)
+    await asyncio.to_thread(api.job_store.finish, job_id, status, result=result)
+    ARCHIVE_IMPORTS.inc(outcome=status)
+    print(f"[INFO] Archive import job {job_id} {status}: {result['processed']} pages.")
+    return {"doc_id": doc_id, "job_id": job_id, "status": status, **result}
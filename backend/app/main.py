@@ -1,8 +1,57 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app.endpoints import conversation, ingestion, auth
+from fastapi.middleware.cors import CORSMiddleware
+
+from app import test as api
+from app.endpoints import auth, conversation, ingestion
+from app.utils import metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Service clients are created lazily (see app/utils/clients.py), so startup
+    never waits for OpenAI, Pinecone or Supabase. With PRELOAD_CLIENTS they
+    are created in the background right away, so the first request doesn't
+    pay for it either. Clients are closed on shutdown.
+    """
+    app.state.clients = api.clients
+    preload = None
+    if api.PRELOAD_CLIENTS:
+        preload = asyncio.create_task(asyncio.to_thread(api.preload_clients))
+    yield
+    if preload is not None:
+        await asyncio.gather(preload, return_exceptions=True)
+    await api.clients.aclose()
+
+
+def create_app() -> FastAPI:
+    """Build the FastAPI app: the crawl/chat API from app/test.py plus the other routers."""
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Adjust as needed for production
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(api.router)
+    app.include_router(auth.router)
+    app.include_router(conversation.router)
+    app.include_router(ingestion.router)
+    return app
+
 
-app = FastAPI()
-# This is the main file for the FastAPI application.
-app.include_router(auth.router, prefix="/auth")
-app.include_router(conversation.router)
-app.include_router(ingestion.router)
+# To run: poetry run uvicorn app.main:app --reload
+app = create_app()
@@ -9,28 +9,35 @@ License: MIT
 import os
 import uuid
 import asyncio
+import contextvars
 import json
-from typing import List, Optional
-import requests
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+import time
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from openai import OpenAI
-from pinecone import Pinecone, ServerlessSpec
-
-from crawl4ai import (
-    AsyncWebCrawler,
-    BrowserConfig,
-    CrawlerRunConfig,
-    PruningContentFilter,
-    CacheMode
-)
-from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+# OpenAI, Pinecone and Supabase are imported by their client factories and the
+# scraper (bs4/lxml) by the first crawl, so the API and workers start fast.
+from app.utils import archive, crawl_state, discovery, http_pool, metrics, sitemap
+from app.utils.adaptive import AdaptiveLimiter, TokenBucket
+from app.utils.answer_cache import SemanticAnswerCache, doc_set_key
+from app.utils.browser_pool import BrowserPool
+from app.utils.chunk_store import ChunkStore
+from app.utils.chunker import chunk_markdown, get_token_counter
+from app.utils.clients import Clients
+from app.utils.context import pack_context
+from app.utils.dedup import Deduplicator, exact_hash
+from app.utils.embedding_cache import EmbeddingCache
+from app.utils.jobs import JobStore
+from app.utils.pipeline import IngestionPipeline
+from app.utils.progress import ProgressReporter
+from app.utils.retrieval_cache import RetrievalCache
 
 # ---------------- Load Environment ----------------
 load_dotenv()
@@ -40,177 +47,487 @@ PINECONE_ENV = os.getenv("PINECONE_ENV", "us-east1-gcp")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# --------------- Initialize Clients ----------------
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
+# Ingestion pipeline tuning (see app/utils/pipeline.py)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "40"))
+PIPELINE_FLUSH_INTERVAL = float(os.getenv("PIPELINE_FLUSH_INTERVAL", "1.0"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+
+# Chunk size budget, in embedding-model tokens
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+
+# Retrieved context per /chat answer, in chat-model tokens (see app/utils/context.py)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1000"))
+
+# Per-stage concurrency limits for crawling
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "32"))  # ceiling, each host's own limit adapts
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "2"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+
+# Local embedding cache (see app/utils/embedding_cache.py)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+# Compressed chunk texts, fetched by vector id after a query (see app/utils/chunk_store.py)
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", ".cache/chunks.sqlite3")
+
+# Per-URL fetch metadata for incremental re-crawls (see app/utils/crawl_state.py)
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", ".cache/crawl_state.sqlite3")
+
+# Link discovery when a site has no sitemap (see app/utils/discovery.py)
+DISCOVERY_CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", "16"))
+DISCOVERY_PER_HOST_CONCURRENCY = int(os.getenv("DISCOVERY_PER_HOST_CONCURRENCY", "4"))
+DISCOVERY_MAX_DEPTH = int(os.getenv("DISCOVERY_MAX_DEPTH", "5"))
+
+# Vector store backend: "pinecone" or "local" (see app/utils/vector_store.py)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE", "pinecone")
+if VECTOR_STORE_BACKEND not in ("pinecone", "local"):
+    raise ValueError(f"Unknown VECTOR_STORE backend: {VECTOR_STORE_BACKEND}")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", ".cache/vectors")
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")  # float32, float16 or int8
+LOCAL_VECTOR_ANN_THRESHOLD = int(os.getenv("LOCAL_VECTOR_ANN_THRESHOLD", "50000"))
+# Pinecone keeps each doc_id in its own namespace; also search and delete vectors from
+# before that by their doc_id filter in the default namespace.
+PINECONE_LEGACY_FILTER = os.getenv("PINECONE_LEGACY_FILTER", "true").lower() == "true"
+# A /chat request may search several doc_ids; their partitions are queried concurrently.
+MAX_CHAT_DOCS = int(os.getenv("MAX_CHAT_DOCS", "10"))
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "8"))  # partition queries at once, per process
+
+# In-memory /chat retrieval cache (see app/utils/retrieval_cache.py)
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "10000"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+
+# Semantic /chat answer cache, matched by query embedding (see app/utils/answer_cache.py)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+ANSWER_CACHE_MAX_PER_DOC = int(os.getenv("ANSWER_CACHE_MAX_PER_DOC", "200"))  # 0 disables the cache
+ANSWER_CACHE_MAX_DOCS = int(os.getenv("ANSWER_CACHE_MAX_DOCS", "100"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+# Exact + near-duplicate (SimHash) dedup of pages and chunks (see app/utils/dedup.py)
+DEDUP_PAGES = os.getenv("DEDUP_PAGES", "true").lower() == "true"
+DEDUP_CHUNKS = os.getenv("DEDUP_CHUNKS", "true").lower() == "true"
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))  # bits out of 64
+DEDUP_REDO_ROUNDS = int(os.getenv("DEDUP_REDO_ROUNDS", "3"))  # passes over duplicates of changed pages
 
-# Initialize Supabase client
-from supabase import create_client, Client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Page rendering: "http" fetches pages and converts the HTML to markdown without a
+# browser, "browser" always renders with headless Chromium, "auto" only uses the
+# browser for pages that look client-side rendered (see app/utils/scraper.py).
+RENDER_MODE = os.getenv("RENDER_MODE", "auto")
+RENDER_MODE_OVERRIDES = os.getenv("RENDER_MODE_OVERRIDES")  # "host=mode,...", parsed when a crawl starts
+# After this many pages of a host needed the browser, skip the HTTP attempt for the rest.
+JS_HOST_THRESHOLD = int(os.getenv("JS_HOST_THRESHOLD", "3"))
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+BROWSER_PAGES_PER_BROWSER = int(os.getenv("BROWSER_PAGES_PER_BROWSER", "4"))
+BROWSER_RECYCLE_AFTER = int(os.getenv("BROWSER_RECYCLE_AFTER", "1000"))
 
-# -------------- Pinecone Index Setup ----------------
+# Bulk import of zip/tar uploads of HTML/Markdown files (see app/utils/archive.py)
+ARCHIVE_MAX_PAGES = int(os.getenv("ARCHIVE_MAX_PAGES", "100000"))
+ARCHIVE_MAX_PENDING = int(os.getenv("ARCHIVE_MAX_PENDING", "64"))  # pages read ahead of the pipeline
+
+# Crawl progress: coalesced status writes and the progress stream (see app/utils/progress.py)
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "2.0"))
+PROGRESS_FLUSH_EVERY = int(os.getenv("PROGRESS_FLUSH_EVERY", "25"))  # URLs
+PROGRESS_STREAM_INTERVAL = float(os.getenv("PROGRESS_STREAM_INTERVAL", "1.0"))
+
+# Durable crawl job queue and worker pool (see app/utils/jobs.py and app/worker.py)
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite3")
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+MAX_JOBS_PER_TENANT = int(os.getenv("MAX_JOBS_PER_TENANT", "1"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_TIMEOUT = float(os.getenv("JOB_STALE_TIMEOUT", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # workers a job may crash before it fails
+
+# Stage metrics on /metrics and request / crawl job traces on /traces (see app/utils/metrics.py)
+TRACING = os.getenv("TRACING", "true").lower() == "true"
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "100"))  # finished traces kept per process
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))  # per trace; the rest only count in its summary
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", "10"))  # how often workers publish metrics
+
+# Create the OpenAI, Supabase and vector store clients in the background right after
+# API startup, instead of on the first request that needs them.
+PRELOAD_CLIENTS = os.getenv("PRELOAD_CLIENTS", "true").lower() == "true"
+
+# Shared keep-alive HTTP pools, one for crawling and one for OpenAI (see app/utils/http_pool.py)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_PER_HOST_CONNECTIONS = int(os.getenv("HTTP_PER_HOST_CONNECTIONS", "16"))  # all crawls in a process together
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP2 = os.getenv("HTTP2", "true").lower() == "true"  # only used when h2 is installed
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# Adaptive (AIMD) concurrency per crawled host and per OpenAI endpoint, between 1 and the
+# connection caps above, and the embedding token budget (see app/utils/adaptive.py)
+CRAWL_HOST_INITIAL_CONCURRENCY = int(os.getenv("CRAWL_HOST_INITIAL_CONCURRENCY", "4"))
+CRAWL_LATENCY_TOLERANCE = float(os.getenv("CRAWL_LATENCY_TOLERANCE", "3"))  # x average latency
+OPENAI_INITIAL_CONCURRENCY = int(os.getenv("OPENAI_INITIAL_CONCURRENCY", str(OPENAI_MAX_CONNECTIONS)))
+# The account's embedding tokens per minute (0 = no budget). Each worker process gets its share.
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+
+# --------------- Initialize Clients ----------------
 INDEX_NAME = "docs-index"
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=1536,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
+
+def count_retry(pool: str):
+    return lambda host, reason: HTTP_RETRIES_TOTAL.inc(pool=pool, reason=reason)
+
+def record_limit(name: str, limit: int):
+    CONCURRENCY_LIMIT.set(limit, limiter=name)
+
+def crawl_host_limiter(host: str) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        f"crawl:{host}",
+        initial=CRAWL_HOST_INITIAL_CONCURRENCY,
+        max_limit=HTTP_PER_HOST_CONNECTIONS,
+        latency_tolerance=CRAWL_LATENCY_TOLERANCE,
+        on_change=record_limit,
+    )
+
+def openai_endpoint(request) -> str:
+    # Embeddings and chat completions have separate rate limits.
+    return request.url.path.rsplit("/v1/", 1)[-1]
+
+def openai_limiter(endpoint: str) -> AdaptiveLimiter:
+    # Generation time depends on the answer, so only errors and rate limits count.
+    return AdaptiveLimiter(
+        f"openai:{endpoint}",
+        initial=OPENAI_INITIAL_CONCURRENCY,
+        max_limit=OPENAI_MAX_CONNECTIONS,
+        latency_tolerance=None,
+        on_change=record_limit,
     )
-pinecone_index = pc.Index(name=INDEX_NAME)
 
-# --------- FastAPI Setup + CORS Middleware -----------
-app = FastAPI()
+def observe_openai_response(request, response):
+    if request.url.path.endswith("/embeddings"):
+        embedding_budget.sync_headers(response.headers)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Adjust as needed for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+def create_http_client():
+    """Pool for everything the crawler fetches: sitemaps, robots.txt, discovery and pages."""
+    return http_pool.create_async_client(
+        limiter_factory=crawl_host_limiter,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        per_host=HTTP_PER_HOST_CONNECTIONS,
+        timeout=HTTP_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        retries=HTTP_RETRIES,
+        on_retry=count_retry("crawl"),
+        http2=HTTP2,
+        follow_redirects=True,
+        headers={"User-Agent": discovery.USER_AGENT},
+    )
+
+def create_async_openai_client():
+    from openai import AsyncOpenAI
+    # Embedding and chat requests have no side effects, so POSTs are retried on
+    # 429/5xx here too, and the SDK's own retries are turned off.
+    http_client = http_pool.create_async_client(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive=OPENAI_MAX_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        per_host=OPENAI_MAX_CONNECTIONS,
+        timeout=OPENAI_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        retries=HTTP_RETRIES,
+        retry_methods={"GET", "POST"},
+        on_retry=count_retry("openai"),
+        limiter_factory=openai_limiter,
+        limiter_key=openai_endpoint,
+        on_response=observe_openai_response,
+        http2=HTTP2,
+    )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+
+def create_supabase_client():
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def create_vector_store():
+    """The configured vector store. For Pinecone, this creates the index if it doesn't exist."""
+    if VECTOR_STORE_BACKEND == "pinecone":
+        from pinecone import Pinecone, ServerlessSpec
+        from app.utils.vector_store import PineconeVectorStore
+
+        pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
+        if INDEX_NAME not in pc.list_indexes().names():
+            pc.create_index(
+                name=INDEX_NAME,
+                dimension=1536,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+        return PineconeVectorStore(pc.Index(name=INDEX_NAME), legacy_filter=PINECONE_LEGACY_FILTER)
+    from app.utils.vector_store import LocalVectorStore
+    return LocalVectorStore(
+        LOCAL_VECTOR_DIR,
+        dim=1536,
+        dtype=LOCAL_VECTOR_DTYPE,
+        ann_threshold=LOCAL_VECTOR_ANN_THRESHOLD
+    )
+
+def preload_clients():
+    """
+    Create the shared clients and import the OpenAI SDK, e.g. in the background
+    at startup. The async OpenAI client itself is per event loop, so it is
+    still created on first use.
+    """
+    import openai  # noqa: F401
+    clients.preload("supabase", "vector_store")
+
+# Created on first use, see app/utils/clients.py. clients.async_openai and clients.http
+# (the crawler's HTTP pool) are one client per event loop, shared by all its crawls.
+clients = Clients(
+    {
+        "supabase": create_supabase_client,
+        "vector_store": create_vector_store,
+    },
+    loop_factories={"async_openai": create_async_openai_client, "http": create_http_client},
+)
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+chunk_store = ChunkStore(CHUNK_STORE_PATH)
+crawl_state_store = crawl_state.CrawlStateStore(CRAWL_STATE_PATH)
+retrieval_cache = RetrievalCache(max_entries=RETRIEVAL_CACHE_MAX_ENTRIES, ttl_seconds=RETRIEVAL_CACHE_TTL)
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries_per_doc=ANSWER_CACHE_MAX_PER_DOC,
+    max_docs=ANSWER_CACHE_MAX_DOCS,
+    ttl_seconds=ANSWER_CACHE_TTL
+)
+job_store = JobStore(JOB_STORE_PATH)
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY, thread_name_prefix="search")
+# Shared by every crawl in this process; synced with OpenAI's remaining-tokens header.
+embedding_budget = TokenBucket(EMBEDDING_TOKENS_PER_MINUTE / max(1, WORKER_PROCESSES))
+browser_pool = BrowserPool(
+    browsers=BROWSER_POOL_SIZE,
+    pages_per_browser=BROWSER_PAGES_PER_BROWSER,
+    recycle_after=BROWSER_RECYCLE_AFTER
+)
+
+# ---------------- Metrics ----------------
+metrics.REGISTRY.configure_tracing(TRACING, TRACE_HISTORY, TRACE_MAX_SPANS)
+DISCOVERED_URLS = metrics.REGISTRY.counter(
+    "docs_discovered_urls_total", "URLs found by discovery, by source (sitemap or bfs)."
+)
+PAGES_LOADED = metrics.REGISTRY.counter(
+    "docs_pages_loaded_total", "Pages loaded for crawling, by how (http, browser or archive)."
+)
+PAGE_FAILURES = metrics.REGISTRY.counter("docs_page_failures_total", "Pages that could not be crawled.")
+CHUNKS_PRODUCED = metrics.REGISTRY.counter("docs_chunks_total", "Chunks produced by the chunker.")
+DUPLICATES = metrics.REGISTRY.counter(
+    "docs_duplicates_total", "Pages and chunks not embedded because they duplicate another, by kind."
+)
+EMBEDDING_TEXTS = metrics.REGISTRY.counter(
+    "docs_embedding_texts_total", "Texts to embed, by embedding cache result (hit or miss)."
+)
+EMBEDDING_TOKENS = metrics.REGISTRY.counter("docs_embedding_tokens_total", "Tokens sent to the embeddings API.")
+EMBEDDING_BATCH = metrics.REGISTRY.histogram(
+    "docs_embedding_batch_size", "Texts per embeddings API request.", metrics.SIZE_BUCKETS
+)
+UPSERT_BATCH = metrics.REGISTRY.histogram(
+    "docs_upsert_batch_size", "Vectors per vector store upsert.", metrics.SIZE_BUCKETS
+)
+RETRIEVAL_LOOKUPS = metrics.REGISTRY.counter(
+    "docs_retrieval_cache_lookups_total", "/chat retrieval cache lookups, by result (hit or miss)."
+)
+ANSWER_CACHE_LOOKUPS = metrics.REGISTRY.counter(
+    "docs_answer_cache_lookups_total", "/chat semantic answer cache lookups, by result (hit or miss)."
+)
+ANSWER_CACHE_SAVED = metrics.REGISTRY.counter(
+    "docs_answer_cache_saved_seconds_total",
+    "Time cached answers took to produce originally, minus the time spent finding them."
+)
+GENERATION_TOKENS = metrics.REGISTRY.counter(
+    "docs_generation_tokens_total", "Chat completion tokens, by kind (prompt or completion)."
+)
+CONTEXT_TOKENS = metrics.REGISTRY.histogram(
+    "docs_chat_context_tokens", "Tokens of retrieved context packed into a /chat prompt.", metrics.SIZE_BUCKETS
+)
+CHAT_FIRST_TOKEN = metrics.REGISTRY.histogram(
+    "docs_chat_time_to_first_token_seconds", "Time from receiving a streamed /chat request to its first token."
+)
+JOBS = metrics.REGISTRY.gauge("docs_jobs", "Crawl jobs in the job store, by status.")
+CONCURRENCY_LIMIT = metrics.REGISTRY.gauge(
+    "docs_concurrency_limit", "Current adaptive concurrency limit, by limiter (crawl:<host> or openai:<endpoint>)."
+)
+RATE_LIMIT_WAIT = metrics.REGISTRY.counter(
+    "docs_rate_limit_wait_seconds_total", "Time spent waiting for a rate budget, by budget."
+)
+HTTP_RETRIES_TOTAL = metrics.REGISTRY.counter(
+    "docs_http_retries_total", "Retried outbound HTTP requests, by pool (crawl or openai) and reason."
 )
 
+# --------- API Router (the app itself is built in app/main.py) -----------
+router = APIRouter()
+
 # ---------------- Helper Functions ----------------
 
-def create_embedding(text: str) -> List[float]:
-    resp = openai_client.embeddings.create(input=text, model="text-embedding-ada-002")
-    return resp.data[0].embedding
-
-def split_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    """Splits the provided text into overlapping chunks by words."""
-    words = text.split()
-    chunks = []
-    start = 0
-    while start < len(words):
-        end = min(start + chunk_size, len(words))
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        start += (chunk_size - overlap)
-    return chunks
-
-def upsert_chunk(doc_id: str, url: str, chunk: str, chunk_index: int):
-    """
-    Create an embedding for a text chunk and upsert it to Pinecone.
-    The vector's id is a combination of the source URL and the chunk index.
-    """
-    embedding = create_embedding(chunk)
-    vector_id = f"{url}#{chunk_index}"
-    pinecone_index.upsert(
-        vectors=[
-            {
-                "id": vector_id,
-                "values": embedding,
-                "metadata": {
-                    "doc_id": doc_id,
-                    "source_url": url,
-                    "chunk_index": chunk_index,
-                    "text": chunk
-                }
-            }
-        ]
-    )
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+def _record_embedding_lookups(total: int, missing: int):
+    EMBEDDING_TEXTS.inc(total - missing, cache="hit")
+    EMBEDDING_TEXTS.inc(missing, cache="miss")
+    if missing:
+        EMBEDDING_BATCH.observe(missing)
 
-# --------- SITEMAP / MANIFEST Functions -----------
-def get_urls_from_sitemap_manifest(base_url: str) -> List[str]:
+def _record_embedding_usage(resp):
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        EMBEDDING_TOKENS.inc(usage.total_tokens)
+
+async def acreate_embeddings(texts: List[str]) -> List[List[float]]:
     """
-    Attempt to retrieve URLs from candidate files:
-    Try both domain-level and subpath-level sitemaps/JSON manifests.
-    Returns a deduplicated list of URLs.
+    Embed many texts with a single AsyncOpenAI request, so crawling never
+    blocks the event loop. Results keep the input order. Texts already in
+    the embedding cache are not sent to OpenAI.
     """
-    parsed = urlparse(base_url)
-    domain_root = f"{parsed.scheme}://{parsed.netloc}"
-    candidates = set()
+    embeddings = await asyncio.to_thread(embedding_cache.get_many, EMBEDDING_MODEL, texts)
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    _record_embedding_lookups(len(texts), len(missing))
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        count_tokens = get_token_counter()
+        estimate = sum(count_tokens(text) for text in missing_texts)
+        waited = await embedding_budget.acquire(estimate)
+        if waited:
+            RATE_LIMIT_WAIT.inc(waited, budget="embedding_tokens")
+        with metrics.stage("embed", texts=len(missing_texts)):
+            resp = await clients.async_openai.embeddings.create(input=missing_texts, model=EMBEDDING_MODEL)
+        _record_embedding_usage(resp)
+        if getattr(resp, "usage", None) is not None:
+            embedding_budget.settle(estimate, resp.usage.total_tokens)
+        fresh = [item.embedding for item in sorted(resp.data, key=lambda item: item.index)]
+        await asyncio.to_thread(embedding_cache.put_many, EMBEDDING_MODEL, missing_texts, fresh)
+        for i, emb in zip(missing, fresh):
+            embeddings[i] = emb
+    return embeddings
 
-    # Domain-level candidates.
-    candidates.add(urljoin(domain_root, '/sitemap.xml'))
-    candidates.add(urljoin(domain_root, '/manifest.json'))
-    candidates.add(urljoin(domain_root, '/index.json'))
+def chunk_text(text: str) -> List[dict]:
+    """
+    Split a page's markdown into token-budgeted chunks that follow its heading
+    and code-fence structure (see app/utils/chunker.py).
+    """
+    return list(chunk_markdown(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS))
 
-    # If the base URL has a subpath (e.g. /docs), also check subpath.
-    if parsed.path and parsed.path != "/":
-        subpath = parsed.path.rstrip("/")
-        candidates.add(urljoin(domain_root, subpath + "/sitemap.xml"))
-        candidates.add(urljoin(domain_root, subpath + "/manifest.json"))
-        candidates.add(urljoin(domain_root, subpath + "/index.json"))
+# The only metadata kept on vectors; the chunk text and the rest go to the chunk store.
+VECTOR_METADATA_FIELDS = ("doc_id", "source_url", "chunk_index")
 
-    all_urls = []
-    for candidate in candidates:
-        try:
-            response = requests.get(candidate, timeout=10)
-            response.raise_for_status()
-            candidate_urls = []
-            if candidate.endswith('.xml'):
-                # Parse XML sitemap
-                from xml.etree import ElementTree
-                root = ElementTree.fromstring(response.content)
-                namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-                loc_tags = root.findall('.//ns:loc', namespace)
-                if not loc_tags:
-                    loc_tags = root.findall('.//loc')
-                candidate_urls = [loc.text.strip() for loc in loc_tags if loc.text]
-            else:
-                # Assume JSON format
-                data = response.json()
-                if isinstance(data, list):
-                    candidate_urls = [u for u in data if isinstance(u, str)]
-                elif isinstance(data, dict):
-                    for key in ['urls', 'sitemap', 'entries']:
-                        if key in data and isinstance(data[key], list):
-                            candidate_urls = [u for u in data[key] if isinstance(u, str)]
-                            break
-            if candidate_urls:
-                print(f"[INFO] Found {len(candidate_urls)} URLs from {candidate}")
-                all_urls.extend(candidate_urls)
-        except Exception as e:
-            print(f"[INFO] Could not fetch from {candidate}: {e}")
+def upsert_vectors(vectors: List[dict]):
+    """
+    Upsert a batch of vectors to the vector store in a single request. Chunk
+    texts (and headings / offsets) are written to the chunk store first, so a
+    vector never points at a missing text.
+    """
+    UPSERT_BATCH.observe(len(vectors))
+    with metrics.stage("chunk_store_write", chunks=len(vectors)):
+        chunk_store.put_many([{"id": v["id"], **v["metadata"]} for v in vectors])
+    slim = [
+        {
+            "id": v["id"],
+            "values": v["values"],
+            "metadata": {key: v["metadata"][key] for key in VECTOR_METADATA_FIELDS},
+        }
+        for v in vectors
+    ]
+    with metrics.stage("upsert", vectors=len(vectors)):
+        clients.vector_store.upsert(slim)
 
-    unique_urls = list(set(all_urls))
-    return unique_urls
+def delete_vectors(doc_id: str, ids: List[str]):
+    """Delete vectors of doc_id by id, and their chunk texts."""
+    with metrics.stage("delete_vectors", vectors=len(ids)):
+        clients.vector_store.delete(doc_id, ids)
+        chunk_store.delete(doc_id, ids)
 
-# --------- BFS Fallback -----------
-def get_relevant_urls(base_url: str, max_urls: int = 500) -> List[str]:
+async def delete_pages(doc_id: str, urls: List[str], known_pages: Dict[str, dict]) -> int:
     """
-    1. Attempt to retrieve URLs from known sitemap/manifest locations (domain + subpath).
-    2. If none found, fall back to a BFS approach scanning the base URL.
+    Delete the vectors and crawl state of pages of doc_id that are gone, and
+    forget them (and their duplicates, which have no vectors of their own and
+    must be embedded as new pages) in known_pages. Returns the vectors deleted.
     """
-    candidate_urls = get_urls_from_sitemap_manifest(base_url)
-    if candidate_urls:
-        candidate_urls = list(set(candidate_urls))
-        if len(candidate_urls) > max_urls:
-            candidate_urls = candidate_urls[:max_urls]
-        print(f"[INFO] Using {len(candidate_urls)} URLs from sitemap/manifest.")
-        return candidate_urls
+    stale_ids = [
+        f"{url}#{idx}" for url in urls for idx in range(known_pages[url]["chunk_count"] or 0)
+    ]
+    await asyncio.to_thread(delete_vectors, doc_id, stale_ids)
+    await asyncio.to_thread(crawl_state_store.delete_pages, doc_id, urls)
+    print(f"[INFO] Removed {len(urls)} pages ({len(stale_ids)} vectors) no longer in the site.")
+    removed = set(urls)
+    for url, record in list(known_pages.items()):
+        if url in removed or record["canonical_url"] in removed:
+            del known_pages[url]
+    return len(stale_ids)
 
-    parsed = urlparse(base_url)
-    base_path = parsed.path.rstrip("/")
-    visited = set()
-    relevant_urls = set()
-    queue = [base_url]
+# --------- URL Discovery (sitemap / manifest, then BFS) -----------
+async def iter_relevant_urls(
+    base_url: str,
+    max_urls: int = 500,
+    lastmods: Optional[Dict[str, Optional[str]]] = None,
+    status: Optional[dict] = None
+) -> AsyncIterator[str]:
+    """
+    1. Attempt to retrieve URLs from known sitemap/manifest locations (domain + subpath,
+       robots.txt Sitemap: entries and sitemap index children, see app/utils/sitemap.py).
+    2. If none found, fall back to a concurrent BFS over the base URL (app/utils/discovery.py).
+    URLs are yielded as they are found, so crawling can start before discovery ends.
+    If a dict is passed as lastmods, it is filled with each sitemap URL's <lastmod>.
+    If a dict is passed as status, status["complete"] is set once discovery ends:
+    True only if it found every page, without hitting max_urls or a fetch error,
+    so pages that didn't come up are really gone.
+    """
+    sitemap_status: dict = {}
+    if status is not None:
+        status["complete"] = False
+    with metrics.stage("sitemap"):
+        entries = await sitemap.get_sitemap_entries(
+            base_url, max_urls=max_urls, client=clients.http, status=sitemap_status
+        )
+    if lastmods is not None:
+        lastmods.update(entries)
+    if entries:
+        candidate_urls = list(entries)[:max_urls]
+        print(f"[INFO] Using {len(candidate_urls)} URLs from sitemap/manifest.")
+        DISCOVERED_URLS.inc(len(candidate_urls), source="sitemap")
+        for url in candidate_urls:
+            yield url
+        if status is not None:
+            status["complete"] = sitemap_status["complete"]
+        return
 
-    while queue and len(relevant_urls) < max_urls:
-        current_url = queue.pop(0)
-        if current_url in visited:
-            continue
-        visited.add(current_url)
-        try:
-            response = requests.get(current_url, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            for link in soup.find_all("a", href=True):
-                href = link["href"]
-                absolute_url = urljoin(current_url, href)
-                parsed_abs = urlparse(absolute_url)
-                if parsed_abs.netloc == parsed.netloc and parsed_abs.path.startswith(base_path):
-                    if absolute_url not in visited:
-                        queue.append(absolute_url)
-                        relevant_urls.add(absolute_url)
-                        if len(relevant_urls) >= max_urls:
-                            break
-        except Exception as e:
-            print(f"[ERROR] Error fetching {current_url}: {e}")
+    # A span can't stay open across yields, so the BFS is recorded once it ends.
+    start = time.perf_counter()
+    found = 0
+    bfs_status: dict = {}
+    async for url in discovery.iter_relevant_urls(
+        base_url,
+        max_urls=max_urls,
+        max_depth=DISCOVERY_MAX_DEPTH,
+        concurrency=DISCOVERY_CONCURRENCY,
+        per_host_concurrency=DISCOVERY_PER_HOST_CONCURRENCY,
+        client=clients.http,
+        status=bfs_status,
+    ):
+        found += 1
+        DISCOVERED_URLS.inc(source="bfs")
+        yield url
+    metrics.record_stage("discovery_bfs", start, urls=found)
+    print(f"[INFO] Found {found} relevant URLs via BFS.")
+    if status is not None:
+        # A sitemap that failed may have listed pages the BFS can't reach.
+        status["complete"] = sitemap_status["complete"] and bfs_status["complete"]
 
-    print(f"[INFO] Found {len(relevant_urls)} relevant URLs via BFS.")
-    return list(relevant_urls)
+async def get_relevant_urls(
+    base_url: str,
+    max_urls: int = 500,
+    lastmods: Optional[Dict[str, Optional[str]]] = None,
+    status: Optional[dict] = None
+) -> List[str]:
+    """Collect the output of iter_relevant_urls into a list."""
+    return [
+        url async for url in iter_relevant_urls(base_url, max_urls=max_urls, lastmods=lastmods, status=status)
+    ]
 
 # --------- Document Status Updates in the documents table -----------
 def create_document(doc_id: str, base_url: str, user_id: str):
@@ -226,190 +543,981 @@ def create_document(doc_id: str, base_url: str, user_id: str):
         "processed_urls": 0,
         "failed_urls": 0
     }
-    supabase.table("documents").insert(data).execute()
+    clients.supabase.table("documents").insert(data).execute()
 
-def initialize_document_status(doc_id: str, total_urls: int):
+def write_document_progress(snapshot: dict):
     """
-    Update the document row with initial status values.
+    Flush a ProgressReporter snapshot: the totals go to the document row, the
+    full snapshot (stage counts, recent failures) to the job store, where the
+    progress stream picks it up.
     """
     data = {
-        "status": "in_progress",
-        "total_urls": total_urls,
-        "processed_urls": 0,
-        "failed_urls": 0
+        "status": snapshot["status"],
+        "total_urls": snapshot["total_urls"],
+        "processed_urls": snapshot["processed_urls"],
+        "failed_urls": snapshot["failed_urls"]
     }
-    supabase.table("documents").update(data).eq("id", doc_id).execute()
+    with metrics.stage("status_write"):
+        clients.supabase.table("documents").update(data).eq("id", snapshot["doc_id"]).execute()
+        job_store.save_progress(snapshot["doc_id"], snapshot)
 
-def update_document_status(doc_id: str, processed: int, failed: int):
-    data = {
-        "processed_urls": processed,
-        "failed_urls": failed
-    }
-    supabase.table("documents").update(data).eq("id", doc_id).execute()
+def finish_document_status(doc_id: str, status: str = "completed"):
+    data = {"status": status}
+    with metrics.stage("status_write"):
+        clients.supabase.table("documents").update(data).eq("id", doc_id).execute()
+        snapshot = job_store.get_progress(doc_id) or {"doc_id": doc_id}
+        job_store.save_progress(doc_id, {**snapshot, "status": status})
 
-def finish_document_status(doc_id: str):
-    data = {"status": "completed"}
-    supabase.table("documents").update(data).eq("id", doc_id).execute()
+def delete_document(doc_id: str):
+    """
+    Delete a document and everything stored for it: its vector partition
+    (one call, however big the index is), chunk texts, crawl state, cached
+    results and answers, and its row in the documents table.
+    """
+    with metrics.stage("delete_document", doc_id=doc_id):
+        clients.vector_store.delete_doc(doc_id)
+        chunk_store.delete_doc(doc_id)
+        crawl_state_store.delete_doc(doc_id)
+        retrieval_cache.invalidate_doc(doc_id)
+        answer_cache.invalidate_doc(doc_id)
+        clients.supabase.table("documents").delete().eq("id", doc_id).execute()
+    print(f"[INFO] Deleted doc_id {doc_id}.")
 
 # --------- Parallel Scraping + Embedding -----------
-async def scrape_and_embed_docs_parallel(urls: List[str], doc_id: str, max_concurrent: int = 5):
+async def scrape_and_embed_docs_parallel(
+    urls: Union[List[str], AsyncIterator[str]],
+    doc_id: str,
+    max_concurrent: int = FETCH_CONCURRENCY,
+    incremental: bool = False,
+    lastmods: Optional[Dict[str, Optional[str]]] = None,
+    completed_urls: Optional[Set[str]] = None,
+    on_url_done: Optional[Callable[[str, bool], None]] = None,
+    cancelled: Optional[asyncio.Event] = None,
+    render_mode: Optional[str] = None,
+    page_source: Optional[Callable[[str], Awaitable[Optional[dict]]]] = None,
+    max_pending: Optional[int] = None,
+    delete_unseen: Optional[Callable[[], bool]] = None
+):
     """
     Crawl multiple URLs in parallel (with a concurrency limit).
-    For each URL, scrape the page via crawl4ai, split the text into chunks,
-    create embeddings, and upsert them to Pinecone.
-    Update the document status as progress is made.
+    For each URL, fetch the page and split its markdown into chunks.
+    Chunks from every page are fed into the ingestion pipeline, which embeds
+    and upserts them in batches.
+    Progress is kept in a ProgressReporter and written out in batches.
+
+    Pages are fetched over plain HTTP and converted to markdown on the chunk
+    thread pool. Only pages that need JavaScript (or every page, depending on
+    render_mode, RENDER_MODE and RENDER_MODE_OVERRIDES) are rendered in the
+    shared browser pool, whose browsers stay up across crawls.
+
+    Every stage has its own limit: at most max_concurrent pages are fetched at
+    once, and fewer from a host whose adaptive limit in the shared HTTP pool is
+    lower (it shrinks when the host slows down or throttles us), the browser pool has a fixed number of tabs, chunking runs on a small thread pool,
+    and the pipeline runs EMBED_CONCURRENCY / UPSERT_CONCURRENCY workers. A page
+    releases its fetch slot as soon as its markdown is ready, so fetching the
+    next page overlaps with chunking, embedding and upserting the previous ones.
+
+    With incremental=True, pages whose sitemap <lastmod> is unchanged, or that
+    answer a conditional GET with 304, are skipped without being crawled, and
+    pages whose extracted markdown hashes the same are not re-embedded.
+    In both modes, vectors of pages that disappeared from urls (see
+    delete_unseen below), and trailing chunks of pages that shrank, are deleted.
+
+    urls may also be an async iterator (e.g. iter_relevant_urls), in which case
+    pages are crawled while discovery is still running. The full URL set is
+    only known once it is exhausted, so disappeared pages are detected then.
+
+    Pages and chunks whose text duplicates (exactly or nearly) one seen
+    earlier are not embedded: duplicate pages are recorded with the URL of
+    their canonical page, duplicate chunks as aliases of the canonical vector.
+    Once a canonical page changes or is deleted, pages that duplicate it (or
+    have chunks aliased to its chunks) are processed again at the end of the
+    run, even if they didn't change themselves, since their content is no
+    longer in the index.
+
+    Resuming: URLs in completed_urls are counted as processed without being
+    touched, and on_url_done(url, ok) is called once all chunks of a crawled
+    URL have been upserted (the job worker checkpoints them). Once cancelled
+    is set, URLs that have not started yet are skipped.
+
+    With page_source, pages are not fetched: page_source(url) returns the
+    page as a fetch_page-style dict (its text None if it was too large) and
+    only the markdown conversion and later stages run, e.g. for an uploaded
+    archive (see ingest_archive). max_pending caps how many streamed URLs are
+    in flight, so a fast source waits for the pipeline instead of piling up.
+    delete_unseen() is asked whether known pages that are not in urls are gone
+    and should be deleted, e.g. not if discovery was cut short: right away for
+    a list, once a streamed source is exhausted. Without it a list is taken as
+    the whole site and a streamed source is never used to delete pages.
     """
-    print(f"[INFO] Found {len(urls)} URLs to crawl.")
-    total_urls = len(urls)
+    from app.utils import scraper
 
-    await asyncio.to_thread(initialize_document_status, doc_id, total_urls)
+    streaming = not isinstance(urls, list)
+    total_urls = 0 if streaming else len(urls)
+    if not streaming:
+        print(f"[INFO] Found {total_urls} URLs to crawl.")
+    if lastmods is None:
+        lastmods = {}
+    if completed_urls is None:
+        completed_urls = set()
 
-    browser_config = BrowserConfig(
-        headless=True,
-        extra_args=["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"]
+    progress = ProgressReporter(
+        doc_id,
+        write_document_progress,
+        flush_interval=PROGRESS_FLUSH_INTERVAL,
+        flush_every=PROGRESS_FLUSH_EVERY
     )
-    prune_filter = PruningContentFilter(threshold=0.25, threshold_type="dynamic")
-    crawl_config = CrawlerRunConfig(
-        markdown_generator=DefaultMarkdownGenerator(
-            content_filter=prune_filter,
-            options={"ignore_images": True}
-        ),
-        cache_mode=CacheMode.BYPASS
+    progress.set_total(total_urls, final=not streaming)
+    await progress.start()
+    retrieval_cache.invalidate_doc(doc_id)
+    answer_cache.invalidate_doc(doc_id)
+
+    known_pages = await asyncio.to_thread(crawl_state_store.get_pages, doc_id)
+    # The pages each page's dedup outcome was decided against, {url: {page: decided at}},
+    # and when pages changed in this run, both in Deduplicator.checked_at() time; 0 stands
+    # for a decision of an earlier run, infinity for pages deleted or changed without dedup.
+    dedup_deps: Dict[str, Dict[str, float]] = {}
+    changed_at: Dict[str, float] = {}
+    for url, record in known_pages.items():
+        if record["canonical_url"]:
+            dedup_deps.setdefault(url, {})[record["canonical_url"]] = 0
+    chunk_aliases = await asyncio.to_thread(crawl_state_store.get_chunk_aliases, doc_id)
+    for alias_id, canonical_id in chunk_aliases.items():
+        url, canonical_page = alias_id.rsplit("#", 1)[0], canonical_id.rsplit("#", 1)[0]
+        if canonical_page != url:
+            dedup_deps.setdefault(url, {})[canonical_page] = 0
+    # Text of unchanged pages that may have to be processed again, so it isn't fetched twice.
+    held_pages: Dict[str, Tuple[str, Optional[dict]]] = {}
+
+    # Drop vectors and state for pages that are no longer part of the site.
+    url_set = set() if streaming else set(urls)
+    removed = []
+    if not streaming and (delete_unseen is None or delete_unseen()):
+        removed = [url for url in known_pages if url not in url_set]
+    elif not streaming:
+        print(f"[INFO] Discovery was incomplete, keeping pages of doc_id {doc_id} that were not found.")
+    if removed:
+        await delete_pages(doc_id, removed, known_pages)
+        changed_at.update((url, float("inf")) for url in removed)
+
+    deduplicator = Deduplicator(max_distance=DEDUP_MAX_DISTANCE, chunks=DEDUP_CHUNKS) if DEDUP_PAGES else None
+    if deduplicator is not None and page_source is None:
+        # Pages kept from earlier runs stay canonical for their content. Not with
+        # a page_source: whether such a page is still there is only known at the end.
+        for url, record in known_pages.items():
+            if record["canonical_url"] is None and record["dedup_hash"]:
+                simhash = int(record["simhash"], 16) if record["simhash"] else None
+                deduplicator.seed_page(url, record["dedup_hash"], simhash)
+
+    pipeline = IngestionPipeline(
+        embed_fn=acreate_embeddings,
+        upsert_fn=upsert_vectors,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        upsert_batch_size=UPSERT_BATCH_SIZE,
+        flush_interval=PIPELINE_FLUSH_INTERVAL,
+        queue_size=PIPELINE_QUEUE_SIZE,
+        embed_concurrency=EMBED_CONCURRENCY,
+        upsert_concurrency=UPSERT_CONCURRENCY,
+        on_url_done=on_url_done,
     )
+    progress.track("pipeline", pipeline.stats)
+    if deduplicator is not None:
+        progress.track("dedup", deduplicator.stats)
+    await pipeline.start()
+    chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY, thread_name_prefix="chunk")
+    loop = asyncio.get_running_loop()
 
-    crawler = AsyncWebCrawler(config=browser_config)
-    await crawler.start()
+    http_client = clients.http
     semaphore = asyncio.Semaphore(max_concurrent)
+    pending = asyncio.Semaphore(max_pending) if streaming and max_pending else None
 
-    processed_urls = 0
     failures = []
+    js_hosts: Dict[str, int] = {}
+    render_overrides = scraper.parse_render_overrides(RENDER_MODE_OVERRIDES)
+
+    def validators(url: str, record: Optional[dict]) -> dict:
+        """The record's etag / last_modified to revalidate url with, if it may be unchanged."""
+        if not incremental or record is None or page_source is not None or lastmods.get(url):
+            # A sitemap lastmod that differs from the stored one already says the page changed.
+            return {}
+        return {"etag": record["etag"], "last_modified": record["last_modified"]}
+
+    async def load_page(url: str, record: Optional[dict]) -> Tuple[Optional[str], Optional[dict], Optional[str]]:
+        """
+        Return (markdown, response headers, error) for url, avoiding the browser
+        when possible. Neither markdown nor error means the server answered 304
+        Not Modified to the stored validators.
+        """
+        if page_source is not None:
+            page = await page_source(url)
+            if page is None or page["text"] is None:
+                return None, None, f"larger than {scraper.MAX_PAGE_BYTES} bytes"
+            with metrics.stage("markdown"):
+                text, _ = await loop.run_in_executor(chunk_executor, scraper.extract_markdown, page)
+            progress.incr(f"loaded_{page.get('via', 'source')}")
+            PAGES_LOADED.inc(via=page.get("via", "source"))
+            return text, page["headers"], None
+        mode = render_mode or scraper.render_mode_for(url, RENDER_MODE, render_overrides)
+        host = urlparse(url).hostname or ""
+        if mode == "auto" and js_hosts.get(host, 0) >= JS_HOST_THRESHOLD:
+            mode = "browser"
+        conditional = validators(url, record)
+        if mode == "browser" and any(conditional.values()):
+            # The browser can't revalidate, so ask the server before rendering.
+            async with semaphore:
+                with metrics.stage("revalidate"):
+                    modified = await crawl_state.is_modified(http_client, url, **conditional)
+            if not modified:
+                return None, None, None
+        if mode != "browser":
+            async with semaphore:
+                with metrics.stage("fetch"):
+                    page = await scraper.fetch_page(http_client, url, **conditional)
+            if page["status"] == 304:
+                return None, page["headers"], None
+            if 200 <= page["status"] < 300:
+                with metrics.stage("markdown"):
+                    text, needs_browser = await loop.run_in_executor(
+                        chunk_executor, scraper.extract_markdown, page
+                    )
+                if mode == "http" or not needs_browser:
+                    progress.incr("fetched_http")
+                    PAGES_LOADED.inc(via="http")
+                    return text, page["headers"], None
+                js_hosts[host] = js_hosts.get(host, 0) + 1
+                print(f"[INFO] {url} looks client-side rendered, using the browser.")
+            elif mode == "http" or page["status"] in (404, 410):
+                return None, None, f"HTTP {page['status']}"
+        with metrics.stage("render"):
+            result = await browser_pool.render(url)
+        if not result.success:
+            return None, None, result.error_message
+        progress.incr("rendered_browser")
+        PAGES_LOADED.inc(via="browser")
+        return result.markdown_v2.fit_markdown, getattr(result, "response_headers", None), None
 
     async def process_url(url: str):
-        nonlocal processed_urls
-        async with semaphore:
-            try:
-                result = await crawler.arun(url=url, config=crawl_config)
-                if result.success:
-                    text = result.markdown_v2.fit_markdown
-                    chunks = split_text(text)
-                    print(f"[INFO] {url} produced {len(chunks)} chunks.")
-                    for idx, chunk in enumerate(chunks):
-                        upsert_chunk(doc_id, url, chunk, idx)
-                    processed_urls += 1
-                    print(f"[INFO] Successfully crawled: {url} ({processed_urls}/{total_urls})")
+        # One span per page, so the job trace shows each page's stages together.
+        try:
+            with metrics.stage("page", url=url):
+                await crawl_url(url)
+        finally:
+            if pending is not None:
+                pending.release()
+
+    async def skip_unchanged(url: str):
+        progress.url_processed(skipped=True)
+        if lastmods.get(url):
+            await asyncio.to_thread(crawl_state_store.save_page, doc_id, url, lastmod=lastmods[url])
+        await pipeline.seal(url)
+
+    def set_dedup_deps(url: str, deps: Dict[str, float]):
+        if deps:
+            dedup_deps[url] = deps
+        else:
+            dedup_deps.pop(url, None)
+
+    async def crawl_url(url: str, redo: bool = False):
+        if url in completed_urls and not redo:
+            # Finished by an earlier, interrupted run of the same job.
+            progress.url_processed(skipped=True)
+            return
+        if cancelled is not None and cancelled.is_set():
+            return
+        record = known_pages.get(url)
+        try:
+            lastmod = lastmods.get(url)
+            if incremental and record is not None and page_source is None and lastmod and lastmod == record["lastmod"]:
+                await skip_unchanged(url)
+            else:
+                if url in held_pages:
+                    (text, headers), error = held_pages.pop(url), None
                 else:
-                    print(f"[ERROR] Failed: {url} - {result.error_message}")
-                    failures.append({"url": url, "error": result.error_message})
-            except Exception as e:
-                print(f"[ERROR] Exception while processing {url}: {e}")
-                failures.append({"url": url, "error": str(e)})
-            await asyncio.to_thread(update_document_status, doc_id, processed_urls, len(failures))
+                    text, headers, error = await load_page(url, record)
+                if text is None and error is None:
+                    await skip_unchanged(url)
+                elif text is not None:
+                    page_hash = crawl_state.content_hash(text)
+                    page_state = {
+                        "lastmod": lastmods.get(url),
+                        "etag": crawl_state.header_value(headers, "etag"),
+                        "last_modified": crawl_state.header_value(headers, "last-modified"),
+                        "content_hash": page_hash,
+                    }
+                    unchanged = incremental and record is not None and record["content_hash"] == page_hash
+                    canonical_url = None
+                    if not unchanged and deduplicator is not None:
+                        with metrics.stage("dedup"):
+                            canonical_url, dedup_hash, simhash = await loop.run_in_executor(
+                                chunk_executor, deduplicator.check_page, url, text
+                            )
+                        page_state["dedup_hash"] = dedup_hash
+                        page_state["simhash"] = format(simhash, "016x") if simhash is not None else None
+                    if not unchanged:
+                        # Pages decided against this one's earlier content are stale from here on.
+                        changed_at[url] = deduplicator.checked_at(url) if deduplicator is not None else float("inf")
+                    previous_count = record["chunk_count"] if record else 0
+                    if unchanged:
+                        print(f"[INFO] Unchanged content, not re-embedding: {url}")
+                        if url in dedup_deps:
+                            held_pages[url] = (text, headers)
+                    elif canonical_url is not None:
+                        print(f"[INFO] Duplicate of {canonical_url}, not embedding: {url}")
+                        progress.incr("duplicate_pages")
+                        DUPLICATES.inc(kind="page")
+                        if previous_count:
+                            await asyncio.to_thread(
+                                delete_vectors, doc_id, [f"{url}#{idx}" for idx in range(previous_count)]
+                            )
+                        await asyncio.to_thread(crawl_state_store.set_chunk_aliases, doc_id, url, {})
+                        set_dedup_deps(url, {canonical_url: changed_at[url]})
+                        page_state["canonical_url"] = canonical_url
+                        page_state["chunk_count"] = 0
+                    else:
+                        with metrics.stage("chunk"):
+                            chunks = await loop.run_in_executor(chunk_executor, chunk_text, text)
+                        print(f"[INFO] {url} produced {len(chunks)} chunks.")
+                        progress.incr("chunked")
+                        CHUNKS_PRODUCED.inc(len(chunks))
+                        ids = [f"{url}#{idx}" for idx in range(len(chunks))]
+                        aliases = {}
+                        if deduplicator is not None:
+                            with metrics.stage("dedup"):
+                                aliases = await loop.run_in_executor(
+                                    chunk_executor, deduplicator.check_chunks, ids, [chunk["text"] for chunk in chunks], url
+                                )
+                        canonical_pages = {canonical_id.rsplit("#", 1)[0] for canonical_id in aliases.values()} - {url}
+                        set_dedup_deps(url, {page: deduplicator.checked_at(url) for page in canonical_pages})
+                        for idx, chunk in enumerate(chunks):
+                            if ids[idx] not in aliases:
+                                await pipeline.put(
+                                    doc_id, url, idx, chunk["text"],
+                                    heading=chunk["heading"], start=chunk["start"], end=chunk["end"]
+                                )
+                        if aliases:
+                            progress.incr("duplicate_chunks", len(aliases))
+                            DUPLICATES.inc(len(aliases), kind="chunk")
+                        await asyncio.to_thread(crawl_state_store.set_chunk_aliases, doc_id, url, aliases)
+                        # Trailing chunks of a page that shrank, and chunks that are now aliases.
+                        stale_ids = [f"{url}#{idx}" for idx in range(len(chunks), previous_count)]
+                        stale_ids += [ids[idx] for idx in range(min(len(chunks), previous_count)) if ids[idx] in aliases]
+                        if stale_ids:
+                            await asyncio.to_thread(delete_vectors, doc_id, stale_ids)
+                        page_state["canonical_url"] = None
+                        page_state["chunk_count"] = len(chunks)
+                    await asyncio.to_thread(crawl_state_store.save_page, doc_id, url, **page_state)
+                    await pipeline.seal(url)
+                    progress.url_processed(skipped=unchanged)
+                    print(f"[INFO] Successfully crawled: {url} ({progress.processed_urls}/{progress.total_urls})")
+                else:
+                    print(f"[ERROR] Failed: {url} - {error}")
+                    failures.append({"url": url, "error": error})
+                    progress.url_failed(url, error)
+                    PAGE_FAILURES.inc()
+        except Exception as e:
+            print(f"[ERROR] Exception while processing {url}: {e}")
+            failures.append({"url": url, "error": str(e)})
+            progress.url_failed(url, str(e))
+            PAGE_FAILURES.inc()
 
-    await asyncio.gather(*(process_url(url) for url in urls))
-    await crawler.close()
+    if streaming:
+        tasks = []
+        async for url in urls:
+            if cancelled is not None and cancelled.is_set():
+                break
+            url_set.add(url)
+            total_urls += 1
+            progress.set_total(total_urls, final=False)
+            if pending is not None:
+                await pending.acquire()
+            tasks.append(asyncio.create_task(process_url(url)))
+        print(f"[INFO] Discovery finished with {total_urls} URLs to crawl.")
+        progress.set_total(total_urls)
+        await asyncio.gather(*tasks)
+        if delete_unseen is not None and delete_unseen():
+            removed = [url for url in known_pages if url not in url_set]
+            if removed:
+                await delete_pages(doc_id, removed, known_pages)
+                changed_at.update((url, float("inf")) for url in removed)
+    else:
+        await asyncio.gather(*(process_url(url) for url in urls))
+
+    async def redo_url(url: str):
+        with metrics.stage("page", url=url):
+            await crawl_url(url, redo=True)
+
+    # Duplicates decided against pages that changed since: their content is not in the index.
+    for _ in range(DEDUP_REDO_ROUNDS):
+        if cancelled is not None and cancelled.is_set():
+            break
+        stale = [
+            url for url, deps in dedup_deps.items()
+            if any(changed_at.get(page, 0) > decided for page, decided in deps.items())
+        ]
+        if not stale:
+            break
+        current_pages = await asyncio.to_thread(crawl_state_store.get_pages, doc_id)
+        stale = [url for url in stale if url in current_pages]
+        reset = {"lastmod": None, "etag": None, "last_modified": None, "content_hash": None}
+        for url in stale:
+            # Saved first, so the next run still processes url if this one stops early.
+            await asyncio.to_thread(crawl_state_store.save_page, doc_id, url, **reset)
+            known_pages[url] = {**current_pages[url], **reset}
+            del dedup_deps[url]
+        if page_source is not None:
+            # Only pages kept in held_pages can be read again.
+            stale = [url for url in stale if url in held_pages]
+        print(f"[INFO] Processing {len(stale)} pages again, the pages they duplicated changed.")
+        progress.incr("dedup_redone", len(stale))
+        total_urls += len(stale)
+        progress.set_total(total_urls)
+        await asyncio.gather(*(redo_url(url) for url in stale))
+    held_pages.clear()
+    chunk_executor.shutdown(wait=False)
+    pipeline_stats = await pipeline.close()
+    failed_embed_urls = sorted({url for f in pipeline.failures for url in f["urls"]})
+    failures.extend(
+        {"url": url, "error": f"embed/upsert failed: {f['error']}"}
+        for f in pipeline.failures for url in f["urls"]
+    )
+    if failed_embed_urls:
+        # Forget these pages so the next incremental refresh crawls them again.
+        await asyncio.to_thread(crawl_state_store.delete_pages, doc_id, failed_embed_urls)
+
+    rendered = {"http": progress.stages.get("fetched_http", 0), "browser": progress.stages.get("rendered_browser", 0)}
+    print(
+        f"[INFO] Completed crawling {progress.processed_urls} out of {total_urls} URLs "
+        f"({progress.skipped_urls} unchanged, {rendered['http']} over HTTP, {rendered['browser']} in the browser)."
+    )
+    # Results and answers cached while the crawl was running may miss the new chunks.
+    retrieval_cache.invalidate_doc(doc_id)
+    answer_cache.invalidate_doc(doc_id)
+    # A stopped crawl stays in_progress; the worker records why it stopped.
+    await progress.close(None if cancelled is not None and cancelled.is_set() else "completed")
+    print(f"[INFO] Wrote progress for doc_id {doc_id} {progress.writes} times.")
 
-    print(f"[INFO] Completed crawling {processed_urls} out of {total_urls} URLs.")
-    await asyncio.to_thread(finish_document_status, doc_id)
+    return {
+        "processed": progress.processed_urls,
+        "skipped": progress.skipped_urls,
+        "removed": len(removed),
+        "failed": failures,
+        "rendered": rendered,
+        "dedup": deduplicator.stats() if deduplicator is not None else None,
+        "pipeline": pipeline_stats
+    }
 
-    return {"processed": processed_urls, "failed": failures}
+async def crawl_document(
+    doc_id: str,
+    base_url: str,
+    incremental: bool = False,
+    stream_discovery: bool = False,
+    completed_urls: Optional[Set[str]] = None,
+    on_url_done: Optional[Callable[[str, bool], None]] = None,
+    cancelled: Optional[asyncio.Event] = None,
+    render_mode: Optional[str] = None
+) -> dict:
+    """
+    Discover the pages under base_url and crawl them. This is what a crawl
+    job runs in the worker pool (see app/worker.py).
+    With stream_discovery, pages are crawled while they are being discovered.
+    """
+    lastmods: Dict[str, Optional[str]] = {}
+    # Pages missing from the URLs are only deleted if discovery saw the whole site.
+    discovery_status: dict = {}
+    if stream_discovery:
+        source = iter_relevant_urls(base_url, max_urls=500, lastmods=lastmods, status=discovery_status)
+    else:
+        source = await get_relevant_urls(base_url, max_urls=500, lastmods=lastmods, status=discovery_status)
+        if not source:
+            raise ValueError("No relevant URLs found on the provided base URL.")
+    return await scrape_and_embed_docs_parallel(
+        source,
+        doc_id,
+        max_concurrent=FETCH_CONCURRENCY,
+        incremental=incremental,
+        lastmods=lastmods,
+        completed_urls=completed_urls,
+        on_url_done=on_url_done,
+        cancelled=cancelled,
+        render_mode=render_mode,
+        delete_unseen=lambda: discovery_status.get("complete", False)
+    )
 
-def process_document(urls: List[str], doc_id: str):
+async def ingest_archive(
+    doc_id: str,
+    chunks: AsyncIterator[bytes],
+    base_url: Optional[str] = None,
+    strip_components: int = 0,
+    incremental: bool = False,
+    cancelled: Optional[asyncio.Event] = None,
+    on_url_done: Optional[Callable[[str, bool], None]] = None
+) -> dict:
     """
-    Helper function to run the asynchronous crawling process synchronously.
-    This is used to schedule the task in the background.
+    Ingest a zip or tar(.gz/.bz2/.xz) of HTML and Markdown files arriving as
+    a stream of byte chunks (an upload). Entries are extracted one at a time
+    as the bytes arrive and go through the same markdown, dedup, chunk, embed
+    and upsert stages as crawled pages, under the URLs entry_url() gives them.
+    At most ARCHIVE_MAX_PENDING pages are read ahead of the pipeline, so
+    reading the upload waits for embedding instead of filling memory.
+
+    When the whole archive was read, pages of doc_id that aren't in it are
+    deleted, as a crawl deletes pages that disappeared from the site.
     """
-    asyncio.run(scrape_and_embed_docs_parallel(urls, doc_id, max_concurrent=5))
+    from app.utils import scraper
+
+    pages: Dict[str, dict] = {}
+    urls_seen: Set[str] = set()
+    archive_stats: dict = {}
+    archive_error: Optional[Exception] = None
+
+    async def iter_urls():
+        nonlocal archive_error
+        try:
+            async for name, data in archive.aiter_archive(
+                chunks, max_entry_bytes=scraper.MAX_PAGE_BYTES, stats=archive_stats
+            ):
+                url = archive.entry_url(name, base_url, strip_components)
+                if url is None or url in urls_seen:
+                    continue
+                if len(urls_seen) >= ARCHIVE_MAX_PAGES:
+                    raise ValueError(f"The archive has more than {ARCHIVE_MAX_PAGES} pages.")
+                urls_seen.add(url)
+                pages[url] = {
+                    "url": url,
+                    "status": 200,
+                    "content_type": archive.content_type_for(name),
+                    "text": archive.decode_entry(data) if data is not None else None,
+                    "headers": {},
+                    "via": "archive",
+                }
+                yield url
+        except Exception as e:
+            # Stop feeding pages; the ones already read are still ingested.
+            archive_error = e
+
+    async def page_source(url: str) -> Optional[dict]:
+        return pages.pop(url, None)
+
+    async with aclosing(iter_urls()) as urls:
+        result = await scrape_and_embed_docs_parallel(
+            urls,
+            doc_id,
+            incremental=incremental,
+            on_url_done=on_url_done,
+            cancelled=cancelled,
+            page_source=page_source,
+            max_pending=ARCHIVE_MAX_PENDING,
+            # Only a fully read archive tells which pages are gone.
+            delete_unseen=lambda: archive_error is None and (cancelled is None or not cancelled.is_set())
+        )
+    if archive_error is not None:
+        raise ValueError(f"Could not read the archive: {archive_error}") from archive_error
+    result["archive"] = archive_stats
+    return result
 
 # --------- Query + Generate Answer -----------
-def query_docs(doc_id: str, query: str, top_k: int = 3):
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_ENCODING = "o200k_base"  # tokenizer of CHAT_MODEL
+NO_DOCS_ANSWER = "No relevant docs found for this doc_id. Please run the crawl first or verify your doc_id."
+
+def _format_matches(doc_id: str, matches: List[dict]) -> List[dict]:
     """
-    Embed the query, perform a vector similarity search in Pinecone,
-    and return the top_k matching chunks.
+    Matches as {doc_id, source_url, text, heading, chunk_index, start, end,
+    score}, keeping only the best of identical passages. Texts are fetched from the
+    chunk store in one batch; vectors stored before it existed still carry
+    their text in metadata.
     """
-    q_emb = create_embedding(query)
-    search_res = pinecone_index.query(
-        vector=q_emb,
-        top_k=top_k,
-        include_metadata=True,
-        filter={"doc_id": doc_id}
-    )
+    with metrics.stage("hydrate", chunks=len(matches)):
+        stored = chunk_store.get_many(
+            doc_id, [match["id"] for match in matches if "text" not in match["metadata"]]
+        )
     results = []
-    if "matches" in search_res:
-        for match in search_res["matches"]:
-            md = match.metadata
-            results.append({
-                "source_url": md.get("source_url", ""),
-                "text": md.get("text", "")
-            })
+    seen = set()
+    for match in matches:
+        md = {**match["metadata"], **stored.get(match["id"], {})}
+        digest = exact_hash(md.get("text", ""))
+        if digest in seen:
+            continue
+        seen.add(digest)
+        results.append({
+            "doc_id": doc_id,
+            "source_url": md.get("source_url", ""),
+            "text": md.get("text", ""),
+            "heading": md.get("heading"),
+            "chunk_index": md.get("chunk_index"),
+            "start": md.get("start"),
+            "end": md.get("end"),
+            "score": match.get("score"),
+        })
     return results
 
-def generate_answer(query: str, docs: List[dict]) -> str:
+def search_docs(doc_id: str, q_emb: List[float], top_k: int) -> List[dict]:
+    """Vector search for q_emb within doc_id, with the matching chunk texts."""
+    with metrics.stage("vector_query", doc_id=doc_id):
+        matches = clients.vector_store.query(q_emb, doc_id, top_k)
+    return _format_matches(doc_id, matches)
+
+def search_many(doc_ids: List[str], q_emb: List[float], top_k: int) -> Dict[str, List[dict]]:
+    """search_docs for every doc_id, each partition queried concurrently on the search pool."""
+    if len(doc_ids) == 1:
+        return {doc_ids[0]: search_docs(doc_ids[0], q_emb, top_k)}
+    futures = {
+        # Each query runs in a copy of this context, so its spans land in the current trace.
+        doc_id: search_executor.submit(contextvars.copy_context().run, search_docs, doc_id, q_emb, top_k)
+        for doc_id in doc_ids
+    }
+    return {doc_id: future.result() for doc_id, future in futures.items()}
+
+def merge_results(per_doc: List[List[dict]], top_k: int) -> List[dict]:
+    """The best top_k of several doc_ids' results, keeping only the best of identical passages."""
+    if len(per_doc) == 1:
+        return per_doc[0][:top_k]
+    ranked = sorted((r for results in per_doc for r in results), key=lambda r: r["score"] or 0.0, reverse=True)
+    merged = []
+    seen = set()
+    for result in ranked:
+        digest = exact_hash(result["text"])
+        if digest in seen:
+            continue
+        seen.add(digest)
+        merged.append(result)
+        if len(merged) == top_k:
+            break
+    return merged
+
+def _cached_results(doc_ids: List[str], versions: List, query: str, top_k: int) -> Dict[str, List[dict]]:
+    """The retrieval cache's results for (query, top_k) of those doc_ids that have them."""
+    found = {}
+    for doc_id, version in zip(doc_ids, versions):
+        retrieval_cache.sync_doc_version(doc_id, version)
+        cached = retrieval_cache.get_results(doc_id, query, top_k)
+        RETRIEVAL_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+        if cached is not None:
+            found[doc_id] = cached
+    return found
+
+async def aembed_query(query: str) -> List[float]:
+    """The query's embedding, from the retrieval cache if the same (normalized) query was embedded recently."""
+    q_emb = retrieval_cache.get_embedding(query)
+    if q_emb is None:
+        q_emb = (await acreate_embeddings([query]))[0]
+        retrieval_cache.set_embedding(query, q_emb)
+    return q_emb
+
+async def aquery_docs(doc_id: Union[str, List[str]], query: str, top_k: int = 3):
+    """
+    Embed the query with AsyncOpenAI, search the vector store off the event
+    loop, and return the top_k matching chunks.
+    doc_id may also be a list of doc_ids: their partitions are searched
+    concurrently and the results merged into one top_k.
+    Both the query embedding and each doc_id's results are served from the
+    retrieval cache when the same (normalized) question was asked recently.
+    """
+    doc_ids = [doc_id] if isinstance(doc_id, str) else list(doc_id)
+    with metrics.stage("retrieval", docs=len(doc_ids)):
+        versions = await asyncio.to_thread(lambda: [job_store.doc_version(d) for d in doc_ids])
+        per_doc = _cached_results(doc_ids, versions, query, top_k)
+        missing = [d for d in doc_ids if d not in per_doc]
+        if missing:
+            q_emb = await aembed_query(query)
+            for d, results in (await asyncio.to_thread(search_many, missing, q_emb, top_k)).items():
+                retrieval_cache.set_results(d, query, top_k, results)
+                per_doc[d] = results
+        return merge_results([per_doc[d] for d in doc_ids], top_k)
+
+async def alookup_answer(doc_ids: List[str], query: str, top_k: int) -> Tuple[Optional[dict], Optional[List[float]]]:
+    """
+    Look for a cached answer to a question similar to query (see
+    SemanticAnswerCache). Returns the cached answer or None, and the query
+    embedding for storing a new answer (None when the cache is disabled).
+    Answers over several doc_ids are cached together and dropped when any
+    of them is re-ingested.
     """
-    Generate an answer using a language model based on the provided query and document context.
+    if not answer_cache.enabled:
+        return None, None
+    start = time.perf_counter()
+    key = doc_set_key(doc_ids)
+    with metrics.stage("answer_cache"):
+        versions = await asyncio.to_thread(lambda: [job_store.doc_version(d) for d in doc_ids])
+        for doc_id, version in zip(doc_ids, versions):
+            # Per doc_id, so that re-ingesting it also drops the answers it shares with others.
+            answer_cache.sync_doc_version(doc_id, version)
+        q_emb = await aembed_query(query)
+        cached = answer_cache.lookup(key, q_emb, top_k)
+    ANSWER_CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+    if cached is not None:
+        ANSWER_CACHE_SAVED.inc(max(0.0, cached["seconds"] - (time.perf_counter() - start)))
+    return cached, q_emb
+
+def assemble_context(query: str, docs: List[dict]) -> dict:
+    """
+    Pack the retrieved chunks into at most CONTEXT_MAX_TOKENS tokens of the
+    chat model (see pack_context). The token count is observed in
+    docs_chat_context_tokens and recorded on the "context" span.
+    """
+    start = time.perf_counter()
+    context = pack_context(docs, CONTEXT_MAX_TOKENS, query=query, count_tokens=get_token_counter(CHAT_ENCODING))
+    CONTEXT_TOKENS.observe(context["tokens"])
+    metrics.record_stage(
+        "context", start, tokens=context["tokens"], chunks=context["chunks"], passages=len(context["passages"])
+    )
+    return context
+
+def build_messages(query: str, context: dict) -> List[dict]:
+    """
+    Build the chat prompt from the query and the packed document context.
     """
     system_prompt = (
         "You are an AI assistant that answers questions based on provided documentation. "
         "Use the docs if relevant; otherwise, say that no information was found. "
         "At the end, list the sources used."
     )
-    docs_context = "\n\n".join(
-        [f"Source: {d['source_url']}\nContent: {d['text'][:500]}" for d in docs]
-    )
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
-        {"role": "assistant", "content": f"Here are the docs:\n{docs_context}"},
+        {"role": "assistant", "content": f"Here are the docs:\n{context['text']}"},
         {"role": "user", "content": f"Q: {query}\nA:"}
     ]
-    resp = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.3
-    )
+
+def _record_generation_usage(resp):
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        GENERATION_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+        GENERATION_TOKENS.inc(usage.completion_tokens, kind="completion")
+
+async def agenerate_answer(query: str, context: dict) -> str:
+    """
+    Generate an answer using a language model based on the provided query and
+    document context (see assemble_context).
+    """
+    with metrics.stage("generate"):
+        resp = await clients.async_openai.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_messages(query, context),
+            temperature=0.3
+        )
+    _record_generation_usage(resp)
     return resp.choices[0].message.content
 
+async def agenerate_answer_stream(
+    query: str,
+    context: dict,
+    trace: Optional[metrics.Trace] = None
+) -> AsyncIterator[str]:
+    """
+    Stream the answer token by token. Closing the generator (e.g. when the
+    client disconnects) closes the upstream OpenAI stream as well.
+    The "generate" stage covers the whole stream and is recorded in trace.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        stream = await clients.async_openai.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_messages(query, context),
+            temperature=0.3,
+            stream=True
+        )
+        try:
+            first = True
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first and trace is not None:
+                        CHAT_FIRST_TOKEN.observe(trace.elapsed())
+                    first = False
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        metrics.record_stage("generate", start, trace=trace, error=error)
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # --------- FastAPI Endpoints -----------
 class DocsCrawlRequest(BaseModel):
     base_url: str  # e.g. "https://supabase.com/docs"
     user_id: str   # Supplied from the signed-in user context.
     doc_id: Optional[str] = None
+    incremental: bool = False  # Only re-crawl pages that changed since the last run of doc_id.
+    stream_discovery: bool = False  # Crawl pages while they are being discovered.
+    priority: int = 0  # Higher priority jobs are picked up first.
+    render_mode: Optional[Literal["auto", "http", "browser"]] = None  # Defaults to RENDER_MODE / overrides.
 
-@app.post("/crawl_docs")
-async def crawl_docs_endpoint(req: DocsCrawlRequest, background_tasks: BackgroundTasks):
+@router.post("/crawl_docs")
+def crawl_docs_endpoint(req: DocsCrawlRequest):
+    """
+    Queue a crawl job and return right away. Discovery, crawling and
+    embedding all happen in the worker pool (python -m app.worker).
+    """
     # Generate or use provided doc_id
     doc_id = req.doc_id or str(uuid.uuid4())
     if not req.doc_id:
         create_document(doc_id, req.base_url, req.user_id)
-    urls = get_relevant_urls(req.base_url, max_urls=500)
-    if not urls:
-        raise HTTPException(status_code=404, detail="No relevant URLs found on the provided base URL.")
-    # Start the crawling process in the background
-    background_tasks.add_task(process_document, urls, doc_id)
-    print(f"[INFO] Returning early with doc_id: {doc_id} and {len(urls)} URLs to process.")
+    payload = {
+        "base_url": req.base_url,
+        "incremental": req.incremental and req.doc_id is not None,
+        "stream_discovery": req.stream_discovery,
+        "render_mode": req.render_mode
+    }
+    job_id = job_store.enqueue(doc_id, req.user_id, payload, kind="crawl", priority=req.priority)
+    print(f"[INFO] Queued crawl job {job_id} for doc_id: {doc_id}")
     return {
-        "message": "Document processing started",
+        "message": "Document processing queued",
         "doc_id": doc_id,
-        "urls_found": len(urls)
+        "job_id": job_id,
+        "urls_found": None
     }
 
+class JobPriorityRequest(BaseModel):
+    priority: int
+
+@router.get("/jobs")
+def list_jobs(tenant_id: Optional[str] = None, limit: int = 50):
+    """
+    Return the most recent crawl jobs, optionally only those of one tenant (user_id).
+    """
+    return job_store.list(tenant_id=tenant_id, limit=limit)
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Return a crawl job with its status, attempts and result summary.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No job found for this job_id.")
+    return job
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """
+    Cancel a queued job, or ask the worker running it to stop.
+    """
+    status = job_store.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No job found for this job_id.")
+    return {"job_id": job_id, "status": status}
+
+@router.post("/jobs/{job_id}/priority")
+def set_job_priority(job_id: str, req: JobPriorityRequest):
+    """
+    Change the priority of a job that is still queued.
+    """
+    if not job_store.set_priority(job_id, req.priority):
+        raise HTTPException(status_code=409, detail="Only queued jobs can be reprioritized.")
+    return {"job_id": job_id, "priority": req.priority}
+
 class ChatRequest(BaseModel):
-    doc_id: str
+    doc_id: Optional[str] = None
+    doc_ids: Optional[List[str]] = None  # Chat across several doc sets; doc_id is added to them.
     query: str
     top_k: Optional[int] = 3
+    stream: bool = False  # Stream the answer as server-sent events instead of one JSON body.
 
-@app.post("/chat")
-def chat_endpoint(req: ChatRequest):
-    docs = query_docs(req.doc_id, req.query, top_k=req.top_k)
-    if not docs:
-        return {"answer": "No relevant docs found for this doc_id. Please run the crawl first or verify your doc_id."}
-    answer = generate_answer(req.query, docs)
-    return {"answer": answer}
+def chat_doc_ids(req: ChatRequest) -> List[str]:
+    """The doc_ids a chat request searches, in order and without repeats."""
+    doc_ids = list(dict.fromkeys(([req.doc_id] if req.doc_id else []) + (req.doc_ids or [])))
+    if not doc_ids:
+        raise HTTPException(status_code=400, detail="Provide a doc_id or doc_ids.")
+    if len(doc_ids) > MAX_CHAT_DOCS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CHAT_DOCS} doc_ids can be searched at once.")
+    return doc_ids
 
-@app.get("/document_status/{doc_id}")
+@router.post("/chat")
+async def chat_endpoint(req: ChatRequest, request: Request):
+    doc_ids = chat_doc_ids(req)
+    # Retrieval and generation of this request are spans of one trace (see /traces).
+    chat_trace = metrics.start_trace("chat", doc_id=",".join(doc_ids), stream=req.stream)
+    started = time.perf_counter()
+    with chat_trace.activate():
+        try:
+            # A paraphrase of a recently answered question gets the same answer.
+            cached, q_emb = await alookup_answer(doc_ids, req.query, req.top_k)
+            chat_trace.attrs["cached"] = cached is not None
+            if cached is None:
+                docs = await aquery_docs(doc_ids, req.query, top_k=req.top_k)
+                sources = sorted({d["source_url"] for d in docs})
+            if not req.stream:
+                if cached is not None:
+                    return {
+                        "answer": cached["answer"],
+                        "sources": cached["sources"],
+                        "context_tokens": cached["context_tokens"],
+                        "cached": True
+                    }
+                if not docs:
+                    return {"answer": NO_DOCS_ANSWER, "sources": [], "cached": False}
+                context = assemble_context(req.query, docs)
+                answer = await agenerate_answer(req.query, context)
+                if q_emb is not None:
+                    answer_cache.store(
+                        doc_set_key(doc_ids), req.query, q_emb, req.top_k, answer, sources, context["tokens"],
+                        time.perf_counter() - started
+                    )
+                return {"answer": answer, "sources": sources, "context_tokens": context["tokens"], "cached": False}
+        except Exception as e:
+            chat_trace.finish(error=type(e).__name__)
+            raise
+        finally:
+            if not req.stream:
+                chat_trace.finish()
+
+    async def events():
+        error = None
+        try:
+            if cached is not None:
+                yield sse_event("sources", cached["sources"])
+                yield sse_event("token", {"content": cached["answer"]})
+                yield sse_event("done", {"context_tokens": cached["context_tokens"], "cached": True})
+                return
+            yield sse_event("sources", sources)
+            if not docs:
+                yield sse_event("token", {"content": NO_DOCS_ANSWER})
+                yield sse_event("done", {"cached": False})
+                return
+            answer = []
+            try:
+                with chat_trace.activate():
+                    context = assemble_context(req.query, docs)
+                async with aclosing(agenerate_answer_stream(req.query, context, trace=chat_trace)) as tokens:
+                    async for token in tokens:
+                        if await request.is_disconnected():
+                            print(f"[INFO] Client disconnected, cancelling answer for doc_id: {', '.join(doc_ids)}")
+                            error = "ClientDisconnected"
+                            return
+                        answer.append(token)
+                        yield sse_event("token", {"content": token})
+            except Exception as e:
+                print(f"[ERROR] Streaming answer failed: {e}")
+                error = type(e).__name__
+                yield sse_event("error", {"detail": str(e)})
+                return
+            # Only complete answers are cached.
+            if q_emb is not None:
+                answer_cache.store(
+                    doc_set_key(doc_ids), req.query, q_emb, req.top_k, "".join(answer), sources, context["tokens"],
+                    time.perf_counter() - started
+                )
+            yield sse_event("done", {"context_tokens": context["tokens"], "cached": False})
+        finally:
+            chat_trace.finish(error=error)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/document_status/{doc_id}")
 def get_document_status(doc_id: str):
     """
     Return the current status of a document (in_progress, completed, etc.) along with totals.
     """
-    response = supabase.table("documents").select(
+    response = clients.supabase.table("documents").select(
         "id, status, total_urls, processed_urls, failed_urls"
     ).eq("id", doc_id).execute()
     if response.data:
@@ -417,8 +1525,129 @@ def get_document_status(doc_id: str):
     else:
         raise HTTPException(status_code=404, detail="No document found for this doc_id.")
 
-@app.get("/")
+@router.delete("/documents/{doc_id}")
+def delete_document_endpoint(doc_id: str):
+    """
+    Delete a document with its vectors and crawl state. Refused while a job
+    for it is queued or running; cancel the job first.
+    """
+    if doc_id in (".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid doc_id.")
+    job = job_store.active_job(doc_id)
+    if job is not None:
+        raise HTTPException(status_code=409, detail=f"Job {job['id']} is still {job['status']} for this doc_id.")
+    delete_document(doc_id)
+    return {"doc_id": doc_id, "deleted": True}
+
+TERMINAL_JOB_STATUSES = ("completed", "failed", "cancelled")
+
+@router.get("/document_progress/{doc_id}")
+def get_document_progress(doc_id: str):
+    """
+    Return the latest progress snapshot of a document: totals, per-stage
+    counts and recent failures, plus the status of its latest crawl job.
+    """
+    snapshot = job_store.get_progress(doc_id)
+    job = job_store.latest_job(doc_id)
+    if snapshot is None and job is None:
+        raise HTTPException(status_code=404, detail="No progress found for this doc_id.")
+    return {**(snapshot or {"doc_id": doc_id}), "job_status": job["status"] if job else None}
+
+@router.get("/document_progress/{doc_id}/stream")
+async def stream_document_progress(doc_id: str, request: Request):
+    """
+    Server-sent events with the progress of a document: a "progress" event
+    whenever the worker flushed a new snapshot, then "done" once its crawl job
+    has finished. Replaces polling /document_status.
+    """
+    if await asyncio.to_thread(job_store.get_progress, doc_id) is None and \
+            await asyncio.to_thread(job_store.latest_job, doc_id) is None:
+        raise HTTPException(status_code=404, detail="No progress found for this doc_id.")
+
+    async def events():
+        last_update = None
+        idle = 0.0
+        while not await request.is_disconnected():
+            snapshot = await asyncio.to_thread(job_store.get_progress, doc_id)
+            job = await asyncio.to_thread(job_store.latest_job, doc_id)
+            job_status = job["status"] if job else None
+            if snapshot is not None and snapshot.get("updated_at") != last_update:
+                last_update = snapshot.get("updated_at")
+                idle = 0.0
+                yield sse_event("progress", {**snapshot, "job_status": job_status})
+            elif idle >= 15:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            finished = job_status in TERMINAL_JOB_STATUSES or (
+                job is None and snapshot is not None and snapshot.get("status") != "in_progress"
+            )
+            if finished:
+                yield sse_event("done", {"status": job_status or snapshot.get("status")})
+                return
+            await asyncio.sleep(PROGRESS_STREAM_INTERVAL)
+            idle += PROGRESS_STREAM_INTERVAL
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/embedding_cache/stats")
+def get_embedding_cache_stats():
+    """
+    Return hit/miss counters and size of the local embedding cache.
+    """
+    return embedding_cache.stats()
+
+@router.get("/chunk_store/stats")
+def get_chunk_store_stats():
+    """
+    Return the number of stored chunks and their raw and compressed sizes.
+    """
+    return chunk_store.stats()
+
+@router.get("/answer_cache/stats")
+def get_answer_cache_stats():
+    """
+    Return hit rate, size and evictions of the semantic /chat answer cache.
+    """
+    return answer_cache.stats()
+
+@router.get("/retrieval_cache/stats")
+def get_retrieval_cache_stats():
+    """
+    Return hit rates and approximate memory use of the /chat retrieval cache.
+    """
+    return retrieval_cache.stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus metrics: stage latency histograms, batch sizes, token and
+    cache counters and HTTP request latency. Crawl stages run in the worker
+    processes, whose latest published metrics are added to this process's own.
+    """
+    counts = job_store.status_counts()
+    for status in ("queued", "running") + TERMINAL_JOB_STATUSES:
+        JOBS.set(counts.get(status, 0), status=status)
+    snapshots = [metrics.REGISTRY.snapshot()] + job_store.get_metrics()
+    return PlainTextResponse(
+        metrics.render(metrics.combine(snapshots)),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@router.get("/traces")
+def get_traces(limit: int = 20, name: Optional[str] = None):
+    """
+    Return the most recent finished traces of this process (e.g. name=chat),
+    each with its spans and a per-stage summary. Crawl job traces are stored
+    in the job's result instead (GET /jobs/{job_id}).
+    """
+    return metrics.REGISTRY.recent_traces(limit=limit, name=name)
+
+@router.get("/")
 def root():
     return {"message": "Documentation Crawler + Embedding Uploader + Chat API"}
 
-# To run: poetry run uvicorn test:app --reload
+# To run: poetry run uvicorn app.main:app --reload
@@ -0,0 +1,264 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import re
+import time
+from collections import deque
+from typing import Callable, Mapping, Optional
+
+DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from a rate-limit reset header: "1s", "6m0s", "20ms" or a bare number of seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(float(headers[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    A concurrency limit that adapts AIMD-style (like TCP congestion control):
+    while requests succeed with the limit fully used, it grows by one every
+    `limit` successes; on a rate-limited response, an error or latency above
+    latency_tolerance times the average latency, it is multiplied by backoff.
+    Requests that started before the last decrease don't decrease it again,
+    so one burst of failures only counts once.
+
+    Retry-After and exhausted x-ratelimit-remaining-requests headers pause
+    new requests until the server's reset time.
+
+    With adaptive=False it is a plain semaphore of size initial.
+
+        started = await limiter.acquire()
+        ... make the request ...
+        limiter.release(started, ok=..., throttled=..., retry_after=...)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        adaptive: bool = True,
+        backoff: float = 0.5,
+        latency_tolerance: Optional[float] = 2.0,
+        on_change: Optional[Callable[[str, int], None]] = None,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.adaptive = adaptive
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.on_change = on_change
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._waiters: deque = deque()
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._latency: Optional[float] = None
+        self._paused_until = 0.0
+        if on_change is not None:
+            on_change(name, self.limit)
+
+    async def acquire(self) -> float:
+        """Wait for a free slot (and the end of any pause). Returns the start time for release()."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._free()  # the slot was already handed to us
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        try:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause <= 0:
+                    break
+                await asyncio.sleep(pause)
+        except asyncio.CancelledError:
+            self._free()
+            raise
+        return time.monotonic()
+
+    def release(
+        self,
+        started: float,
+        ok: bool = True,
+        throttled: bool = False,
+        retry_after: Optional[float] = None,
+        latency: Optional[float] = None,
+    ):
+        """
+        Give the slot back and adapt the limit. latency defaults to the time
+        since acquire(); pass the time to the response headers for streamed
+        responses.
+        """
+        now = time.monotonic()
+        was_full = self.in_flight >= self.limit
+        self.in_flight -= 1
+        if retry_after:
+            self.pause(retry_after)
+        if self.adaptive:
+            latency = now - started if latency is None else latency
+            too_slow = ok and self._too_slow(latency)
+            if ok:
+                self._track_latency(latency)
+            if throttled or not ok or too_slow:
+                self._decrease(started, now)
+            elif was_full:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self._set_limit(self.limit + 1)
+                    self.increases += 1
+                    self._successes = 0
+        self._wake()
+
+    def pause(self, seconds: float):
+        """Hold back new requests for the given number of seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers: Mapping[str, str]):
+        """Pause until the reset time when the server says no requests are left."""
+        remaining = _header_int(headers, "x-ratelimit-remaining-requests")
+        if remaining is not None and remaining <= 0:
+            self.pause(parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+    def _too_slow(self, latency: float) -> bool:
+        return (
+            self.latency_tolerance is not None
+            and self._latency is not None
+            and latency > self._latency * self.latency_tolerance
+        )
+
+    def _track_latency(self, latency: float):
+        # Moving average, so a server that is simply slow becomes the new normal.
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += 0.1 * (latency - self._latency)
+
+    def _decrease(self, started: float, now: float):
+        if started < self._last_decrease:
+            return
+        self._last_decrease = now
+        self._successes = 0
+        new_limit = max(self.min_limit, int(self.limit * self.backoff))
+        if new_limit < self.limit:
+            self._set_limit(new_limit)
+            self.decreases += 1
+
+    def _set_limit(self, limit: int):
+        self.limit = limit
+        if self.on_change is not None:
+            self.on_change(self.name, limit)
+
+    def _free(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class TokenBucket:
+    """
+    Budget of `rate_per_minute` units (e.g. embedding tokens), shared by every
+    caller in the process. acquire(n) reserves n units right away and sleeps
+    until the bucket has refilled enough to cover them, so callers are served
+    in order and a large request can't be starved by small ones. A rate of 0
+    disables the budget.
+
+    settle() charges the difference once the real usage is known, and sync()
+    lowers the balance to what the server reports as remaining, which accounts
+    for usage from other processes on the same account.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.waited_seconds = 0.0
+        self._updated = time.monotonic()
+
+    async def acquire(self, amount: float) -> float:
+        """Reserve amount units, waiting if needed. Returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        wait = -self.tokens / self.rate
+        self.waited_seconds += wait
+        await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, reserved: float, used: float):
+        """Correct a reservation made with an estimate to the amount actually used."""
+        if self.rate > 0:
+            self.tokens -= used - min(reserved, self.capacity)
+
+    def sync(self, remaining: Optional[float]):
+        if remaining is None or self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+    def sync_headers(self, headers: Mapping[str, str]):
+        """sync() from an x-ratelimit-remaining-tokens response header."""
+        self.sync(_header_int(headers, "x-ratelimit-remaining-tokens"))
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"tokens": round(self.tokens), "waited_seconds": round(self.waited_seconds, 3)}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
@@ -0,0 +1,225 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.utils.retrieval_cache import estimate_size
+
+
+def doc_set_key(doc_ids: List[str]) -> str:
+    """
+    The cache key of answers over doc_ids: their sorted JSON list, so no
+    doc_id can be mistaken for a set of others whatever characters it holds.
+    """
+    return json.dumps(sorted(set(doc_ids)))
+
+
+class _DocAnswers:
+    """The cached answers of one doc set, least recently used first."""
+
+    def __init__(self, doc_ids: frozenset):
+        self.doc_ids = doc_ids
+        self.entries: "OrderedDict[int, dict]" = OrderedDict()
+        self.matrix = None  # unit query embeddings, one row per id in matrix_ids; rebuilt when None
+        self.matrix_ids: List[int] = []
+        self.bytes = 0
+
+    def drop(self, entry_id: int):
+        entry = self.entries.pop(entry_id)
+        self.bytes -= entry["size"]
+        self.matrix = None
+
+
+class SemanticAnswerCache:
+    """
+    Answers to recent /chat questions per doc_id, found again by the cosine
+    similarity of the query embedding instead of the exact query text, so a
+    paraphrase of an answered question (similarity >= threshold, same top_k)
+    gets the stored answer and sources without retrieval or a chat completion.
+
+    Each doc keeps at most max_entries_per_doc answers and at most max_docs
+    docs are kept, both evicted least recently used first; entries expire
+    after ttl_seconds. Like RetrievalCache, invalidate_doc() drops a doc's
+    answers when it is re-ingested and sync_doc_version() notices re-ingestion
+    done by a worker process. A max_entries_per_doc of 0 disables the cache.
+
+    Answers are kept under the doc_set_key() of the doc_ids they were
+    answered from, one doc_id or several, and invalidate_doc() drops every
+    doc set that contains the doc_id.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries_per_doc: int = 200,
+        max_docs: int = 100,
+        ttl_seconds: float = 3600.0,
+    ):
+        self.threshold = threshold
+        self.max_entries_per_doc = max_entries_per_doc
+        self.max_docs = max_docs
+        self.ttl_seconds = ttl_seconds
+        self._docs: "OrderedDict[str, _DocAnswers]" = OrderedDict()
+        self._doc_versions: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries_per_doc > 0
+
+    def lookup(self, key: str, embedding: List[float], top_k: int) -> Optional[dict]:
+        """
+        The stored answer closest to embedding among the answers under key
+        (a doc_set_key()) for top_k, if it is similar enough: {"query", "answer", "sources",
+        "context_tokens", "similarity", "seconds"}, where seconds is how long
+        the original answer took to produce.
+        """
+        if not self.enabled:
+            return None
+        import numpy as np  # only needed once a cache is in use
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        with self._lock:
+            answers = self._docs.get(key)
+            if answers is not None:
+                self._expire(answers)
+            if answers is None or not answers.entries or norm == 0.0:
+                self.misses += 1
+                return None
+            if answers.matrix is None:
+                answers.matrix_ids = list(answers.entries)
+                answers.matrix = np.stack([entry["embedding"] for entry in answers.entries.values()])
+            similarities = answers.matrix @ (query / norm)
+            ids = answers.matrix_ids
+            best = None
+            for row in np.argsort(similarities)[::-1]:
+                if similarities[row] < self.threshold:
+                    break
+                if answers.entries[ids[row]]["top_k"] == top_k:
+                    best = row
+                    break
+            if best is None:
+                self.misses += 1
+                return None
+            entry = answers.entries[ids[best]]
+            answers.entries.move_to_end(ids[best])
+            self._docs.move_to_end(key)
+            self.hits += 1
+            return {
+                "query": entry["query"],
+                "answer": entry["answer"],
+                "sources": entry["sources"],
+                "context_tokens": entry["context_tokens"],
+                "similarity": round(float(similarities[best]), 4),
+                "seconds": entry["seconds"],
+            }
+
+    def store(
+        self,
+        key: str,
+        query: str,
+        embedding: List[float],
+        top_k: int,
+        answer: str,
+        sources: List[str],
+        context_tokens: int,
+        seconds: float,
+    ):
+        """
+        Remember an answer under key (a doc_set_key()); seconds is the time its
+        retrieval and generation took.
+        """
+        if not self.enabled:
+            return
+        import numpy as np
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return
+        entry = {
+            "query": query,
+            "embedding": vector / norm,
+            "top_k": top_k,
+            "answer": answer,
+            "sources": sources,
+            "context_tokens": context_tokens,
+            "seconds": seconds,
+            "expires_at": time.monotonic() + self.ttl_seconds,
+        }
+        entry["size"] = entry["embedding"].nbytes + estimate_size(
+            {key: value for key, value in entry.items() if key != "embedding"}
+        )
+        with self._lock:
+            answers = self._docs.get(key)
+            if answers is None:
+                answers = self._docs[key] = _DocAnswers(frozenset(json.loads(key)))
+            self._docs.move_to_end(key)
+            self._next_id += 1
+            answers.entries[self._next_id] = entry
+            answers.bytes += entry["size"]
+            answers.matrix = None
+            while len(answers.entries) > self.max_entries_per_doc:
+                answers.drop(next(iter(answers.entries)))
+                self.evictions += 1
+            while len(self._docs) > self.max_docs:
+                _, evicted = self._docs.popitem(last=False)
+                self.evictions += len(evicted.entries)
+
+    def invalidate_doc(self, doc_id: str):
+        with self._lock:
+            for key in [key for key, answers in self._docs.items() if doc_id in answers.doc_ids]:
+                del self._docs[key]
+            self.invalidations += 1
+
+    def sync_doc_version(self, doc_id: str, version: Any):
+        """
+        Invalidate doc_id, and every doc set containing it, if its version
+        changed since the last call. Versions are tracked per single doc_id.
+        """
+        with self._lock:
+            previous = self._doc_versions.get(doc_id)
+            self._doc_versions[doc_id] = version
+        if previous is not None and previous != version:
+            self.invalidate_doc(doc_id)
+
+    def _expire(self, answers: _DocAnswers):
+        now = time.monotonic()
+        for entry_id in [i for i, entry in answers.entries.items() if entry["expires_at"] < now]:
+            answers.drop(entry_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = sum(len(answers.entries) for answers in self._docs.values())
+            approx_bytes = sum(answers.bytes for answers in self._docs.values())
+            docs = len(self._docs)
+        lookups = self.hits + self.misses
+        return {
+            "docs": docs,
+            "entries": entries,
+            "max_docs": self.max_docs,
+            "max_entries_per_doc": self.max_entries_per_doc,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "approx_bytes": approx_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,466 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import io
+import posixpath
+import struct
+import tarfile
+import threading
+import zlib
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+# Files we can turn into text, by extension.
+CONTENT_TYPES = {
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".xhtml": "text/html",
+    ".md": "text/markdown",
+    ".markdown": "text/markdown",
+    ".mdx": "text/markdown",
+    ".txt": "text/plain",
+}
+
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+ZIP_DATA_DESCRIPTOR = b"PK\x07\x08"
+# Central directory and end records: every entry has been seen once these start.
+ZIP_END_SIGNATURES = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x07")
+ZIP_LOCAL_HEADER_STRUCT = struct.Struct("<4sHHHHHIIIHH")
+ZIP_STORED, ZIP_DEFLATED = 0, 8
+READ_SIZE = 64 * 1024
+
+
+def content_type_for(name: str) -> Optional[str]:
+    """The content type of an archive entry, or None for files that aren't docs."""
+    base = posixpath.basename(name)
+    if not base or base.startswith(".") or name.startswith("__MACOSX/"):
+        return None
+    return CONTENT_TYPES.get(posixpath.splitext(base)[1].lower())
+
+
+def entry_url(name: str, base_url: Optional[str] = None, strip_components: int = 0) -> Optional[str]:
+    """
+    The URL an archive entry is ingested under: its path, minus the first
+    strip_components directories, under base_url (the site the files were
+    exported from) or archive:/// without one. index.html stands for its
+    directory. None for entries outside the archive root (../) or with
+    nothing left after stripping.
+    """
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if ".." in parts:
+        return None
+    parts = parts[strip_components:]
+    if not parts:
+        return None
+    if parts[-1].lower() in ("index.html", "index.htm"):
+        parts[-1] = ""
+    path = "/".join(quote(part) for part in parts)
+    return (base_url.rstrip("/") if base_url else "archive://") + "/" + path
+
+
+def decode_entry(data: bytes) -> str:
+    """Entry text: UTF-8 (with or without BOM), else Latin-1, which decodes anything."""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+class StreamReader(io.RawIOBase):
+    """
+    A readable file fed with bytes from another thread (or the event loop),
+    holding at most max_buffer bytes: feed() blocks while the buffer is full
+    and read() blocks until there is data or the end of the stream.
+    Closing it discards everything fed afterwards.
+    """
+
+    def __init__(self, max_buffer: int = 4 * 1024 * 1024):
+        super().__init__()
+        self.max_buffer = max_buffer
+        self._chunks: deque = deque()
+        self._buffered = 0
+        self._eof = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def readable(self) -> bool:
+        return True
+
+    def feed_nowait(self, data: bytes) -> bool:
+        """Add data if there is room (or the reader is closed). False if feed() would block."""
+        with self._cond:
+            if self.closed:
+                return True
+            if self._buffered and self._buffered + len(data) > self.max_buffer:
+                return False
+            self._append(data)
+            return True
+
+    def feed(self, data: bytes):
+        with self._cond:
+            while not self.closed and self._buffered and self._buffered + len(data) > self.max_buffer:
+                self._cond.wait()
+            if not self.closed:
+                self._append(data)
+
+    def feed_eof(self, error: Optional[BaseException] = None):
+        """End the stream; with error, read() raises it instead of returning b""."""
+        with self._cond:
+            self._eof = True
+            self._error = error
+            self._cond.notify_all()
+
+    def _append(self, data: bytes):
+        if data:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self._cond.notify_all()
+
+    def readinto(self, buffer) -> int:
+        with self._cond:
+            while not self._chunks and not self._eof and not self.closed:
+                self._cond.wait()
+            if self.closed:
+                raise ValueError("read from a closed stream")
+            if not self._chunks:
+                if self._error is not None:
+                    raise self._error
+                return 0
+            chunk = self._chunks.popleft()
+            size = min(len(buffer), len(chunk))
+            buffer[:size] = chunk[:size]
+            if size < len(chunk):
+                self._chunks.appendleft(chunk[size:])
+            self._buffered -= size
+            self._cond.notify_all()
+            return size
+
+    def close(self):
+        with self._cond:
+            super().close()
+            self._chunks.clear()
+            self._buffered = 0
+            self._cond.notify_all()
+
+
+class _Input:
+    """Exact reads with push-back on top of a binary file."""
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._pending = b""
+        self.position = 0
+
+    def read(self, size: int) -> bytes:
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        else:
+            data = self._file.read(size)
+        self.position += len(data)
+        return data
+
+    def read_full(self, size: int) -> bytes:
+        """size bytes, or fewer only at the end of the stream."""
+        parts = []
+        while size > 0:
+            data = self.read(min(size, READ_SIZE))
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.read_full(size)
+        if len(data) < size:
+            raise ValueError("Archive ended in the middle of an entry.")
+        return data
+
+    def unread(self, data: bytes):
+        self._pending = data + self._pending
+        self.position -= len(data)
+
+
+class _FullReads:
+    def __init__(self, source: _Input):
+        self.read = source.read_full
+
+
+class ArchiveReader:
+    """
+    Entries of a zip or tar archive (optionally gzip, bzip2 or xz compressed)
+    read front to back from a non-seekable stream, so nothing but the entry
+    being read is held in memory. Zip archives are read by their local file
+    headers; their central directory at the end is not needed.
+
+    entries() yields (name, data) for regular files whose name accept()s.
+    data is None for files larger than max_entry_bytes, which are skipped.
+    Other files and directories are skipped and counted.
+    """
+
+    def __init__(
+        self,
+        fileobj,
+        accept: Callable[[str], bool] = lambda name: content_type_for(name) is not None,
+        max_entry_bytes: int = 10 * 1024 * 1024,
+    ):
+        self._input = _Input(fileobj)
+        self.accept = accept
+        self.max_entry_bytes = max_entry_bytes
+        self.format: Optional[str] = None
+        self.files = 0
+        self.skipped = 0
+        self.too_large = 0
+
+    @property
+    def bytes_read(self) -> int:
+        return self._input.position
+
+    def entries(self) -> Iterator[Tuple[str, Optional[bytes]]]:
+        head = self._input.read_full(4)
+        self._input.unread(head)
+        if head == ZIP_LOCAL_HEADER:
+            self.format = "zip"
+            yield from self._zip_entries()
+        else:
+            yield from self._tar_entries()
+
+    def _tar_entries(self) -> Iterator[Tuple[str, Optional[bytes]]]:
+        try:
+            # tarfile sniffs the compression from its first read, so it gets full reads.
+            archive = tarfile.open(fileobj=_FullReads(self._input), mode="r|*")
+        except tarfile.ReadError as e:
+            raise ValueError(f"Not a zip or tar archive: {e}")
+        self.format = "tar"
+        with archive:
+            for member in archive:
+                if not member.isfile() or not self.accept(member.name):
+                    self.skipped += 1
+                    continue
+                self.files += 1
+                if member.size > self.max_entry_bytes:
+                    self.too_large += 1
+                    yield member.name, None
+                    continue
+                yield member.name, archive.extractfile(member).read()
+
+    def _zip_entries(self) -> Iterator[Tuple[str, Optional[bytes]]]:
+        source = self._input
+        while True:
+            signature = source.read_full(4)
+            if len(signature) < 4 or signature in ZIP_END_SIGNATURES:
+                return
+            if signature != ZIP_LOCAL_HEADER:
+                raise ValueError(f"Unexpected zip record at byte {source.position - 4}.")
+            header = ZIP_LOCAL_HEADER_STRUCT.unpack(signature + source.read_exact(ZIP_LOCAL_HEADER_STRUCT.size - 4))
+            _, _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = header
+            raw_name = source.read_exact(name_length)
+            extra = source.read_exact(extra_length)
+            name = raw_name.decode("utf-8" if flags & 0x800 else "cp437", errors="replace")
+            if compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF:
+                size, compressed_size = _zip64_sizes(extra, size, compressed_size)
+            has_descriptor = bool(flags & 0x08)
+            if flags & 0x01:
+                raise ValueError(f"Encrypted zip entries are not supported: {name}")
+
+            wanted = not name.endswith("/") and self.accept(name)
+            if not wanted:
+                self.skipped += 1
+            else:
+                self.files += 1
+            too_large = wanted and not has_descriptor and size > self.max_entry_bytes
+            keep = wanted and not too_large
+
+            if method == ZIP_DEFLATED:
+                data, used, crc_seen, total = self._inflate(
+                    None if has_descriptor else compressed_size, keep
+                )
+            elif method == ZIP_STORED and not has_descriptor:
+                data, used, crc_seen, total = self._copy(compressed_size, keep)
+            elif not has_descriptor:
+                # Compression we can't read (bzip2, lzma, ...): skip it.
+                source.read_exact(compressed_size)
+                if wanted:
+                    print(f"[ERROR] Skipping {name}: unsupported zip compression method {method}.")
+                continue
+            else:
+                raise ValueError(f"Can't stream zip entry {name}: method {method} with a data descriptor.")
+
+            if has_descriptor:
+                crc = self._read_descriptor(used, total)
+            if data is not None and crc_seen != crc:
+                raise ValueError(f"CRC mismatch in zip entry {name}.")
+            if wanted:
+                if data is None or total > self.max_entry_bytes:
+                    self.too_large += 1
+                    yield name, None
+                else:
+                    yield name, data
+
+    def _copy(self, size: int, keep: bool) -> Tuple[Optional[bytes], int, int, int]:
+        parts, crc, remaining = [], 0, size
+        while remaining > 0:
+            data = self._input.read_exact(min(remaining, READ_SIZE))
+            remaining -= len(data)
+            if keep:
+                parts.append(data)
+                crc = zlib.crc32(data, crc)
+        return (b"".join(parts) if keep else None), size, crc, size
+
+    def _inflate(self, compressed_size: Optional[int], keep: bool) -> Tuple[Optional[bytes], int, int, int]:
+        """
+        Inflate one entry. Without a known compressed size (data descriptor),
+        read until the deflate stream ends and push back what follows it.
+        Output beyond max_entry_bytes is counted but not kept.
+        """
+        decompressor = zlib.decompressobj(-15)
+        parts, crc, total, used = [], 0, 0, 0
+        remaining = compressed_size
+        while not decompressor.eof:
+            size = READ_SIZE if remaining is None else min(READ_SIZE, remaining)
+            if size == 0:
+                break
+            data = self._input.read(size)
+            if not data:
+                raise ValueError("Archive ended in the middle of an entry.")
+            used += len(data)
+            if remaining is not None:
+                remaining -= len(data)
+            output = decompressor.decompress(data)
+            total += len(output)
+            if keep and total <= self.max_entry_bytes:
+                parts.append(output)
+                crc = zlib.crc32(output, crc)
+            if decompressor.unused_data:
+                used -= len(decompressor.unused_data)
+                self._input.unread(decompressor.unused_data)
+        if remaining:
+            self._input.read_exact(remaining)
+            used += remaining
+        keep = keep and total <= self.max_entry_bytes
+        return (b"".join(parts) if keep else None), used, crc, total
+
+    def _read_descriptor(self, compressed_size: int, size: int) -> int:
+        """
+        Read the data descriptor following an entry of the given sizes and
+        return its CRC. Zip64 descriptors have 8-byte sizes; which kind it is
+        shows in whether the sizes match as 4-byte values.
+        """
+        data = self._input.read_exact(4)
+        if data == ZIP_DATA_DESCRIPTOR:
+            data = self._input.read_exact(4)
+        crc = struct.unpack("<I", data)[0]
+        sizes = self._input.read_exact(8)
+        if struct.unpack("<II", sizes) != (compressed_size, size):
+            sizes += self._input.read_exact(8)
+            if struct.unpack("<QQ", sizes) != (compressed_size, size):
+                raise ValueError("Zip data descriptor doesn't match the entry.")
+        return crc
+
+
+def _zip64_sizes(extra: bytes, size: int, compressed_size: int) -> Tuple[int, int]:
+    """Sizes from the zip64 extra field, for those the local header left at 0xFFFFFFFF."""
+    position = 0
+    while position + 4 <= len(extra):
+        tag, length = struct.unpack_from("<HH", extra, position)
+        if tag == 0x0001:
+            values = extra[position + 4:position + 4 + length]
+            offset = 0
+            if size == 0xFFFFFFFF and offset + 8 <= len(values):
+                size = struct.unpack_from("<Q", values, offset)[0]
+                offset += 8
+            if compressed_size == 0xFFFFFFFF and offset + 8 <= len(values):
+                compressed_size = struct.unpack_from("<Q", values, offset)[0]
+            break
+        position += 4 + length
+    return size, compressed_size
+
+
+async def aiter_archive(
+    chunks: AsyncIterator[bytes],
+    accept: Callable[[str], bool] = lambda name: content_type_for(name) is not None,
+    max_entry_bytes: int = 10 * 1024 * 1024,
+    max_buffer: int = 4 * 1024 * 1024,
+    stats: Optional[dict] = None,
+) -> AsyncIterator[Tuple[str, Optional[bytes]]]:
+    """
+    Entries of an archive arriving as a stream of byte chunks (e.g. a
+    request body), see ArchiveReader. The archive is parsed on a thread while
+    the chunks are fed to it; at most max_buffer bytes of the stream and one
+    entry are held at a time, and nothing is written to disk. If the
+    consumer stops early, the parser is stopped too.
+
+    If a dict is passed as stats, it is updated with the reader's counters
+    (format, files, skipped, too_large, bytes) once the archive is read.
+    """
+    loop = asyncio.get_running_loop()
+    reader = StreamReader(max_buffer)
+    archive = ArchiveReader(reader, accept=accept, max_entry_bytes=max_entry_bytes)
+    entries: asyncio.Queue = asyncio.Queue(maxsize=4)
+    stopped = threading.Event()
+    finished = object()
+
+    def put(item) -> bool:
+        if stopped.is_set():
+            return False
+        asyncio.run_coroutine_threadsafe(entries.put(item), loop).result()
+        return True
+
+    def parse():
+        try:
+            for entry in archive.entries():
+                if not put(entry):
+                    return
+            item = finished
+        except BaseException as e:
+            item = e
+        finally:
+            # Whatever follows the last entry (a zip's central directory) is discarded.
+            reader.close()
+        put(item)
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                if not reader.feed_nowait(chunk):
+                    await asyncio.to_thread(reader.feed, chunk)
+        except Exception as e:
+            reader.feed_eof(e)
+            raise
+        reader.feed_eof()
+
+    feeder = asyncio.create_task(feed())
+    parser = loop.run_in_executor(None, parse)
+    completed = False
+    try:
+        while True:
+            item = await entries.get()
+            if item is finished:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+        completed = True
+    finally:
+        stopped.set()
+        reader.close()
+        while not entries.empty():
+            entries.get_nowait()
+        if not completed:
+            feeder.cancel()
+        await asyncio.gather(feeder, parser, return_exceptions=True)
+        if stats is not None:
+            stats.update({
+                "format": archive.format,
+                "files": archive.files,
+                "skipped": archive.skipped,
+                "too_large": archive.too_large,
+                "bytes": archive.bytes_read,
+            })
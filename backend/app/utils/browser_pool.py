@@ -0,0 +1,138 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+
+def _browser_config():
+    from crawl4ai import BrowserConfig
+
+    return BrowserConfig(
+        headless=True,
+        extra_args=["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"]
+    )
+
+
+def _run_config(session_id: str):
+    from crawl4ai import CacheMode, CrawlerRunConfig
+    from crawl4ai.content_filter_strategy import PruningContentFilter
+    from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+
+    prune_filter = PruningContentFilter(threshold=0.25, threshold_type="dynamic")
+    return CrawlerRunConfig(
+        markdown_generator=DefaultMarkdownGenerator(
+            content_filter=prune_filter,
+            options={"ignore_images": True}
+        ),
+        cache_mode=CacheMode.BYPASS,
+        session_id=session_id
+    )
+
+
+class BrowserPool:
+    """
+    Long-lived headless Chromium instances (crawl4ai AsyncWebCrawler) shared
+    by every crawl running in this process, for pages that need JavaScript.
+
+    Each browser keeps pages_per_browser tabs open as crawl4ai sessions, and
+    every render borrows one tab, so browsers and tabs are reused across
+    pages and jobs instead of being launched per crawl. A browser is
+    relaunched once it has rendered recycle_after pages and none of its tabs
+    are in use, to keep Chromium's memory growth in check.
+
+    Browsers are launched lazily on the first render, in the running event
+    loop, so the pool must be used from a single long-lived loop.
+    """
+
+    def __init__(self, browsers: int = 1, pages_per_browser: int = 4, recycle_after: int = 1000):
+        self.browsers = max(1, browsers)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.recycle_after = recycle_after
+        self._crawlers: List = []
+        self._uses: List[int] = []
+        self._active: List[int] = []
+        self._slots: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+        self.pages_rendered = 0
+        self.restarts = 0
+
+    async def _launch(self):
+        from crawl4ai import AsyncWebCrawler
+
+        crawler = AsyncWebCrawler(config=_browser_config())
+        await crawler.start()
+        return crawler
+
+    async def _ensure_started(self):
+        if self._slots is not None:
+            return
+        async with self._start_lock:
+            if self._slots is not None:
+                return
+            self._crawlers = [await self._launch() for _ in range(self.browsers)]
+            self._uses = [0] * self.browsers
+            self._active = [0] * self.browsers
+            slots: asyncio.Queue = asyncio.Queue()
+            for tab in range(self.pages_per_browser):
+                for browser in range(self.browsers):
+                    slots.put_nowait((browser, f"pool-{browser}-{tab}"))
+            self._slots = slots
+            print(f"[INFO] Browser pool started: {self.browsers} browsers x {self.pages_per_browser} tabs.")
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Tuple[object, object]]:
+        """Borrow a tab: yields (crawler, run config bound to the tab's session)."""
+        await self._ensure_started()
+        browser, session_id = await self._slots.get()
+        try:
+            if self._uses[browser] >= self.recycle_after and self._active[browser] == 0:
+                await self._restart(browser)
+            self._active[browser] += 1
+            self._uses[browser] += 1
+            try:
+                yield self._crawlers[browser], _run_config(session_id)
+            finally:
+                self._active[browser] -= 1
+        finally:
+            self._slots.put_nowait((browser, session_id))
+
+    async def render(self, url: str):
+        """Render url in a pooled tab and return the crawl4ai result."""
+        async with self.page() as (crawler, config):
+            result = await crawler.arun(url=url, config=config)
+        self.pages_rendered += 1
+        return result
+
+    async def _restart(self, browser: int):
+        old = self._crawlers[browser]
+        self._crawlers[browser] = await self._launch()
+        self._uses[browser] = 0
+        self.restarts += 1
+        try:
+            await old.close()
+        except Exception as e:
+            print(f"[ERROR] Closing recycled browser failed: {e}")
+
+    async def close(self):
+        crawlers, self._crawlers = self._crawlers, []
+        self._slots = None
+        for crawler in crawlers:
+            try:
+                await crawler.close()
+            except Exception as e:
+                print(f"[ERROR] Closing browser failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "browsers": len(self._crawlers),
+            "pages_per_browser": self.pages_per_browser,
+            "pages_rendered": self.pages_rendered,
+            "restarts": self.restarts,
+        }
@@ -0,0 +1,125 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, List
+
+
+class ChunkStore:
+    """
+    Chunk texts keyed by (doc_id, vector id), zlib-compressed in SQLite.
+
+    Vectors only carry the small fields queries filter on; the text, its
+    heading path and its position in the page (start/end character offsets,
+    see chunk_markdown) live here and are fetched in one batch for the top-k
+    matches of a query.
+    """
+
+    def __init__(self, path: str, level: int = 6):
+        self.path = path
+        self.level = level
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " doc_id TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " source_url TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL,"
+            " heading TEXT,"
+            " start INTEGER,"
+            " end INTEGER,"
+            " size INTEGER NOT NULL,"
+            " text BLOB NOT NULL,"
+            " PRIMARY KEY (doc_id, id))"
+        )
+
+    def put_many(self, records: List[dict]):
+        """
+        Store records of the form {"doc_id", "id", "source_url", "chunk_index",
+        "text"} with optional "heading", "start" and "end". Existing ids are replaced.
+        """
+        rows = []
+        for record in records:
+            raw = record["text"].encode("utf-8")
+            rows.append((
+                record["doc_id"], record["id"], record["source_url"], record["chunk_index"],
+                record.get("heading"), record.get("start"), record.get("end"),
+                len(raw), zlib.compress(raw, self.level),
+            ))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks"
+                " (doc_id, id, source_url, chunk_index, heading, start, end, size, text)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+
+    def get_many(self, doc_id: str, ids: List[str]) -> Dict[str, dict]:
+        """The stored chunks of doc_id among ids, by id. Missing ids are left out."""
+        found = {}
+        unique_ids = list(dict.fromkeys(ids))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for start in range(0, len(unique_ids), 500):
+                part = unique_ids[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                found.update(
+                    (row[0], row) for row in self._conn.execute(
+                        "SELECT id, source_url, chunk_index, heading, start, end, text FROM chunks"
+                        f" WHERE doc_id = ? AND id IN ({placeholders})",
+                        [doc_id, *part],
+                    )
+                )
+        return {
+            vector_id: {
+                "id": vector_id,
+                "source_url": source_url,
+                "chunk_index": chunk_index,
+                "heading": heading,
+                "start": start,
+                "end": end,
+                "text": zlib.decompress(blob).decode("utf-8"),
+            }
+            for vector_id, (_, source_url, chunk_index, heading, start, end, blob) in found.items()
+        }
+
+    def delete(self, doc_id: str, ids: List[str]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE doc_id = ? AND id = ?", [(doc_id, vector_id) for vector_id in ids]
+            )
+            self._conn.execute("COMMIT")
+
+    def delete_doc(self, doc_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, text_bytes, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(text)), 0) FROM chunks"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "text_bytes": text_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": round(text_bytes / stored_bytes, 2) if stored_bytes else 0.0,
+        }
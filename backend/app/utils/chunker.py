@@ -0,0 +1,248 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable, Iterator, List, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with our crawl4ai install
+    tiktoken = None
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = "cl100k_base") -> Callable[[str], int]:
+    """
+    Token counter for the embedding model (cl100k_base is the encoding of
+    text-embedding-ada-002). Falls back to a word/punctuation estimate when
+    tiktoken is not installed or its encoding file can't be loaded (it is
+    downloaded on first use).
+    """
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.get_encoding(encoding_name)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            print(f"[INFO] tiktoken encoding {encoding_name} unavailable, estimating tokens: {e}")
+    return lambda text: len(APPROX_TOKEN_RE.findall(text))
+
+
+def split_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """Splits the provided text into overlapping chunks by words."""
+    words = text.split()
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = min(start + chunk_size, len(words))
+        chunk = " ".join(words[start:end])
+        chunks.append(chunk)
+        start += (chunk_size - overlap)
+    return chunks
+
+
+def _iter_lines(text: str) -> Iterator[str]:
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
+def _iter_blocks(text: str) -> Iterator[Tuple[str, str, int]]:
+    """
+    Split markdown into blocks: ("heading", line, level), ("code", fenced
+    block, 0) and ("text", paragraph, 0). Code fences are never broken here.
+    """
+    paragraph: List[str] = []
+    fence = None
+    code: List[str] = []
+    for line in _iter_lines(text):
+        if fence is not None:
+            code.append(line)
+            if line.strip().startswith(fence):
+                yield "code", "\n".join(code), 0
+                fence, code = None, []
+            continue
+        fence_match = FENCE_RE.match(line)
+        heading_match = HEADING_RE.match(line)
+        if fence_match or heading_match or not line.strip():
+            if paragraph:
+                yield "text", "\n".join(paragraph), 0
+                paragraph = []
+        if fence_match:
+            fence = fence_match.group(1)
+            code = [line]
+        elif heading_match:
+            yield "heading", line.strip(), len(heading_match.group(1))
+        elif line.strip():
+            paragraph.append(line)
+    if code:
+        # Unterminated fence: keep what we have.
+        yield "code", "\n".join(code), 0
+    if paragraph:
+        yield "text", "\n".join(paragraph), 0
+
+
+def block_text(text: str) -> str:
+    """The blocks of a markdown page joined by blank lines, which chunk offsets refer to."""
+    return "\n\n".join(block for _, block, _ in _iter_blocks(text))
+
+
+def _split_words(line: str, base: int, max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+    """
+    Split one line that exceeds the budget at spaces. Tokens are counted word
+    by word, so the line is tokenized once in total.
+    """
+    start = end = position = size = 0
+    for word in line.split(" "):
+        word_tokens = count_tokens(word)
+        if size + word_tokens > max_tokens and end > start:
+            yield line[start:end], base + start
+            start, size = position, 0
+        size += word_tokens
+        position += len(word) + 1
+        end = position - 1
+    if end > start:
+        yield line[start:end], base + start
+
+
+def _split_oversized(block: str, max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+    """
+    Split one block that exceeds the budget, by lines first and words last.
+    Yields (part, offset of the part in block); every part is a slice of
+    block, so consecutive parts are separated by the newline or space they
+    were split at.
+    """
+    start = end = None  # range of the lines collected so far
+    size = 0
+    line_start = 0
+    for line in block.split("\n"):
+        line_end = line_start + len(line)
+        line_tokens = count_tokens(line)
+        if line_tokens > max_tokens:
+            if start is not None:
+                yield block[start:end], start
+                start, size = None, 0
+            yield from _split_words(line, line_start, max_tokens, count_tokens)
+        else:
+            if size + line_tokens > max_tokens and start is not None:
+                yield block[start:end], start
+                start, size = None, 0
+            if start is None:
+                start = line_start
+            end = line_end
+            size += line_tokens
+        line_start = line_end + 1
+    if start is not None:
+        yield block[start:end], start
+
+
+def chunk_markdown(
+    text: str,
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    min_tokens: int = 48,
+    count_tokens: Callable[[str], int] = None,
+) -> Iterator[dict]:
+    """
+    Lazily split markdown into chunks of at most max_tokens tokens.
+
+    Chunks end at heading boundaries when possible (sections shorter than
+    min_tokens are merged into the next one), fenced code blocks are kept
+    whole unless a single block is larger than the budget, and every chunk
+    carries the heading path it starts under ("Guide > Auth > Tokens").
+    Up to overlap_tokens of trailing blocks from the previous chunk in the
+    same section are repeated at the start of the next one.
+
+    Yields dicts: {"text", "heading", "tokens", "start", "end"}. start and end
+    are the chunk's character offsets in the page's block text (all blocks
+    joined by blank lines, see block_text()), so text == block_text[start:end]
+    and the overlap of two chunks of a page is where their ranges intersect.
+    """
+    count_tokens = count_tokens or get_token_counter()
+    headings: List[Tuple[int, str]] = []
+    # (block or part of one, tokens, offset, separator before it in the block text)
+    current: List[Tuple[str, int, int, str]] = []
+    current_tokens = 0
+    position = 0  # offset of the next block in the block text
+    chunk_heading = None  # heading path where the chunk's new content starts
+    only_headings = True  # current holds nothing but heading lines so far
+
+    def heading_path() -> str:
+        return " > ".join(title for _, title in headings)
+
+    def flush(keep_overlap: bool) -> Iterator[dict]:
+        nonlocal current, current_tokens, chunk_heading, only_headings
+        if current and chunk_heading is not None:
+            yield {
+                "text": current[0][0] + "".join(separator + block for block, _, _, separator in current[1:]),
+                "heading": chunk_heading,
+                "tokens": current_tokens,
+                "start": current[0][2],
+                "end": current[-1][2] + len(current[-1][0]),
+            }
+        # Keep trailing blocks as overlap for the next chunk.
+        kept: List[Tuple[str, int, int, str]] = []
+        kept_tokens = 0
+        for entry in reversed(current if keep_overlap else []):
+            if kept_tokens + entry[1] > overlap_tokens:
+                break
+            kept.insert(0, entry)
+            kept_tokens += entry[1]
+        current, current_tokens = kept, kept_tokens
+        chunk_heading = None
+        only_headings = not kept
+
+    def add(block: str, tokens: int, is_heading: bool, offset: int, separator: str = "\n\n"):
+        nonlocal current_tokens, chunk_heading, only_headings
+        current.append((block, tokens, offset, separator))
+        current_tokens += tokens
+        if chunk_heading is None:
+            chunk_heading = heading_path()
+        only_headings = only_headings and is_heading
+
+    for kind, block, level in _iter_blocks(text):
+        if kind == "heading":
+            if current_tokens >= min_tokens and not only_headings:
+                yield from flush(keep_overlap=False)
+            title = HEADING_RE.match(block).group(2)
+            headings = [(lvl, t) for lvl, t in headings if lvl < level] + [(level, title)]
+        block_start = position
+        position += len(block) + 2
+        block_tokens = count_tokens(block)
+        if current_tokens + block_tokens <= max_tokens:
+            add(block, block_tokens, kind == "heading", block_start)
+            continue
+        if not only_headings and current_tokens >= min_tokens:
+            yield from flush(keep_overlap=True)
+        # Whatever is left in current (overlap, headings or a short section)
+        # stays in front of the block, so only split the block if it still
+        # doesn't fit.
+        budget = max_tokens - current_tokens
+        if block_tokens <= budget:
+            add(block, block_tokens, kind == "heading", block_start)
+            continue
+        if budget < max_tokens // 2:
+            yield from flush(keep_overlap=False)
+            budget = max_tokens
+        previous_end = None
+        for part, offset in _split_oversized(block, budget, count_tokens):
+            part_tokens = count_tokens(part)
+            if current_tokens + part_tokens > max_tokens and not only_headings:
+                yield from flush(keep_overlap=False)
+            separator = "\n\n" if previous_end is None else block[previous_end:offset]
+            add(part, part_tokens, False, block_start + offset, separator)
+            previous_end = offset + len(part)
+    yield from flush(keep_overlap=False)
@@ -0,0 +1,93 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import inspect
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional
+
+
+class Clients:
+    """
+    External service clients, each created by its factory on first use and
+    then cached. Importing the app or starting a worker therefore makes no
+    network calls, and a service that is down only fails the requests that
+    need it; a factory that raised is simply called again next time.
+
+    Clients in loop_factories (async clients whose connection pool belongs to
+    one event loop) are cached per running event loop instead.
+
+    Assigning an attribute (clients.vector_store = ...) replaces that client,
+    which is how the benchmarks plug in local stand-ins. Assigned clients
+    belong to whoever assigned them, so aclose() leaves them alone.
+    """
+
+    def __init__(
+        self,
+        factories: Dict[str, Callable[[], Any]],
+        loop_factories: Optional[Dict[str, Callable[[], Any]]] = None,
+    ):
+        self._factories = factories
+        self._loop_factories = loop_factories or {}
+        self._created = set()
+        self._locks = {name: threading.Lock() for name in list(self._factories) + list(self._loop_factories)}
+        self._per_loop: Dict[str, weakref.WeakKeyDictionary] = {
+            name: weakref.WeakKeyDictionary() for name in self._loop_factories
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for clients that were not created (or assigned) yet.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._loop_factories:
+            return self._for_loop(name)
+        if name not in self._factories:
+            raise AttributeError(f"No client named {name}")
+        with self._locks[name]:
+            if name not in self.__dict__:
+                self.__dict__[name] = self._factories[name]()
+                self._created.add(name)
+                print(f"[INFO] Created {name} client.")
+        return self.__dict__[name]
+
+    def _for_loop(self, name: str) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._locks[name]:
+            client = self._per_loop[name].get(loop)
+            if client is None:
+                client = self._per_loop[name][loop] = self._loop_factories[name]()
+        return client
+
+    def created(self) -> Dict[str, Any]:
+        return {name: self.__dict__[name] for name in self._created if name in self.__dict__}
+
+    def preload(self, *names: str):
+        """Create the given clients now (e.g. in the background at startup), logging failures."""
+        for name in names:
+            try:
+                getattr(self, name)
+            except Exception as e:
+                print(f"[ERROR] Creating {name} client failed, will retry on first use: {e}")
+
+    async def aclose(self):
+        """Close every created client that has a close() or aclose(), including this loop's async ones."""
+        loop = asyncio.get_running_loop()
+        instances = [self.__dict__.pop(name) for name in list(self.created())]
+        self._created.clear()
+        instances += [per_loop.pop(loop) for per_loop in self._per_loop.values() if loop in per_loop]
+        for client in instances:
+            close = getattr(client, "aclose", None) or getattr(client, "close", None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"[ERROR] Closing {type(client).__name__} failed: {e}")
@@ -0,0 +1,247 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.utils.chunker import FENCE_RE, get_token_counter
+from app.utils.dedup import exact_hash
+
+WORD_RE = re.compile(r"\w{3,}")
+NON_SPACE_RE = re.compile(r"\S+")
+BLOCK_SEPARATOR = "\n\n"
+GAP_MARKER = "\n\n[...]\n\n"
+# Blocks shorter than this (headings, "Example:") may repeat between passages.
+MIN_DUPLICATE_CHARS = 40
+
+
+def format_passage(passage: dict) -> str:
+    """One passage as it appears in the prompt."""
+    lines = [f"Source: {passage['source_url']}"]
+    if passage.get("heading"):
+        lines.append(f"Section: {passage['heading']}")
+    lines.append(f"Content: {passage['text']}")
+    return "\n".join(lines)
+
+
+def _blocks(text: str) -> List[str]:
+    """Split text at blank lines, keeping fenced code blocks whole."""
+    blocks, current, fence = [], [], None
+    for line in text.split("\n"):
+        match = FENCE_RE.match(line)
+        if match:
+            marker = match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        if not line.strip() and fence is None:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _text_overlap(first: str, second: str, probe: int = 64) -> int:
+    """
+    Length of the longest end of first that second starts with, for chunks
+    without offsets (split_text repeats the last words of a chunk at the
+    start of the next one). 0 when they don't overlap.
+    """
+    head = second[:probe]
+    if not head:
+        return 0
+    index = first.find(head)
+    while index != -1:
+        if second.startswith(first[index:]):
+            return len(first) - index
+        index = first.find(head, index + 1)
+    return 0
+
+
+def _merge_run(chunks: List[dict]) -> List[dict]:
+    """Merge the chunks of one source_url that overlap or follow each other."""
+    with_offsets = sorted(
+        (c for c in chunks if c.get("start") is not None and c.get("end") is not None),
+        key=lambda c: (c["start"], c["end"]),
+    )
+    without = sorted(
+        (c for c in chunks if c.get("start") is None or c.get("end") is None),
+        key=lambda c: c.get("chunk_index") or 0,
+    )
+    passages: List[dict] = []
+    for chunk in with_offsets:
+        last = passages[-1] if passages else None
+        # Chunks of a page are slices of its block text, so offsets tell
+        # overlap (start < end) and adjacency (only the separator between).
+        if last is not None and chunk["start"] <= last["end"] + len(BLOCK_SEPARATOR):
+            if chunk["end"] > last["end"]:
+                if chunk["start"] >= last["end"]:
+                    last["text"] += BLOCK_SEPARATOR + chunk["text"]
+                else:
+                    last["text"] += chunk["text"][last["end"] - chunk["start"]:]
+                last["end"] = chunk["end"]
+            last["score"] = max(last["score"], chunk["score"])
+            last["chunks"] += 1
+            continue
+        passages.append({**chunk, "chunks": 1})
+    for chunk in without:
+        last = passages[-1] if passages and passages[-1].get("start") is None else None
+        if last is not None and chunk.get("chunk_index") is not None \
+                and chunk["chunk_index"] == last["chunk_index"] + 1:
+            overlap = _text_overlap(last["text"], chunk["text"])
+            if overlap:
+                last["text"] += chunk["text"][overlap:]
+                last["chunk_index"] = chunk["chunk_index"]
+                last["score"] = max(last["score"], chunk["score"])
+                last["chunks"] += 1
+                continue
+        passages.append({**chunk, "chunks": 1})
+    return passages
+
+
+def merge_passages(docs: List[dict]) -> List[dict]:
+    """
+    Retrieved chunks as passages: chunks of the same source_url (in the same
+    doc_id, when they come from several) that overlap or are adjacent become
+    one passage, scored by its best chunk. Passages are ranked by score, best
+    first.
+    """
+    by_url: Dict[Tuple[Optional[str], str], List[dict]] = {}
+    for doc in docs:
+        chunk = {**doc, "score": doc.get("score") or 0.0}
+        by_url.setdefault((doc.get("doc_id"), doc["source_url"]), []).append(chunk)
+    passages = [passage for chunks in by_url.values() for passage in _merge_run(chunks)]
+    passages.sort(key=lambda p: p["score"], reverse=True)
+    return passages
+
+
+def _drop_seen_blocks(blocks: List[str], seen: Set[str]) -> List[str]:
+    """Blocks not already used by a better passage; records the kept ones in seen."""
+    kept = []
+    for block in blocks:
+        if len(block) >= MIN_DUPLICATE_CHARS:
+            digest = exact_hash(block)
+            if digest in seen:
+                continue
+            seen.add(digest)
+        kept.append(block)
+    return kept
+
+
+def _truncate(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """The longest prefix of text, cut between words, of at most max_tokens tokens."""
+    ends = [match.end() for match in NON_SPACE_RE.finditer(text)]
+    low, high = 0, len(ends)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:ends[middle - 1]]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:ends[low - 1]] if low else ""
+
+
+def _fit_blocks(
+    blocks: List[str],
+    max_tokens: int,
+    terms: Set[str],
+    count_tokens: Callable[[str], int],
+) -> Tuple[str, bool]:
+    """
+    Text of the blocks that fit in max_tokens, preferring blocks that share
+    the most words with the query and keeping them in page order. Returns
+    the text and whether anything was left out.
+    """
+    sizes = [count_tokens(block) + 1 for block in blocks]  # +1 for the separator
+    if sum(sizes) <= max_tokens:
+        return BLOCK_SEPARATOR.join(blocks), False
+    relevance = [len(terms & set(WORD_RE.findall(block.lower()))) for block in blocks]
+    order = sorted(range(len(blocks)), key=lambda i: (-relevance[i], i))
+    chosen, used = [], 0
+    for i in order:
+        if used + sizes[i] <= max_tokens:
+            chosen.append(i)
+            used += sizes[i]
+    if not chosen:
+        # Not even one whole block fits: keep the start of the most relevant one.
+        return _truncate(blocks[order[0]], max_tokens, count_tokens), True
+    chosen.sort()
+    parts = [blocks[chosen[0]]]
+    for previous, i in zip(chosen, chosen[1:]):
+        parts.append((BLOCK_SEPARATOR if i == previous + 1 else GAP_MARKER) + blocks[i])
+    return "".join(parts), True
+
+
+def iter_packed(
+    passages: List[dict],
+    max_tokens: int,
+    query: str,
+    count_tokens: Callable[[str], int],
+    min_tokens: int,
+) -> Iterator[dict]:
+    """Passages in rank order, deduplicated and trimmed to fit max_tokens together."""
+    terms = set(WORD_RE.findall(query.lower()))
+    seen: Set[str] = set()
+    remaining = max_tokens
+    for passage in passages:
+        blocks = _drop_seen_blocks(_blocks(passage["text"]), seen)
+        if not blocks:
+            continue
+        frame = count_tokens(format_passage({**passage, "text": ""})) + 2
+        if remaining - frame < min_tokens:
+            continue
+        text, trimmed = _fit_blocks(blocks, remaining - frame, terms, count_tokens)
+        if not text:
+            continue
+        packed = {**passage, "text": text, "trimmed": trimmed}
+        packed["tokens"] = count_tokens(format_passage(packed))
+        if packed["tokens"] > remaining:
+            # Block sizes were counted one by one; the joined text came out longer.
+            packed["text"] = _truncate(text, remaining - frame - (packed["tokens"] - remaining), count_tokens)
+            packed["trimmed"] = True
+            packed["tokens"] = count_tokens(format_passage(packed))
+            if not packed["text"] or packed["tokens"] > remaining:
+                continue
+        remaining -= packed["tokens"] + 1
+        yield packed
+
+
+def pack_context(
+    docs: List[dict],
+    max_tokens: int,
+    query: str = "",
+    count_tokens: Optional[Callable[[str], int]] = None,
+    min_tokens: int = 32,
+) -> dict:
+    """
+    Assemble retrieved chunks into prompt context of at most max_tokens.
+
+    Overlapping and adjacent chunks of a page are merged (see merge_passages),
+    blocks a better-ranked passage already contains are dropped, and passages
+    are added best first. A passage that doesn't fit whole keeps the blocks
+    sharing the most words with the query; passages with room for fewer than
+    min_tokens of content are skipped.
+
+    Returns {"text", "passages", "tokens", "chunks"}, where tokens counts the
+    whole context text with count_tokens (the chat model's tokenizer) and
+    chunks is the number of retrieved chunks it was built from.
+    """
+    count_tokens = count_tokens or get_token_counter()
+    passages = list(iter_packed(merge_passages(docs), max_tokens, query, count_tokens, min_tokens))
+    text = "\n\n".join(format_passage(passage) for passage in passages)
+    return {
+        "text": text,
+        "passages": passages,
+        "tokens": count_tokens(text) if text else 0,
+        "chunks": len(docs),
+    }
@@ -0,0 +1,157 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+PAGE_FIELDS = (
+    "lastmod", "etag", "last_modified", "content_hash", "chunk_count", "dedup_hash", "simhash", "canonical_url"
+)
+
+
+class CrawlStateStore:
+    """
+    Per-URL fetch metadata for each doc_id, used by incremental re-crawls.
+
+    For every page we remember the sitemap <lastmod>, the ETag and
+    Last-Modified validators from the last fetch, a hash of the extracted
+    markdown and how many chunks the page produced (so stale url#chunk_index
+    vectors can be deleted when a page shrinks or disappears).
+
+    Pages that duplicate another page are stored with canonical_url set and
+    no vectors of their own; duplicate chunks are kept as chunk aliases that
+    map their url#chunk_index id to the canonical vector id (see
+    app/utils/dedup.py).
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " doc_id TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " lastmod TEXT,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " content_hash TEXT,"
+            " chunk_count INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (doc_id, url))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pages)")}
+        for column in ("dedup_hash", "simhash", "canonical_url"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE pages ADD COLUMN {column} TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_aliases ("
+            " doc_id TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " alias_id TEXT NOT NULL,"
+            " canonical_id TEXT NOT NULL,"
+            " PRIMARY KEY (doc_id, alias_id))"
+        )
+
+    def get_pages(self, doc_id: str) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT url, {', '.join(PAGE_FIELDS)} FROM pages WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        return {row[0]: dict(zip(PAGE_FIELDS, row[1:])) for row in rows}
+
+    def save_page(self, doc_id: str, url: str, **fields):
+        """Insert or update the record for one page. Only the given fields change."""
+        unknown = set(fields) - set(PAGE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown page fields: {sorted(unknown)}")
+        columns = ["doc_id", "url", "updated_at"] + list(fields)
+        values = [doc_id, url, time.time()] + list(fields.values())
+        updates = ", ".join(f"{col} = excluded.{col}" for col in columns[2:])
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO pages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (doc_id, url) DO UPDATE SET {updates}",
+                values,
+            )
+
+    def delete_pages(self, doc_id: str, urls: List[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM pages WHERE doc_id = ? AND url = ?", [(doc_id, url) for url in urls]
+            )
+            self._conn.executemany(
+                "DELETE FROM chunk_aliases WHERE doc_id = ? AND url = ?", [(doc_id, url) for url in urls]
+            )
+
+    def delete_doc(self, doc_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM chunk_aliases WHERE doc_id = ?", (doc_id,))
+
+    def set_chunk_aliases(self, doc_id: str, url: str, aliases: Dict[str, str]):
+        """Replace the chunk aliases of url with {alias vector id: canonical vector id}."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunk_aliases WHERE doc_id = ? AND url = ?", (doc_id, url))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_aliases (doc_id, url, alias_id, canonical_id) VALUES (?, ?, ?, ?)",
+                [(doc_id, url, alias_id, canonical_id) for alias_id, canonical_id in aliases.items()],
+            )
+
+    def get_chunk_aliases(self, doc_id: str) -> Dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT alias_id, canonical_id FROM chunk_aliases WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        return dict(rows)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def header_value(headers: Optional[dict], name: str) -> Optional[str]:
+    """Case-insensitive header lookup on a plain dict."""
+    if not headers:
+        return None
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+async def is_modified(client: httpx.AsyncClient, url: str, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """
+    Send a conditional GET using the stored validators. Returns False only
+    when the server answers 304 Not Modified; the body is never downloaded.
+    Only for pages rendered in the browser, which can't revalidate itself;
+    plain fetches send the validators with the real GET (scraper.fetch_page).
+    """
+    if not etag and not last_modified:
+        return True
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            return response.status_code != 304
+    except httpx.HTTPError as e:
+        print(f"[INFO] Conditional GET failed for {url}, re-crawling: {e}")
+        return True
@@ -0,0 +1,225 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import hashlib
+import re
+import threading
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+WORD_RE = re.compile(r"\w+")
+SIMHASH_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    """Lowercased words only, so whitespace and markup differences don't matter."""
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def exact_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str, shingle_size: int = 3) -> Optional[int]:
+    """
+    64-bit SimHash over word shingles. Texts that share most of their
+    shingles get hashes within a small Hamming distance of each other.
+    Returns None for texts too short to fingerprint reliably.
+    """
+    import numpy as np  # only crawls need it, not the query path (exact_hash)
+
+    words = WORD_RE.findall(text.lower())
+    if len(words) < shingle_size * 4:
+        return None
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    bits = np.unpackbits(hashes.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1)
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    LSH index for near-duplicate lookups by Hamming distance. The 64 bits
+    are split into max_distance + 1 bands: two hashes within max_distance
+    bits of each other agree exactly on at least one band, so only keys
+    sharing a band are compared.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self._band_bits = -(-SIMHASH_BITS // self.bands)
+        self._buckets: List[Dict[int, Set[Hashable]]] = [{} for _ in range(self.bands)]
+        self._hashes: Dict[Hashable, int] = {}
+
+    def _band_values(self, value: int) -> List[int]:
+        mask = (1 << self._band_bits) - 1
+        return [(value >> (band * self._band_bits)) & mask for band in range(self.bands)]
+
+    def add(self, key: Hashable, value: int):
+        self.remove(key)
+        self._hashes[key] = value
+        for band, band_value in enumerate(self._band_values(value)):
+            self._buckets[band].setdefault(band_value, set()).add(key)
+
+    def remove(self, key: Hashable):
+        value = self._hashes.pop(key, None)
+        if value is None:
+            return
+        for band, band_value in enumerate(self._band_values(value)):
+            bucket = self._buckets[band].get(band_value)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_value]
+
+    def find(self, value: int, exclude: Optional[Hashable] = None) -> Optional[Hashable]:
+        """Closest key within max_distance of value, if any."""
+        best, best_distance = None, self.max_distance + 1
+        for band, band_value in enumerate(self._band_values(value)):
+            for key in self._buckets[band].get(band_value, ()):
+                if key == exclude:
+                    continue
+                distance = hamming(value, self._hashes[key])
+                if distance < best_distance:
+                    best, best_distance = key, distance
+        return best
+
+
+class _Fingerprints:
+    """Exact hashes plus a SimHash index, keyed by page URL or vector id."""
+
+    def __init__(self, max_distance: int):
+        self.exact: Dict[str, Hashable] = {}
+        self.exact_by_key: Dict[Hashable, str] = {}
+        self.near = SimHashIndex(max_distance)
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def forget(self, key: Hashable):
+        digest = self.exact_by_key.pop(key, None)
+        if digest is not None and self.exact.get(digest) == key:
+            del self.exact[digest]
+        self.near.remove(key)
+
+    def check(self, key: Hashable, digest: str, fingerprint: Optional[int], count: bool = True) -> Optional[Hashable]:
+        """Return the canonical key this one duplicates, or register it as canonical."""
+        self.forget(key)
+        if count:
+            self.seen += 1
+        canonical = self.exact.get(digest)
+        if canonical is not None:
+            if count:
+                self.exact_duplicates += 1
+            return canonical
+        if fingerprint is not None:
+            canonical = self.near.find(fingerprint, exclude=key)
+            if canonical is not None:
+                if count:
+                    self.near_duplicates += 1
+                return canonical
+        self.exact[digest] = key
+        self.exact_by_key[key] = digest
+        if fingerprint is not None:
+            self.near.add(key, fingerprint)
+        return None
+
+    def stats(self) -> dict:
+        duplicates = self.exact_duplicates + self.near_duplicates
+        return {
+            "seen": self.seen,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "dedup_ratio": round(duplicates / self.seen, 4) if self.seen else 0.0,
+        }
+
+
+class Deduplicator:
+    """
+    Page and chunk deduplication for one ingestion run of a doc_id.
+
+    A page or chunk is a duplicate when its normalized text hashes the same
+    as one seen before (exact), or when its SimHash is within max_distance
+    bits of one seen before (near). The first one seen is the canonical copy;
+    later copies are reported with the key of the canonical one so callers
+    can store them as aliases instead of embedding them again.
+
+    Every check of a page or its chunks is stamped with a logical clock (see
+    checked_at), so callers can tell whether a page was decided a duplicate
+    before or after the page it duplicates was registered with new content.
+
+    Methods are thread-safe, so they can run on the chunking thread pool.
+    """
+
+    def __init__(self, max_distance: int = 3, chunks: bool = True):
+        self.chunks_enabled = chunks
+        self._pages = _Fingerprints(max_distance)
+        self._chunks = _Fingerprints(max_distance)
+        self._lock = threading.Lock()
+        self._clock = 0
+        self._checked_at: Dict[str, int] = {}
+
+    @staticmethod
+    def fingerprint(text: str) -> Tuple[str, Optional[int]]:
+        return exact_hash(text), simhash(text)
+
+    def seed_page(self, url: str, digest: str, fingerprint: Optional[int]):
+        """Register a page ingested by an earlier run as a canonical copy."""
+        with self._lock:
+            self._pages.check(url, digest, fingerprint, count=False)
+
+    def check_page(self, url: str, text: str) -> Tuple[Optional[str], str, Optional[int]]:
+        """Returns (canonical url or None, exact hash, simhash) for a page's markdown."""
+        digest, fingerprint = self.fingerprint(text)
+        with self._lock:
+            self._stamp(url)
+            return self._pages.check(url, digest, fingerprint), digest, fingerprint
+
+    def forget_page(self, url: str):
+        with self._lock:
+            self._pages.forget(url)
+            self._checked_at.pop(url, None)
+
+    def check_chunks(self, ids: List[str], texts: List[str], url: Optional[str] = None) -> Dict[str, str]:
+        """
+        Returns {duplicate vector id: canonical vector id} for one page's
+        chunks. With url, the check is stamped as that page's latest.
+        """
+        if not self.chunks_enabled:
+            return {}
+        fingerprints = [self.fingerprint(text) for text in texts]
+        aliases = {}
+        with self._lock:
+            if url is not None:
+                self._stamp(url)
+            for vector_id, (digest, fingerprint) in zip(ids, fingerprints):
+                canonical = self._chunks.check(vector_id, digest, fingerprint)
+                if canonical is not None:
+                    aliases[vector_id] = canonical
+        return aliases
+
+    def _stamp(self, url: str):
+        self._clock += 1
+        self._checked_at[url] = self._clock
+
+    def checked_at(self, url: str) -> int:
+        """Logical time of the latest check of url's page or chunks; 0 if never checked."""
+        with self._lock:
+            return self._checked_at.get(url, 0)
+
+    def stats(self) -> dict:
+        return {"pages": self._pages.stats(), "chunks": self._chunks.stats()}
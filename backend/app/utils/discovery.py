@@ -0,0 +1,220 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import itertools
+import re
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+USER_AGENT = "DocsAssistantCrawler/1.0"
+
+# A regex over the raw HTML is several times faster than building a parse tree
+# and is all we need to pull links out of a page.
+HREF_RE = re.compile(rb"""<a\s[^>]*?href\s*=\s*["']?([^"'\s>]+)""", re.IGNORECASE)
+BASE_HREF_RE = re.compile(rb"""<base\s[^>]*?href\s*=\s*["']?([^"'\s>]+)""", re.IGNORECASE)
+
+SKIP_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".json",
+    ".xml", ".pdf", ".zip", ".gz", ".tar", ".mp4", ".mp3", ".woff", ".woff2", ".ttf",
+)
+
+
+def normalize_url(url: str, keep_query: bool = False, strip_slash: bool = True) -> str:
+    """
+    Canonical form used for de-duplication: lowercase scheme and host, no
+    default port, no fragment, no trailing slash (except the root), and no
+    query string unless keep_query is set.
+
+    With strip_slash=False the trailing slash is kept, which is the form we
+    actually fetch: relative links on "/docs/" and "/docs" resolve differently.
+    """
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parsed.path or "/"
+    if strip_slash and len(path) > 1:
+        path = path.rstrip("/")
+    query = parsed.query if keep_query else ""
+    return urlunparse((scheme, netloc, path, "", query, ""))
+
+
+def extract_links(html: bytes, page_url: str) -> List[str]:
+    """Return the absolute URLs of all <a href> links in a page."""
+    base = BASE_HREF_RE.search(html)
+    base_url = urljoin(page_url, base.group(1).decode("utf-8", "ignore")) if base else page_url
+    links = []
+    for match in HREF_RE.finditer(html):
+        href = match.group(1).decode("utf-8", "ignore")
+        if href.startswith(("#", "mailto:", "javascript:", "tel:")):
+            continue
+        links.append(urljoin(base_url, href))
+    return links
+
+
+class RobotsCache:
+    """Fetches and caches robots.txt per host. Missing or broken files allow everything."""
+
+    def __init__(self, client: httpx.AsyncClient, user_agent: str = USER_AGENT):
+        self.client = client
+        self.user_agent = user_agent
+        self._parsers: Dict[str, Optional[RobotFileParser]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def allowed(self, url: str) -> bool:
+        parsed = urlparse(url)
+        root = f"{parsed.scheme}://{parsed.netloc}"
+        lock = self._locks.setdefault(root, asyncio.Lock())
+        async with lock:
+            if root not in self._parsers:
+                self._parsers[root] = await self._fetch(root)
+        parser = self._parsers[root]
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    async def _fetch(self, root: str) -> Optional[RobotFileParser]:
+        try:
+            response = await self.client.get(f"{root}/robots.txt")
+        except httpx.HTTPError:
+            return None
+        if response.status_code != 200:
+            return None
+        parser = RobotFileParser()
+        parser.parse(response.text.splitlines())
+        return parser
+
+
+async def iter_relevant_urls(
+    base_url: str,
+    max_urls: int = 500,
+    max_depth: int = 5,
+    concurrency: int = 16,
+    per_host_concurrency: int = 4,
+    respect_robots: bool = True,
+    keep_query: bool = False,
+    client: Optional[httpx.AsyncClient] = None,
+    status: Optional[dict] = None,
+) -> AsyncIterator[str]:
+    """
+    Breadth-first link discovery under base_url, yielding each relevant URL as
+    soon as it is found so crawling can start before discovery finishes.
+
+    The frontier is a priority queue ordered by depth, so shallow pages are
+    expanded first. Only pages on the same host whose path starts with the
+    base path are followed.
+
+    If a dict is passed as status, status["complete"] tells whether every
+    page within max_depth was found: it stays False if max_urls was reached
+    or a page could not be fetched for another reason than a 4xx answer.
+    """
+    parsed_base = urlparse(normalize_url(base_url))
+    base_path = parsed_base.path.rstrip("/")
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(
+            timeout=10, follow_redirects=True, headers={"User-Agent": USER_AGENT}
+        )
+    robots = RobotsCache(client)
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    frontier: asyncio.PriorityQueue = asyncio.PriorityQueue()
+    found: asyncio.Queue = asyncio.Queue()
+    seen = set()
+    order = itertools.count()
+    done = asyncio.Event()
+    if status is not None:
+        status["complete"] = False
+    complete = True
+
+    def is_relevant(url: str) -> bool:
+        parsed = urlparse(url)
+        return (
+            parsed.scheme in ("http", "https")
+            and parsed.netloc.lower() == parsed_base.netloc
+            and parsed.path.startswith(base_path)
+            and not parsed.path.lower().endswith(SKIP_EXTENSIONS)
+        )
+
+    async def add(link: str, depth: int):
+        key = normalize_url(link, keep_query)
+        if len(seen) >= max_urls or key in seen:
+            return
+        seen.add(key)
+        url = normalize_url(link, keep_query, strip_slash=False)
+        if respect_robots and not await robots.allowed(url):
+            return
+        found.put_nowait(url)
+        if len(seen) >= max_urls:
+            done.set()
+        elif depth < max_depth:
+            frontier.put_nowait((depth, next(order), url))
+
+    async def fetch(url: str) -> Optional[httpx.Response]:
+        host = urlparse(url).netloc
+        limit = host_limits.setdefault(host, asyncio.Semaphore(per_host_concurrency))
+        async with limit:
+            response = await client.get(url)
+        response.raise_for_status()
+        if "html" not in response.headers.get("content-type", "html"):
+            return None
+        return response
+
+    async def worker():
+        nonlocal complete
+        while True:
+            depth, _, url = await frontier.get()
+            try:
+                if not done.is_set():
+                    response = await fetch(url)
+                    if response is not None:
+                        # Resolve links against the final URL, after redirects.
+                        for link in extract_links(response.content, str(response.url)):
+                            if is_relevant(link):
+                                await add(link, depth + 1)
+            except Exception as e:
+                print(f"[ERROR] Error fetching {url}: {e}")
+                # A broken link is not a page; anything else may have hidden some.
+                if not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500):
+                    complete = False
+            finally:
+                frontier.task_done()
+
+    async def run():
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            await frontier.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            found.put_nowait(None)
+
+    await add(base_url, 0)
+    runner = asyncio.create_task(run())
+    try:
+        while True:
+            url = await found.get()
+            if url is None:
+                if status is not None:
+                    status["complete"] = complete and not done.is_set()
+                break
+            yield url
+    finally:
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        if owns_client:
+            await client.aclose()
+
+
+async def discover_urls(base_url: str, max_urls: int = 500, **kwargs) -> List[str]:
+    """Collect everything iter_relevant_urls finds into a list."""
+    return [url async for url in iter_relevant_urls(base_url, max_urls=max_urls, **kwargs)]
@@ -0,0 +1,222 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import importlib.util
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from app.utils.adaptive import AdaptiveLimiter
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]").
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# HTTP/2 needs the optional h2 package (poetry install --extras http2).
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Raised before the request reached the server, so any method can be retried.
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# The request may have been processed, so only idempotent methods are retried.
+READ_ERRORS = (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full jitter: a random delay between 0 and base * 2^attempt, at most cap."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (delay or HTTP date), if there is one."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def request_host(request: httpx.Request) -> str:
+    return request.url.netloc.decode("ascii")
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees its host slot once it is closed (read to the end or aclose())."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that adds two things to the connection pool of the wrapped
+    transport: a concurrency limit per host (a response counts until its body
+    is closed), and retries with jittered exponential backoff. Connection
+    failures are retried for every method; read errors and 429/502/503/504
+    responses only for retry_methods (the idempotent ones by default).
+    Retry-After is honoured, up to backoff_max.
+
+    Limits are AdaptiveLimiters (see app/utils/adaptive.py) made by
+    limiter_factory(key), one per limiter_key(request) (the host by default).
+    Each response tells its limiter how long the server took to send headers,
+    whether it was rate limited and what the rate-limit headers say. Without a
+    factory every host gets a fixed limit of per_host.
+
+    on_retry(key, reason), if given, is called before every retry; reason is
+    the status code or the exception name. on_response(request, response) is
+    called for every response, retried or not.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        per_host: int = 8,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        retry_methods=IDEMPOTENT_METHODS,
+        on_retry: Optional[Callable[[str, str], None]] = None,
+        limiter_factory: Optional[Callable[[str], AdaptiveLimiter]] = None,
+        limiter_key: Callable[[httpx.Request], str] = request_host,
+        on_response: Optional[Callable[[httpx.Request, httpx.Response], None]] = None,
+    ):
+        self._transport = transport
+        self.per_host = max(1, per_host)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_methods = set(retry_methods)
+        self.on_retry = on_retry
+        self.limiter_factory = limiter_factory or (
+            lambda key: AdaptiveLimiter(key, initial=self.per_host, max_limit=self.per_host, adaptive=False)
+        )
+        self.limiter_key = limiter_key
+        self.on_response = on_response
+        self.limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def limiter(self, key: str) -> AdaptiveLimiter:
+        if key not in self.limiters:
+            self.limiters[key] = self.limiter_factory(key)
+        return self.limiters[key]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = self.limiter_key(request)
+        limiter = self.limiter(key)
+        retryable = request.method in self.retry_methods
+        attempt = 0
+        while True:
+            started = await limiter.acquire()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except CONNECT_ERRORS + READ_ERRORS as e:
+                limiter.release(started, ok=False)
+                if attempt >= self.retries or (isinstance(e, READ_ERRORS) and not retryable):
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                reason = type(e).__name__
+            except BaseException:
+                limiter.release(started, ok=False)
+                raise
+            else:
+                latency = time.monotonic() - started
+                status = response.status_code
+                throttled = status in (429, 503)
+                wait = retry_after(response) if throttled else None
+                limiter.observe_headers(response.headers)
+                if self.on_response is not None:
+                    self.on_response(request, response)
+                outcome = dict(ok=status < 500, throttled=throttled, retry_after=wait, latency=latency)
+                if not (retryable and status in RETRY_STATUSES and attempt < self.retries):
+                    return httpx.Response(
+                        status_code=status,
+                        headers=response.headers,
+                        stream=_ReleasingStream(response.stream, lambda: limiter.release(started, **outcome)),
+                        extensions=response.extensions,
+                        request=request,
+                    )
+                await response.aclose()
+                limiter.release(started, **outcome)
+                delay = min(wait if wait is not None else backoff_delay(attempt, self.backoff_base, self.backoff_max),
+                            self.backoff_max)
+                reason = str(status)
+            attempt += 1
+            if self.on_retry is not None:
+                self.on_retry(key, reason)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def create_async_client(
+    max_connections: int = 100,
+    max_keepalive: int = 20,
+    keepalive_expiry: float = 30.0,
+    per_host: int = 8,
+    timeout: float = 10.0,
+    connect_timeout: float = 5.0,
+    retries: int = 3,
+    retry_methods=IDEMPOTENT_METHODS,
+    on_retry: Optional[Callable[[str, str], None]] = None,
+    limiter_factory: Optional[Callable[[str], AdaptiveLimiter]] = None,
+    limiter_key: Callable[[httpx.Request], str] = request_host,
+    on_response: Optional[Callable[[httpx.Request, httpx.Response], None]] = None,
+    http2: bool = True,
+    **kwargs,
+) -> httpx.AsyncClient:
+    """
+    An AsyncClient on one shared keep-alive pool (see PooledTransport).
+    HTTP/2 is used when asked for, h2 is installed and the server offers it.
+    Other keyword arguments (headers, follow_redirects, ...) go to AsyncClient.
+
+    Like every async client, it belongs to the event loop it is first used on.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=PooledTransport(
+            transport,
+            per_host=per_host,
+            retries=retries,
+            retry_methods=retry_methods,
+            on_retry=on_retry,
+            limiter_factory=limiter_factory,
+            limiter_key=limiter_key,
+            on_response=on_response,
+        ),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        **kwargs,
+    )
+
@@ -0,0 +1,328 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+JOB_FIELDS = (
+    "id", "doc_id", "tenant_id", "kind", "payload", "priority", "status", "cancel_requested",
+    "attempts", "worker_id", "created_at", "started_at", "finished_at", "heartbeat_at",
+    "result", "error",
+)
+
+
+class JobStore:
+    """
+    Durable ingestion job queue in a local SQLite file shared by the API
+    process (which enqueues crawl jobs) and the worker processes (which claim
+    and run them, see app/worker.py). Jobs that can't wait in the queue, like
+    archive uploads streamed by the client, are recorded with start() and run
+    by the process that received them.
+
+    Jobs are claimed by priority (higher first) then age, while keeping at
+    most max_running_per_tenant jobs running for each tenant and at most one
+    for each doc_id, since jobs of the same doc_id write the same crawl state
+    and vectors and would delete each other's pages. Workers record a
+    checkpoint for every finished URL, so a job picked up again after a crash
+    or restart skips the URLs it already finished.
+
+    Workers also store the latest progress snapshot of each doc_id here, which
+    the API streams to clients (see app/utils/progress.py), and their metrics,
+    which the API adds to its own on /metrics (see app/utils/metrics.py).
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " doc_id TEXT NOT NULL,"
+            " tenant_id TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT NOT NULL,"  # queued, running, completed, failed, cancelled
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker_id TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " heartbeat_at REAL,"
+            " result TEXT,"
+            " error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, priority, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_doc ON jobs(doc_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_checkpoints ("
+            " job_id TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " ok INTEGER NOT NULL,"
+            " PRIMARY KEY (job_id, url))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS doc_progress ("
+            " doc_id TEXT PRIMARY KEY,"
+            " snapshot TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS process_metrics ("
+            " source TEXT PRIMARY KEY,"
+            " snapshot TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _row_to_job(self, row) -> dict:
+        job = dict(zip(JOB_FIELDS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(self, doc_id: str, tenant_id: str, payload: dict, kind: str = "crawl", priority: int = 0) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, doc_id, tenant_id, kind, payload, priority, status, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, doc_id, tenant_id, kind, json.dumps(payload), priority, time.time()),
+            )
+        return job_id
+
+    def start(self, doc_id: str, tenant_id: str, payload: dict, kind: str, worker_id: str) -> Optional[str]:
+        """
+        Record a job that is already running in worker_id, outside the queue.
+        Returns None instead if another job of doc_id is queued or running.
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (id, doc_id, tenant_id, kind, payload, status, attempts, worker_id,"
+                " created_at, started_at, heartbeat_at)"
+                " SELECT ?, ?, ?, ?, ?, 'running', 1, ?, ?, ?, ?"
+                " WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE doc_id = ? AND status IN ('queued', 'running'))",
+                (job_id, doc_id, tenant_id, kind, json.dumps(payload), worker_id, now, now, now, doc_id),
+            )
+        return job_id if cursor.rowcount else None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, tenant_id: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = f"SELECT {', '.join(JOB_FIELDS)} FROM jobs"
+        params: tuple = ()
+        if tenant_id:
+            query += " WHERE tenant_id = ?"
+            params = (tenant_id,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim(self, worker_id: str, max_running_per_tenant: int = 1) -> Optional[dict]:
+        """Atomically pick the next runnable job and mark it running."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs AS j WHERE status = 'queued' AND cancel_requested = 0"
+                    " AND (SELECT COUNT(*) FROM jobs AS r"
+                    "      WHERE r.status = 'running' AND r.tenant_id = j.tenant_id) < ?"
+                    " AND NOT EXISTS (SELECT 1 FROM jobs AS d"
+                    "      WHERE d.status = 'running' AND d.doc_id = j.doc_id)"
+                    " ORDER BY priority DESC, created_at ASC LIMIT 1",
+                    (max_running_per_tenant,),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1,"
+                    " started_at = COALESCE(started_at, ?), heartbeat_at = ? WHERE id = ?",
+                    (worker_id, now, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def heartbeat(self, job_id: str) -> bool:
+        """Refresh the job's heartbeat. Returns True if cancellation was requested."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def requeue_stale(self, timeout: float, max_attempts: int = 3) -> int:
+        """
+        Put running crawl jobs whose worker stopped heartbeating back in the
+        queue. A job that already took max_attempts workers down with it fails
+        instead, as do other jobs (see start()), which can't be run again
+        without their client.
+        """
+        cutoff = time.time() - timeout
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?"
+                " WHERE status = 'running' AND heartbeat_at < ? AND cancel_requested = 1",
+                (time.time(), cutoff),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted', finished_at = ?"
+                " WHERE status = 'running' AND heartbeat_at < ? AND kind != 'crawl'",
+                (time.time(), cutoff),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted ' || attempts || ' times', finished_at = ?"
+                " WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (time.time(), cutoff, max_attempts),
+            )
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL"
+                " WHERE status = 'running' AND heartbeat_at < ?",
+                (cutoff,),
+            )
+        return cursor.rowcount
+
+    def release(self, job_id: str):
+        """
+        Hand a running job back to the queue, e.g. when its worker shuts down.
+        That doesn't count as an attempt.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, attempts = attempts - 1"
+                " WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job. Queued jobs are cancelled right away; running jobs are
+        flagged and stop at the worker's next heartbeat. Returns the new status.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+                (job_id,),
+            )
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_priority(self, job_id: str, priority: int) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET priority = ? WHERE id = ? AND status = 'queued'", (priority, job_id)
+            )
+        return cursor.rowcount > 0
+
+    def checkpoint(self, job_id: str, url: str, ok: bool):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_checkpoints (job_id, url, ok) VALUES (?, ?, ?)",
+                (job_id, url, int(ok)),
+            )
+
+    def completed_urls(self, job_id: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url FROM job_checkpoints WHERE job_id = ? AND ok = 1", (job_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def doc_version(self, doc_id: str) -> Optional[float]:
+        """
+        Timestamp of the latest ingestion activity for doc_id. Other processes
+        compare it against what they saw before to drop stale cached results.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(MAX(COALESCE(started_at, 0)), MAX(COALESCE(finished_at, 0)))"
+                " FROM jobs WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchone()
+        return row[0] if row and row[0] else None
+
+    def active_job(self, doc_id: str) -> Optional[dict]:
+        """The oldest queued or running job of doc_id, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE doc_id = ? AND status IN ('queued', 'running')"
+                " ORDER BY created_at ASC LIMIT 1",
+                (doc_id,),
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def latest_job(self, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE doc_id = ? ORDER BY created_at DESC LIMIT 1",
+                (doc_id,),
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def save_progress(self, doc_id: str, snapshot: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO doc_progress (doc_id, snapshot, updated_at) VALUES (?, ?, ?)",
+                (doc_id, json.dumps({**snapshot, "updated_at": now}), now),
+            )
+
+    def get_progress(self, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT snapshot FROM doc_progress WHERE doc_id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def save_metrics(self, source: str, snapshot: dict):
+        """Store the metrics registry snapshot of one worker process, replacing its previous one."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO process_metrics (source, snapshot, updated_at) VALUES (?, ?, ?)",
+                (source, json.dumps(snapshot), time.time()),
+            )
+
+    def get_metrics(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT snapshot FROM process_metrics ORDER BY source").fetchall()
+        return [json.loads(row[0]) for row in rows]
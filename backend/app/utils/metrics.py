@@ -0,0 +1,416 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds, and size buckets for batch-size histograms.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = [[list(map(list, key)), value] for key, value in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "values": values}
+
+
+class Gauge(Counter):
+    """A value per label set that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    """Observation counts per bucket, plus their sum and count, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count in each bucket (not cumulative)..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = [[list(map(list, key)), list(state)] for key, state in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "buckets": list(self.buckets), "values": values}
+
+
+class MetricsRegistry:
+    """
+    The metrics of one process. snapshot() returns them as plain JSON-able
+    data, so worker processes can hand theirs to the API process, which adds
+    them up with combine() and serves the result with render().
+
+    The registry also keeps the last finished traces (see Trace).
+    """
+
+    def __init__(self, trace_history: int = 100, max_spans: int = 200):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.tracing = True
+        self.max_spans = max_spans
+        self.traces: deque = deque(maxlen=trace_history)
+
+    def configure_tracing(self, enabled: bool, history: int, max_spans: int):
+        self.tracing = enabled
+        self.max_spans = max_spans
+        self.traces = deque(self.traces, maxlen=max(1, history))
+
+    def _get_or_create(self, cls, name: str, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def add_trace(self, trace: dict):
+        self.traces.append(trace)
+
+    def recent_traces(self, limit: int = 20, name: Optional[str] = None) -> List[dict]:
+        traces = [t for t in reversed(self.traces) if name is None or t["name"] == name]
+        return traces[:limit]
+
+
+def combine(snapshots: List[dict]) -> dict:
+    """Add up registry snapshots of several processes, label set by label set."""
+    combined: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = combined.get(name)
+            if target is None:
+                target = combined[name] = {**metric, "values": {}}
+            elif target["kind"] != metric["kind"] or target.get("buckets") != metric.get("buckets"):
+                continue
+            for key, value in metric["values"]:
+                key = tuple(map(tuple, key))
+                if metric["kind"] == "histogram":
+                    current = target["values"].get(key)
+                    target["values"][key] = [a + b for a, b in zip(current, value)] if current else list(value)
+                else:
+                    target["values"][key] = target["values"].get(key, 0.0) + value
+    return combined
+
+
+def render(combined: dict) -> str:
+    """The output of combine() in the Prometheus text exposition format."""
+    lines = []
+    for name in sorted(combined):
+        metric = combined[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key in sorted(metric["values"]):
+            value = metric["values"][key]
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            cumulative = 0.0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {_format_value(cumulative)}")
+            lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {_format_value(value[-1])}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(key)} {_format_value(value[-1])}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Tracing ----------------
+
+# (trace, id of the innermost open span) of the code running right now.
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    One /chat request or one crawl job, as a tree of timed spans.
+
+    Spans opened with span() or stage() while the trace is active (see
+    activate()) become children of the innermost open span. The context is
+    inherited by asyncio tasks and asyncio.to_thread, so concurrent pages of
+    a crawl each get their own branch. Only the first max_spans spans are
+    kept, but every span is counted in the per-name summary.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, max_spans: int = 200, keep: bool = True, **attrs):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.max_spans = max_spans
+        self.keep = keep
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: List[dict] = []
+        self.dropped_spans = 0
+        self.summary: Dict[str, dict] = {}
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def new_span_id(self) -> int:
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+        return span_id
+
+    def record(self, name: str, span_id: int, parent_id: int, start: float, duration: float,
+               error: Optional[str] = None, **attrs):
+        duration_ms = duration * 1000
+        with self._lock:
+            entry = self.summary.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            if error:
+                entry["errors"] += 1
+            if len(self.spans) < self.max_spans:
+                self.spans.append({
+                    "id": span_id,
+                    "parent_id": parent_id,
+                    "name": name,
+                    "start_ms": round((start - self._start) * 1000, 3),
+                    "duration_ms": round(duration_ms, 3),
+                    "error": error,
+                    **attrs,
+                })
+            else:
+                self.dropped_spans += 1
+
+    @contextmanager
+    def activate(self) -> Iterator["Trace"]:
+        """Make this trace the parent of spans opened inside the block."""
+        token = _current_span.set((self, 0))
+        try:
+            yield self
+        finally:
+            _current_span.reset(token)
+
+    def finish(self, error: Optional[str] = None) -> dict:
+        """End the trace (once) and keep it in the registry's recent traces."""
+        if self.duration_ms is None:
+            self.duration_ms = round(self.elapsed() * 1000, 3)
+            self.error = error
+            if self.keep and REGISTRY.tracing:
+                REGISTRY.add_trace(self.to_dict())
+        return self.to_dict()
+
+    def to_dict(self, spans: bool = True) -> dict:
+        with self._lock:
+            summary = {
+                name: {**entry, "total_ms": round(entry["total_ms"], 3), "max_ms": round(entry["max_ms"], 3)}
+                for name, entry in self.summary.items()
+            }
+            result = {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_ms": self.duration_ms,
+                "error": self.error,
+                **self.attrs,
+                "summary": summary,
+            }
+            if spans:
+                result["spans"] = list(self.spans)
+                result["dropped_spans"] = self.dropped_spans
+        return result
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, keep: bool = True, **attrs) -> Trace:
+    """A new trace. With tracing turned off only its per-name summary is kept."""
+    return Trace(
+        name, trace_id=trace_id, max_spans=REGISTRY.max_spans if REGISTRY.tracing else 0, keep=keep, **attrs
+    )
+
+
+def current_trace() -> Optional[Trace]:
+    current = _current_span.get()
+    return current[0] if current is not None else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a child span of the current span, if a trace is active."""
+    current = _current_span.get()
+    if current is None:
+        yield
+        return
+    trace, parent_id = current
+    span_id = trace.new_span_id()
+    token = _current_span.set((trace, span_id))
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.record(name, span_id, parent_id, start, time.perf_counter() - start, error, **attrs)
+
+
+# ---------------- Process-wide registry and stage timing ----------------
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("docs_stage_duration_seconds", "Time spent in each ingestion and query stage.")
+STAGE_ERRORS = REGISTRY.counter("docs_stage_errors_total", "Stage calls that raised an exception.")
+
+
+@contextmanager
+def stage(name: str, **attrs):
+    """
+    Time one call of a hot-path stage: observed in docs_stage_duration_seconds
+    and recorded as a span of the current trace. Works around awaits, since
+    the timing only depends on entering and leaving the block.
+    """
+    start = time.perf_counter()
+    try:
+        with span(name, **attrs):
+            yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+def record_stage(name: str, start: float, trace: Optional[Trace] = None, error: Optional[str] = None, **attrs):
+    """
+    Like stage(), for work that can't be wrapped in a with block, such as an
+    async generator that yields in between. start is a time.perf_counter() value.
+    """
+    duration = time.perf_counter() - start
+    STAGE_SECONDS.observe(duration, stage=name)
+    if error:
+        STAGE_ERRORS.inc(stage=name)
+    current = _current_span.get()
+    if trace is None and current is not None:
+        trace, parent_id = current
+    elif trace is not None:
+        parent_id = current[1] if current is not None and current[0] is trace else 0
+    else:
+        return
+    trace.record(name, trace.new_span_id(), parent_id, start, duration, error, **attrs)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records every HTTP request's latency by route
+    template (so /jobs/{job_id} is one series) in
+    docs_http_request_duration_seconds.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.requests = REGISTRY.histogram(
+            "docs_http_request_duration_seconds", "HTTP request latency, until the response body is sent."
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            self.requests.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
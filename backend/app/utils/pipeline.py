@@ -0,0 +1,228 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import contextvars
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+
+class IngestionPipeline:
+    """
+    Staged chunk ingestion: chunks from every page are pushed into a bounded
+    queue, embedded in batches, and the resulting vectors are upserted in bulk.
+
+    embed_fn(texts) -> list of embeddings (same order as texts)
+    upsert_fn(vectors) -> None, where vectors are Pinecone-style dicts
+
+    Either function may be a coroutine function. Blocking functions run on a
+    dedicated thread pool so they never stall the event loop. The embed and
+    upsert stages each run their own number of workers, so both stages overlap
+    with each other and with whatever is producing chunks.
+
+    If on_url_done(url, ok) is given, it is called (on the thread pool) once
+    every chunk of a sealed URL has been upserted, or has failed.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Union[List[List[float]], Awaitable[List[List[float]]]]],
+        upsert_fn: Callable[[List[dict]], Union[None, Awaitable[None]]],
+        embed_batch_size: int = 100,
+        upsert_batch_size: int = 40,
+        flush_interval: float = 1.0,
+        queue_size: int = 1000,
+        embed_concurrency: int = 4,
+        upsert_concurrency: int = 4,
+        on_url_done: Optional[Callable[[str, bool], None]] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.upsert_fn = upsert_fn
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.flush_interval = flush_interval
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.upsert_concurrency = max(1, upsert_concurrency)
+        self.on_url_done = on_url_done
+        self._pending: Dict[str, int] = {}
+        self._sealed: Set[str] = set()
+        self._failed_urls: Set[str] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.embed_concurrency + self.upsert_concurrency,
+            thread_name_prefix="ingest",
+        )
+
+        self._chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._vector_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._embed_tasks: List[asyncio.Task] = []
+        self._upsert_tasks: List[asyncio.Task] = []
+        self._started_at: Optional[float] = None
+
+        self.chunks_queued = 0
+        self.chunks_embedded = 0
+        self.chunks_upserted = 0
+        self.embed_batches = 0
+        self.upsert_batches = 0
+        self.failures: List[dict] = []
+
+    async def start(self):
+        self._started_at = time.perf_counter()
+        self._embed_tasks = [
+            asyncio.create_task(self._embed_stage()) for _ in range(self.embed_concurrency)
+        ]
+        self._upsert_tasks = [
+            asyncio.create_task(self._upsert_stage()) for _ in range(self.upsert_concurrency)
+        ]
+
+    async def put(self, doc_id: str, url: str, chunk_index: int, text: str, **metadata):
+        """
+        Queue a single chunk. Waits when the queue is full (backpressure).
+        Extra keyword arguments are stored as additional vector metadata.
+        """
+        await self._chunk_queue.put({
+            "doc_id": doc_id,
+            "source_url": url,
+            "chunk_index": chunk_index,
+            "text": text,
+            **metadata,
+        })
+        self._pending[url] = self._pending.get(url, 0) + 1
+        self.chunks_queued += 1
+
+    async def seal(self, url: str):
+        """Mark that every chunk of url has been queued."""
+        self._sealed.add(url)
+        if not self._pending.get(url):
+            await self._url_done(url)
+
+    async def close(self) -> dict:
+        """Flush everything that is still queued and return the pipeline stats."""
+        for _ in self._embed_tasks:
+            await self._chunk_queue.put(None)
+        await asyncio.gather(*self._embed_tasks)
+        for _ in self._upsert_tasks:
+            await self._vector_queue.put(None)
+        await asyncio.gather(*self._upsert_tasks)
+        self._executor.shutdown(wait=False)
+        stats = self.stats()
+        print(
+            f"[INFO] Pipeline: {stats['chunks_upserted']}/{stats['chunks_queued']} chunks upserted "
+            f"in {stats['elapsed_seconds']}s ({stats['chunks_per_second']} chunks/sec, "
+            f"{stats['embed_batches']} embed batches, {stats['upsert_batches']} upsert batches)"
+        )
+        return stats
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "chunks_queued": self.chunks_queued,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_upserted": self.chunks_upserted,
+            "embed_batches": self.embed_batches,
+            "upsert_batches": self.upsert_batches,
+            "failed_chunks": sum(f["chunks"] for f in self.failures),
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(self.chunks_upserted / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    async def _collect_batch(self, queue: asyncio.Queue, batch_size: int) -> Tuple[List[dict], bool]:
+        """
+        Wait for the first item, then keep pulling until the batch is full or
+        flush_interval has passed. Returns (batch, closed) where closed means the
+        end-of-stream marker was seen. Each worker consumes exactly one marker.
+        """
+        first = await queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _embed_stage(self):
+        closed = False
+        while not closed:
+            batch, closed = await self._collect_batch(self._chunk_queue, self.embed_batch_size)
+            if not batch:
+                continue
+            try:
+                embeddings = await self._call(self.embed_fn, [item["text"] for item in batch])
+            except Exception as e:
+                print(f"[ERROR] Embedding batch of {len(batch)} chunks failed: {e}")
+                self._record_failure(batch, e)
+                await self._settle(batch)
+                continue
+            self.embed_batches += 1
+            self.chunks_embedded += len(batch)
+            for item, embedding in zip(batch, embeddings):
+                await self._vector_queue.put({
+                    "id": f"{item['source_url']}#{item['chunk_index']}",
+                    "values": embedding,
+                    "metadata": item,
+                })
+
+    async def _upsert_stage(self):
+        closed = False
+        while not closed:
+            batch, closed = await self._collect_batch(self._vector_queue, self.upsert_batch_size)
+            if not batch:
+                continue
+            try:
+                await self._call(self.upsert_fn, batch)
+            except Exception as e:
+                print(f"[ERROR] Upsert batch of {len(batch)} vectors failed: {e}")
+                self._record_failure([v["metadata"] for v in batch], e)
+                await self._settle([v["metadata"] for v in batch])
+                continue
+            self.upsert_batches += 1
+            self.chunks_upserted += len(batch)
+            await self._settle([v["metadata"] for v in batch])
+
+    async def _settle(self, items: List[dict]):
+        """Account for chunks that left the pipeline, successfully or not."""
+        for item in items:
+            url = item["source_url"]
+            self._pending[url] -= 1
+            if self._pending[url] == 0 and url in self._sealed:
+                await self._url_done(url)
+
+    async def _url_done(self, url: str):
+        self._pending.pop(url, None)
+        self._sealed.discard(url)
+        ok = url not in self._failed_urls
+        self._failed_urls.discard(url)
+        if self.on_url_done is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.on_url_done, url, ok)
+
+    async def _call(self, fn: Callable, arg):
+        if inspect.iscoroutinefunction(fn):
+            return await fn(arg)
+        loop = asyncio.get_running_loop()
+        # Like asyncio.to_thread, run with a copy of the current context (keeps the trace).
+        return await loop.run_in_executor(self._executor, contextvars.copy_context().run, fn, arg)
+
+    def _record_failure(self, items: List[dict], error: Exception):
+        self._failed_urls.update(item["source_url"] for item in items)
+        self.failures.append({
+            "urls": sorted({item["source_url"] for item in items}),
+            "chunks": len(items),
+            "error": str(error),
+        })
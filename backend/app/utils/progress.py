@@ -0,0 +1,132 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+
+class ProgressReporter:
+    """
+    In-memory crawl progress for one doc_id, written out in coalesced batches.
+
+    Counters are plain attribute updates on the event loop. A background task
+    calls flush_fn(snapshot) on a thread every flush_interval seconds, or as
+    soon as flush_every URLs finished since the last flush, and only when
+    the snapshot actually changed. close() always writes the final state.
+
+    Other components can contribute stage counters with track(name, fn),
+    where fn() returns a dict that is included in the snapshot under name.
+    """
+
+    def __init__(
+        self,
+        doc_id: str,
+        flush_fn: Callable[[dict], None],
+        flush_interval: float = 2.0,
+        flush_every: int = 25,
+        max_recent_failures: int = 20,
+    ):
+        self.doc_id = doc_id
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.flush_every = max(1, flush_every)
+        self.status = "in_progress"
+        self.total_urls = 0
+        self.total_known = False
+        self.processed_urls = 0
+        self.skipped_urls = 0
+        self.failed_urls = 0
+        self.stages: Dict[str, int] = {}
+        self.recent_failures: deque = deque(maxlen=max_recent_failures)
+        self._tracked: Dict[str, Callable[[], dict]] = {}
+        self._since_flush = 0
+        self._last_written: Optional[dict] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.writes = 0
+
+    def track(self, name: str, fn: Callable[[], dict]):
+        self._tracked[name] = fn
+
+    def set_total(self, total: int, final: bool = True):
+        self.total_urls = total
+        self.total_known = final
+
+    def incr(self, stage: str, n: int = 1):
+        self.stages[stage] = self.stages.get(stage, 0) + n
+
+    def url_processed(self, skipped: bool = False):
+        self.processed_urls += 1
+        if skipped:
+            self.skipped_urls += 1
+        self._url_finished()
+
+    def url_failed(self, url: str, error: str):
+        self.failed_urls += 1
+        self.recent_failures.append({"url": url, "error": error, "at": time.time()})
+        self._url_finished()
+
+    def _url_finished(self):
+        self._since_flush += 1
+        if self._since_flush >= self.flush_every:
+            self._wake.set()
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            "doc_id": self.doc_id,
+            "status": self.status,
+            "total_urls": self.total_urls,
+            "total_known": self.total_known,
+            "processed_urls": self.processed_urls,
+            "skipped_urls": self.skipped_urls,
+            "failed_urls": self.failed_urls,
+            "stages": dict(self.stages),
+            "recent_failures": list(self.recent_failures),
+        }
+        for name, fn in self._tracked.items():
+            snapshot[name] = fn()
+        return snapshot
+
+    async def start(self):
+        await self.flush(force=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[ERROR] Progress flush for doc_id {self.doc_id} failed: {e}")
+
+    async def flush(self, force: bool = False):
+        async with self._flush_lock:
+            snapshot = self.snapshot()
+            if not force and snapshot == self._last_written:
+                return
+            self._since_flush = 0
+            await asyncio.to_thread(self.flush_fn, snapshot)
+            self._last_written = snapshot
+            self.writes += 1
+
+    async def close(self, status: Optional[str] = None):
+        """Stop the background flusher and write the final state."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if status is not None:
+            self.status = status
+        await self.flush(force=True)
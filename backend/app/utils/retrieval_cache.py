@@ -0,0 +1,177 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+def estimate_size(value: Any) -> int:
+    """Rough size in bytes of a cached value (lists, dicts, strings, numbers)."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], float):
+            # Embeddings: a list of floats, no need to walk every element.
+            return sys.getsizeof(value) + len(value) * sys.getsizeof(0.0)
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class TTLLRUCache:
+    """
+    Thread-safe in-memory cache with a time-to-live per entry and LRU
+    eviction once max_entries is reached. Keeps hit/miss counters and an
+    estimate of the memory held by cached values. on_remove(key) is called
+    (with the cache locked) for every entry that expires or is evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 600.0,
+        on_remove: Optional[Callable[[Hashable], None]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_remove = on_remove
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                if self.on_remove is not None:
+                    self.on_remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self.bytes += size
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+                if self.on_remove is not None:
+                    self.on_remove(oldest)
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "approx_bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class RetrievalCache:
+    """
+    Caches for the /chat retrieval path: query embeddings keyed by the
+    normalized query, and top-k results keyed by (doc_id, normalized query,
+    top_k). invalidate_doc() drops every result cached for a doc_id and is
+    called whenever that document is (re-)ingested. Ingestion normally runs in
+    a worker process, so the API also calls sync_doc_version() with the doc's
+    latest job timestamp to notice re-ingestion it did not do itself.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 600.0):
+        self.embeddings = TTLLRUCache(max_entries, ttl_seconds)
+        self.results = TTLLRUCache(max_entries, ttl_seconds, on_remove=self._forget_key)
+        self._doc_keys: Dict[str, Set[tuple]] = {}
+        self._doc_versions: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        return self.embeddings.get(normalize_query(query))
+
+    def set_embedding(self, query: str, embedding: List[float]):
+        self.embeddings.set(normalize_query(query), embedding)
+
+    def get_results(self, doc_id: str, query: str, top_k: int) -> Optional[List[dict]]:
+        return self.results.get((doc_id, normalize_query(query), top_k))
+
+    def set_results(self, doc_id: str, query: str, top_k: int, results: List[dict]):
+        key = (doc_id, normalize_query(query), top_k)
+        self.results.set(key, results)
+        with self._lock:
+            self._doc_keys.setdefault(doc_id, set()).add(key)
+
+    def _forget_key(self, key: tuple):
+        """Drop a results key that expired or was evicted from its doc's key set."""
+        with self._lock:
+            keys = self._doc_keys.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._doc_keys[key[0]]
+
+    def invalidate_doc(self, doc_id: str):
+        with self._lock:
+            keys = self._doc_keys.pop(doc_id, set())
+            self.invalidations += 1
+        for key in keys:
+            self.results.discard(key)
+
+    def sync_doc_version(self, doc_id: str, version: Any):
+        """Invalidate doc_id if its version changed since the last call."""
+        with self._lock:
+            previous = self._doc_versions.get(doc_id)
+            self._doc_versions[doc_id] = version
+        if previous is not None and previous != version:
+            self.invalidate_doc(doc_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tracked_keys = sum(len(keys) for keys in self._doc_keys.values())
+        return {
+            "query_embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "invalidations": self.invalidations,
+            "tracked_result_keys": tracked_keys,
+        }
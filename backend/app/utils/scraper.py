@@ -6,17 +6,293 @@ Our Own Work
 License: MIT
 """
 
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
 import httpx
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+try:
+    import lxml  # noqa: F401  (the optional lxml extra, much faster than html.parser)
+    HTML_PARSER = "lxml"
+except ImportError:  # pragma: no cover
+    HTML_PARSER = "html.parser"
+
+RENDER_MODES = ("auto", "http", "browser")
+
+# Pages bigger than this are not worth converting; let the browser deal with them.
+MAX_PAGE_BYTES = 10 * 1024 * 1024
+# A static page with less visible text than this, but with scripts, is
+# probably filled in client-side.
+MIN_STATIC_TEXT = 200
+
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "nav", "header", "footer", "aside", "form", "button", "select", "input", "textarea",
+    "img", "picture", "video", "audio", "head", "title", "meta", "link",
+}
+INLINE_TAGS = {
+    "a", "abbr", "b", "bdi", "cite", "code", "data", "del", "dfn", "em", "i", "ins", "kbd",
+    "mark", "q", "s", "samp", "small", "span", "strong", "sub", "sup", "time", "tt", "u", "var", "wbr", "br",
+}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# Layout chrome that docs themes mark with classes / ids instead of semantic tags.
+NOISE_RE = re.compile(r"(^|[-_])(sidebar|breadcrumbs?|navbar|toc|cookie|skip-link|edit-page|pagination)([-_]|$)")
+SPA_ROOT_RE = re.compile(
+    r"<div[^>]+id=[\"'](root|app|__next|__nuxt|___gatsby|svelte)[\"'][^>]*>\s*</div>", re.IGNORECASE
+)
+NOSCRIPT_JS_RE = re.compile(r"<noscript[^>]*>[^<]*(enable|requires?)\s+javascript", re.IGNORECASE)
+LANGUAGE_RE = re.compile(r"(?:language|lang)-([\w+#.-]+)")
+WHITESPACE_RE = re.compile(r"\s+")
+FRONT_MATTER_RE = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n---[ \t]*(?:\r?\n|\Z)", re.DOTALL)
+FRONT_MATTER_TITLE_RE = re.compile(r"^title:[ \t]*[\"']?(.*?)[\"']?[ \t]*$", re.MULTILINE)
+H1_RE = re.compile(r"^#[ \t]+\S", re.MULTILINE)
+
+
+def _is_noise(tag: Tag) -> bool:
+    if tag.attrs is None:
+        return False
+    names = list(tag.get("class") or [])
+    if tag.get("id"):
+        names.append(tag["id"])
+    if tag.get("role") in ("navigation", "banner", "contentinfo"):
+        return True
+    return any(NOISE_RE.search(name.lower()) for name in names)
+
+
+def _inline(node) -> str:
+    if isinstance(node, Comment):
+        return ""
+    if isinstance(node, NavigableString):
+        return str(node)
+    if node.name in SKIP_TAGS:
+        return ""
+    if node.name == "br":
+        return " "
+    text = "".join(_inline(child) for child in node.children)
+    if node.name == "code" and text.strip():
+        return f"`{text.strip()}`"
+    return text
+
+
+def _list_items(node: Tag, depth: int, out: List[str]):
+    ordered = node.name == "ol"
+    for index, li in enumerate(node.find_all("li", recursive=False), start=1):
+        nested = [child for child in li.children if isinstance(child, Tag) and child.name in ("ul", "ol")]
+        text = WHITESPACE_RE.sub(" ", "".join(
+            _inline(child) if not (isinstance(child, Tag) and child.name in ("ul", "ol", "pre")) else ""
+            for child in li.children
+        )).strip()
+        marker = f"{index}." if ordered else "-"
+        if text:
+            out.append(f"{'  ' * depth}{marker} {text}")
+        for child in li.find_all("pre", recursive=False):
+            out.append(_code_block(child))
+        for sub in nested:
+            _list_items(sub, depth + 1, out)
+
+
+def _code_block(pre: Tag) -> str:
+    code = pre.find("code")
+    language = ""
+    for tag in (code, pre):
+        if tag is not None:
+            match = LANGUAGE_RE.search(" ".join(tag.get("class") or []))
+            if match:
+                language = match.group(1)
+                break
+    return f"```{language}\n{pre.get_text().rstrip()}\n```"
+
+
+def _table(table: Tag) -> str:
+    rows = []
+    for tr in table.find_all("tr"):
+        cells = [
+            WHITESPACE_RE.sub(" ", _inline(cell)).strip().replace("|", "\\|")
+            for cell in tr.find_all(["th", "td"], recursive=False)
+        ]
+        if cells:
+            rows.append("| " + " | ".join(cells) + " |")
+    if len(rows) > 1:
+        columns = rows[0].count(" | ") + 1
+        rows.insert(1, "|" + " --- |" * columns)
+    return "\n".join(rows)
+
+
+def _blocks(node: Tag, out: List[str]):
+    parts: List[str] = []
+
+    def flush():
+        text = WHITESPACE_RE.sub(" ", "".join(parts)).strip()
+        if text:
+            out.append(text)
+        parts.clear()
+
+    for child in node.children:
+        if isinstance(child, Comment):
+            continue
+        if isinstance(child, NavigableString):
+            parts.append(str(child))
+            continue
+        if not isinstance(child, Tag) or child.name in SKIP_TAGS or _is_noise(child):
+            continue
+        name = child.name
+        if name in INLINE_TAGS:
+            parts.append(_inline(child))
+            continue
+        flush()
+        if name in HEADING_TAGS:
+            # Drop permalink anchors ("#", "¶") that docs themes append to headings.
+            title = WHITESPACE_RE.sub(" ", _inline(child)).strip().rstrip("#¶ ")
+            if title:
+                out.append(f"{'#' * HEADING_TAGS[name]} {title}")
+        elif name == "pre":
+            out.append(_code_block(child))
+        elif name in ("ul", "ol"):
+            items: List[str] = []
+            _list_items(child, 0, items)
+            if items:
+                out.append("\n".join(items))
+        elif name == "table":
+            table = _table(child)
+            if table:
+                out.append(table)
+        elif name == "blockquote":
+            inner: List[str] = []
+            _blocks(child, inner)
+            if inner:
+                out.append("\n".join(f"> {line}" for line in "\n\n".join(inner).split("\n")))
+        elif name == "hr":
+            continue
+        else:
+            _blocks(child, out)
+    flush()
+
+
+def html_to_markdown(html: str) -> str:
+    """
+    Lightweight HTML to markdown conversion for static docs pages: keeps
+    headings, paragraphs, lists, tables and fenced code blocks of the main
+    content area and drops scripts, images and navigation chrome.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    root = (
+        soup.find("main")
+        or soup.find(attrs={"role": "main"})
+        or soup.find("article")
+        or soup.body
+        or soup
+    )
+    out: List[str] = []
+    _blocks(root, out)
+    return "\n\n".join(out)
+
+
+def needs_js(html: str, markdown: str) -> bool:
+    """Guess whether a page only renders its content with JavaScript."""
+    if SPA_ROOT_RE.search(html):
+        return True
+    text_length = len(markdown.strip())
+    if text_length < MIN_STATIC_TEXT and "<script" in html.lower():
+        return True
+    return text_length < 5 * MIN_STATIC_TEXT and bool(NOSCRIPT_JS_RE.search(html))
+
+
+def parse_render_overrides(value: Optional[str]) -> Dict[str, str]:
+    """Parse "docs.example.com=browser,example.org=http" into {host: mode}."""
+    overrides = {}
+    for item in (value or "").split(","):
+        host, _, mode = item.partition("=")
+        if host.strip() and mode.strip() in RENDER_MODES:
+            overrides[host.strip().lower()] = mode.strip()
+    return overrides
+
+
+def render_mode_for(url: str, default: str, overrides: Dict[str, str]) -> str:
+    """Render mode of url's host (or its closest configured parent domain)."""
+    host = (urlparse(url).hostname or "").lower()
+    while host:
+        if host in overrides:
+            return overrides[host]
+        _, _, host = host.partition(".")
+    return default
+
+
+async def fetch_page(
+    client: httpx.AsyncClient, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> dict:
+    """
+    Plain HTTP GET of a page. Returns {"url", "status", "content_type",
+    "text", "headers"}; text is None when the body is larger than MAX_PAGE_BYTES.
+    With etag / last_modified from an earlier fetch the GET is conditional,
+    and an unchanged page comes back with status 304 and no body.
+    """
+    headers = {"Accept": "text/html,application/xhtml+xml,text/markdown;q=0.9,*/*;q=0.5"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    async with client.stream("GET", url, headers=headers) as response:
+        body = bytearray()
+        too_large = False
+        async for data in response.aiter_bytes():
+            body.extend(data)
+            if len(body) > MAX_PAGE_BYTES:
+                too_large = True
+                break
+        return {
+            "url": str(response.url),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", "").split(";")[0].strip().lower(),
+            "text": None if too_large else bytes(body).decode(response.encoding or "utf-8", errors="replace"),
+            "headers": dict(response.headers),
+        }
+
+
+def strip_front_matter(markdown: str) -> str:
+    """
+    Drop a leading YAML front matter block (docs sites keep their markdown
+    sources with one). Its title becomes the page's # heading if the page
+    has none, so chunks still get a section heading.
+    """
+    match = FRONT_MATTER_RE.match(markdown)
+    if not match:
+        return markdown
+    body = markdown[match.end():].lstrip("\n")
+    title = FRONT_MATTER_TITLE_RE.search(match.group(1))
+    if title and title.group(1) and not H1_RE.search(body):
+        body = f"# {title.group(1)}\n\n{body}"
+    return body
+
 
-async def fetch_and_scrape(url: str) -> str:
+def extract_markdown(page: dict) -> Tuple[str, bool]:
     """
-    Fetches the HTML content from the given URL and extracts readable text.
+    Turn a fetched page into markdown. Returns (markdown, needs_browser);
+    needs_browser is True when the page looks like it is rendered client-side.
+    CPU bound, so call it from a thread pool.
     """
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-    if response.status_code != 200:
+    text = page["text"]
+    if text is None:
+        return "", True
+    if page["content_type"] in ("text/markdown", "text/x-markdown"):
+        return strip_front_matter(text), False
+    if page["content_type"] == "text/plain":
+        return text, False
+    markdown = html_to_markdown(text)
+    return markdown, needs_js(text, markdown)
+
+
+async def fetch_and_scrape(url: str, client: Optional[httpx.AsyncClient] = None) -> str:
+    """
+    Fetches the HTML content from the given URL and converts it to markdown.
+    """
+    if client is None:
+        async with httpx.AsyncClient(timeout=10, follow_redirects=True) as own_client:
+            page = await fetch_page(own_client, url)
+    else:
+        page = await fetch_page(client, url)
+    if page["status"] != 200:
         raise Exception("Unable to fetch the URL")
-    soup = BeautifulSoup(response.text, "html.parser")
-    text = soup.get_text(separator="\n")
-    return text
+    markdown, _ = extract_markdown(page)
+    return markdown
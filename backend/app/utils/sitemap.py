@@ -0,0 +1,246 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import json
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from xml.etree.ElementTree import XMLPullParser
+
+import httpx
+
+# JSON manifests are parsed in one go, so refuse anything unreasonably large.
+MAX_MANIFEST_BYTES = 20 * 1024 * 1024
+
+
+def candidate_files(base_url: str) -> List[str]:
+    """Domain-level and subpath-level sitemap / JSON manifest locations."""
+    parsed = urlparse(base_url)
+    domain_root = f"{parsed.scheme}://{parsed.netloc}"
+    candidates = [
+        urljoin(domain_root, "/sitemap.xml"),
+        urljoin(domain_root, "/manifest.json"),
+        urljoin(domain_root, "/index.json"),
+    ]
+    # If the base URL has a subpath (e.g. /docs), also check subpath.
+    if parsed.path and parsed.path != "/":
+        subpath = parsed.path.rstrip("/")
+        candidates += [
+            urljoin(domain_root, subpath + "/sitemap.xml"),
+            urljoin(domain_root, subpath + "/manifest.json"),
+            urljoin(domain_root, subpath + "/index.json"),
+        ]
+    return list(dict.fromkeys(candidates))
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _missing(error: Exception) -> bool:
+    """True if a fetch failed because there is no such file, rather than a transient error."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code < 500
+    return not isinstance(error, httpx.TransportError)
+
+
+async def _robots_sitemaps(client: httpx.AsyncClient, base_url: str) -> Optional[List[str]]:
+    """The Sitemap: entries of /robots.txt, or None if it could not be read (not just missing)."""
+    parsed = urlparse(base_url)
+    try:
+        response = await client.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+    except httpx.HTTPError:
+        return None
+    if response.status_code >= 500:
+        return None
+    if response.status_code != 200:
+        return []
+    sitemaps = []
+    for line in response.text.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "sitemap" and value.strip():
+            sitemaps.append(value.strip())
+    return sitemaps
+
+
+async def _stream_xml(
+    client: httpx.AsyncClient, url: str
+) -> AsyncIterator[Tuple[str, str, Optional[str]]]:
+    """
+    Stream and incrementally parse one sitemap, transparently gunzipping it.
+    Yields ("url", loc, lastmod) for pages and ("sitemap", loc, lastmod) for
+    children of a <sitemapindex>. Only direct children of <url> / <sitemap>
+    count, not e.g. the <image:loc> of an image sitemap. Parsed elements are
+    dropped right away, so memory use does not grow with the size of the file.
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    decompressor = None
+    root = None
+    depth = 0  # 1 is the root, 2 an entry, 3 the entry's <loc> / <lastmod>
+    loc = lastmod = None
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        first = True
+        async for data in response.aiter_bytes():
+            if first:
+                # Servers send .xml.gz both with and without Content-Encoding,
+                # so sniff the gzip magic bytes instead of trusting headers.
+                if data[:2] == b"\x1f\x8b":
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                first = False
+            parser.feed(decompressor.decompress(data) if decompressor else data)
+            for event, elem in parser.read_events():
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = elem
+                    continue
+                level, depth = depth, depth - 1
+                name = _local_name(elem.tag)
+                if level == 3 and name == "loc":
+                    loc = (elem.text or "").strip() or None
+                elif level == 3 and name == "lastmod":
+                    lastmod = (elem.text or "").strip() or None
+                elif level == 2 and name in ("url", "sitemap"):
+                    if loc:
+                        yield name, loc, lastmod
+                    loc = lastmod = None
+                    root.clear()
+    parser.close()
+
+
+async def _read_manifest(client: httpx.AsyncClient, url: str) -> List[str]:
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        body = bytearray()
+        async for data in response.aiter_bytes():
+            body.extend(data)
+            if len(body) > MAX_MANIFEST_BYTES:
+                raise ValueError("manifest too large")
+    data = json.loads(bytes(body))
+    if isinstance(data, list):
+        return [u for u in data if isinstance(u, str)]
+    if isinstance(data, dict):
+        for key in ["urls", "sitemap", "entries"]:
+            if key in data and isinstance(data[key], list):
+                return [u for u in data[key] if isinstance(u, str)]
+    return []
+
+
+async def iter_sitemap_entries(
+    base_url: str,
+    max_urls: Optional[int] = None,
+    max_sitemaps: int = 100,
+    max_index_depth: int = 3,
+    concurrency: int = 6,
+    client: Optional[httpx.AsyncClient] = None,
+    status: Optional[dict] = None,
+) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    Yield (url, lastmod) pairs from every sitemap and JSON manifest we can find
+    for base_url, without duplicates.
+
+    All candidate files and the Sitemap: entries of /robots.txt are probed
+    concurrently. <sitemapindex> files are followed recursively up to
+    max_index_depth levels and max_sitemaps files in total.
+
+    If a dict is passed as status, status["complete"] tells whether every
+    page was yielded: it stays False if max_urls, max_sitemaps or
+    max_index_depth cut the list short, a sitemap that exists (listed in
+    robots.txt or an index, or one that already gave entries) could not be
+    read, or a candidate failed with a network error or 5xx. A candidate
+    that is missing or isn't a sitemap is fine.
+    """
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(timeout=10, follow_redirects=True)
+    results: asyncio.Queue = asyncio.Queue(maxsize=1000)
+    limit = asyncio.Semaphore(concurrency)
+    scheduled = set()
+    tasks: List[asyncio.Task] = []
+    if status is not None:
+        status["complete"] = False
+    complete = True
+
+    def schedule(url: str, depth: int, listed: bool = True):
+        nonlocal complete
+        if url in scheduled:
+            return
+        if len(scheduled) >= max_sitemaps or depth > max_index_depth:
+            complete = False
+            return
+        scheduled.add(url)
+        tasks.append(asyncio.create_task(process(url, depth, listed)))
+
+    async def process(url: str, depth: int, listed: bool):
+        nonlocal complete
+        found = 0
+        try:
+            async with limit:
+                if url.endswith(".json"):
+                    for page_url in await _read_manifest(client, url):
+                        await results.put((page_url, None))
+                        found += 1
+                else:
+                    async for kind, loc, lastmod in _stream_xml(client, url):
+                        if kind == "sitemap":
+                            schedule(loc, depth + 1)
+                        else:
+                            await results.put((loc, lastmod))
+                            found += 1
+                if found:
+                    print(f"[INFO] Found {found} URLs from {url}")
+        except Exception as e:
+            print(f"[INFO] Could not fetch from {url}: {e}")
+            if listed or found or not _missing(e):
+                complete = False
+
+    async def run():
+        nonlocal complete
+        for url in candidate_files(base_url):
+            schedule(url, 0, listed=False)
+        robots_sitemaps = await _robots_sitemaps(client, base_url)
+        if robots_sitemaps is None:
+            complete = False
+        for url in robots_sitemaps or []:
+            schedule(url, 0)
+        # Children may be scheduled while we wait, so keep going until none are left.
+        done = 0
+        while done < len(tasks):
+            await tasks[done]
+            done += 1
+        await results.put(None)
+
+    runner = asyncio.create_task(run())
+    seen = set()
+    try:
+        while True:
+            item = await results.get()
+            if item is None:
+                if status is not None:
+                    status["complete"] = complete
+                break
+            if item[0] in seen:
+                continue
+            seen.add(item[0])
+            yield item
+            if max_urls is not None and len(seen) >= max_urls:
+                break
+    finally:
+        runner.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(runner, *tasks, return_exceptions=True)
+        if owns_client:
+            await client.aclose()
+
+
+async def get_sitemap_entries(base_url: str, max_urls: Optional[int] = None, **kwargs) -> Dict[str, Optional[str]]:
+    """Collect iter_sitemap_entries into a {url: lastmod} dict."""
+    return {url: lastmod async for url, lastmod in iter_sitemap_entries(base_url, max_urls=max_urls, **kwargs)}
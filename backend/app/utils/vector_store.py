@@ -0,0 +1,534 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+
+class VectorStore(ABC):
+    """
+    Interface every vector backend implements.
+
+    Vectors are Pinecone-style dicts: {"id", "values", "metadata"}, where the
+    metadata always carries the owning doc_id. Query results are dicts with
+    "id", "score" and "metadata", best match first.
+
+    Every doc_id is a partition of its own: ids only have to be unique within
+    their doc_id (the same url#chunk_index may exist in many docs), a query
+    only searches its doc_id's partition, and delete_doc drops the whole
+    partition without looking at other docs' vectors.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors: List[dict]):
+        """Insert or replace vectors, each in the partition of its metadata's doc_id."""
+
+    @abstractmethod
+    def query(self, vector: List[float], doc_id: str, top_k: int) -> List[dict]:
+        """The top_k vectors of doc_id closest to vector."""
+
+    @abstractmethod
+    def delete(self, doc_id: str, ids: List[str]):
+        """Delete vectors of doc_id by id; unknown ids are ignored."""
+
+    @abstractmethod
+    def delete_doc(self, doc_id: str):
+        """Delete every vector of doc_id."""
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    All documents share one Pinecone index, each in its own namespace named
+    after its doc_id, so queries don't need a metadata filter and deleting a
+    document is one delete_all on its namespace.
+
+    Vectors written before namespaces were used are in the default namespace,
+    told apart by their doc_id metadata. With legacy_filter, a doc_id whose
+    namespace is empty is searched there, so those documents keep answering
+    until they are crawled again, and delete_doc removes them too. The first
+    write to a doc_id (upsert or delete) moves its legacy vectors into its
+    namespace, so an incremental crawl, which only rewrites changed pages,
+    doesn't leave the unchanged ones behind where no query looks.
+    """
+
+    MIGRATE_BATCH = 1000  # Pinecone's top_k limit when values are included
+
+    def __init__(self, index, legacy_filter: bool = True):
+        self.index = index
+        self.legacy_filter = legacy_filter
+        self._migrated: Set[str] = set()
+        self._migrate_lock = threading.Lock()
+        self._dimension: Optional[int] = None
+
+    def _migrate(self, doc_id: str):
+        """Move doc_id's vectors from the default namespace into its own, once per process."""
+        if not self.legacy_filter or doc_id in self._migrated:
+            return
+        # Held until the move is done, so no write races it.
+        with self._migrate_lock:
+            if doc_id in self._migrated:
+                return
+            try:
+                moved = self._move_legacy(doc_id)
+            except Exception as e:
+                # Tried again on the next write.
+                print(f"[ERROR] Could not migrate legacy vectors of doc_id {doc_id}: {e}")
+                return
+            self._migrated.add(doc_id)
+        if moved:
+            print(f"[INFO] Migrated {moved} legacy vectors of doc_id {doc_id} into its namespace.")
+
+    def _move_legacy(self, doc_id: str, keep: bool = True) -> int:
+        """Move doc_id's legacy vectors into its namespace in batches, or only delete them."""
+        if self._dimension is None:
+            self._dimension = self.index.describe_index_stats()["dimension"]
+        probe = [1.0] * self._dimension  # any vector will do, the filter picks the matches
+        moved = 0
+        seen: Set[str] = set()
+        while True:
+            search_res = self.index.query(
+                vector=probe, top_k=self.MIGRATE_BATCH, filter={"doc_id": doc_id},
+                include_values=True, include_metadata=True,
+            )
+            matches = [match for match in search_res["matches"] if match.id not in seen]
+            if not matches:
+                # Deletes are eventually consistent, so a repeat of moved ids means done.
+                return moved
+            ids = [match.id for match in matches]
+            seen.update(ids)
+            if keep:
+                # Vectors written to the namespace since are newer than their legacy copies.
+                existing = self.index.fetch(ids=ids, namespace=doc_id).vectors
+                vectors = [
+                    {"id": match.id, "values": match.values, "metadata": match.metadata or {}}
+                    for match in matches if match.id not in existing
+                ]
+                if vectors:
+                    self.index.upsert(vectors=vectors, namespace=doc_id)
+                moved += len(vectors)
+            self.index.delete(ids=ids)
+
+    def upsert(self, vectors: List[dict]):
+        by_doc: Dict[str, List[dict]] = {}
+        for v in vectors:
+            by_doc.setdefault(v["metadata"]["doc_id"], []).append(v)
+        for doc_id, doc_vectors in by_doc.items():
+            self._migrate(doc_id)
+            self.index.upsert(vectors=doc_vectors, namespace=doc_id)
+
+    def _query(self, vector: List[float], top_k: int, **kwargs) -> List[dict]:
+        search_res = self.index.query(vector=vector, top_k=top_k, include_metadata=True, **kwargs)
+        matches = search_res["matches"] if "matches" in search_res else []
+        return [
+            {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+            for match in matches
+        ]
+
+    def query(self, vector: List[float], doc_id: str, top_k: int) -> List[dict]:
+        results = self._query(vector, top_k, namespace=doc_id)
+        if not results and self.legacy_filter:
+            results = self._query(vector, top_k, filter={"doc_id": doc_id})
+        return results
+
+    def delete(self, doc_id: str, ids: List[str]):
+        self._migrate(doc_id)
+        # Pinecone accepts at most 1000 ids per delete call.
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[start:start + 1000], namespace=doc_id)
+
+    def delete_doc(self, doc_id: str):
+        try:
+            self.index.delete(delete_all=True, namespace=doc_id)
+        except Exception as e:
+            # Deleting a namespace that was never written to is an error on some index types.
+            print(f"[INFO] No namespace to delete for doc_id {doc_id}: {e}")
+        self._migrated.discard(doc_id)
+        if self.legacy_filter:
+            try:
+                self.index.delete(filter={"doc_id": doc_id})
+            except Exception:
+                # Serverless indexes can't delete by metadata filter; look the ids up instead.
+                try:
+                    self._move_legacy(doc_id, keep=False)
+                except Exception as e:
+                    print(f"[ERROR] Could not delete legacy vectors of doc_id {doc_id}: {e}")
+
+
+class _LocalCollection:
+    """
+    Vectors of a single doc_id, stored as a dense memory-mapped matrix.
+
+    Rows 0..count-1 are live. Ids and metadata live in a small SQLite file next
+    to the matrix. Deleting a row moves the last row into its slot, so the
+    matrix never has holes and search never has to skip anything.
+
+    Crawl workers and the API open the same files from different processes,
+    so refresh() reloads rows and the mapping once another process committed
+    a change, and replaced() tells that the files were deleted or re-created.
+    """
+
+    def __init__(self, directory: str, dim: int, dtype: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        meta_path = os.path.join(directory, "meta.sqlite3")
+        self.db = sqlite3.connect(meta_path, check_same_thread=False)
+        # The open connection keeps this inode in use, so a re-created file gets another one.
+        self.inode = os.stat(meta_path).st_ino
+        self.db.execute("CREATE TABLE IF NOT EXISTS header (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT UNIQUE, metadata TEXT)"
+        )
+        header = dict(self.db.execute("SELECT key, value FROM header").fetchall())
+        # An existing collection keeps the layout it was created with.
+        self.dim = int(header.get("dim", dim))
+        self.dtype = header.get("dtype", dtype)
+        self.capacity = int(header.get("capacity", 0))
+        if not header:
+            self._write_header()
+        self.rows: Dict[str, int] = dict(self.db.execute("SELECT id, row FROM rows").fetchall())
+        self.matrix: Optional[np.memmap] = None
+        self.scales: Optional[np.memmap] = None
+        self._map()
+        self.ann: Optional["_IVFIndex"] = None
+        # Changes when another connection commits, never for our own commits.
+        self.data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        self.closed = False
+        # Held while the collection is read or changed; the store's lock only guards the set of collections.
+        self.lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    def replaced(self) -> bool:
+        """True if the collection's files were deleted (and maybe re-created) since they were opened."""
+        try:
+            return os.stat(os.path.join(self.directory, "meta.sqlite3")).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def refresh(self):
+        """Reload rows, capacity and the mapping if another process changed the collection."""
+        if self.closed:
+            return
+        version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return
+        self.data_version = version
+        header = dict(self.db.execute("SELECT key, value FROM header").fetchall())
+        self.capacity = int(header.get("capacity", 0))
+        self.rows = dict(self.db.execute("SELECT id, row FROM rows").fetchall())
+        self._map()
+        self.ann = None
+
+    def _write_header(self):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO header (key, value) VALUES (?, ?)",
+            [("dim", str(self.dim)), ("dtype", self.dtype), ("capacity", str(self.capacity))],
+        )
+        self.db.commit()
+
+    def _map(self):
+        self.matrix = self.scales = None
+        if self.capacity == 0:
+            return
+        self.matrix = np.memmap(
+            os.path.join(self.directory, "vectors.bin"), dtype=self.dtype, mode="r+",
+            shape=(self.capacity, self.dim),
+        )
+        if self.dtype == "int8":
+            self.scales = np.memmap(
+                os.path.join(self.directory, "scales.bin"), dtype="float32", mode="r+",
+                shape=(self.capacity,),
+            )
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+        itemsize = np.dtype(self.dtype).itemsize
+        if self.matrix is not None:
+            self.matrix.flush()
+        self.matrix = self.scales = None
+        with open(os.path.join(self.directory, "vectors.bin"), "ab") as f:
+            f.truncate(capacity * self.dim * itemsize)
+        if self.dtype == "int8":
+            with open(os.path.join(self.directory, "scales.bin"), "ab") as f:
+                f.truncate(capacity * 4)
+        self.capacity = capacity
+        self._write_header()
+        self._map()
+
+    def _encode(self, values: np.ndarray, rows: np.ndarray):
+        if self.dtype == "int8":
+            scale = np.abs(values).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            self.matrix[rows] = np.round(values / scale[:, None]).astype(np.int8)
+            self.scales[rows] = scale
+        else:
+            self.matrix[rows] = values.astype(self.dtype)
+
+    def decode(self, start: int, stop: int) -> np.ndarray:
+        block = np.asarray(self.matrix[start:stop], dtype=np.float32)
+        if self.dtype == "int8":
+            block *= np.asarray(self.scales[start:stop])[:, None]
+        return block
+
+    def upsert(self, vectors: List[dict]):
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        # Store unit vectors so a dot product is the cosine similarity.
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.where(norms == 0, 1.0, norms)
+        new_ids = [v["id"] for v in vectors if v["id"] not in self.rows]
+        self._grow(self.count + len(set(new_ids)))
+        rows = []
+        for v in vectors:
+            row = self.rows.get(v["id"])
+            if row is None:
+                row = self.count
+                self.rows[v["id"]] = row
+            rows.append(row)
+        self._encode(values, np.asarray(rows))
+        self.matrix.flush()
+        if self.scales is not None:
+            self.scales.flush()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO rows (row, id, metadata) VALUES (?, ?, ?)",
+            [(row, v["id"], json.dumps(v.get("metadata", {}))) for row, v in zip(rows, vectors)],
+        )
+        self.db.commit()
+        self.ann = None
+
+    def delete(self, ids: List[str]):
+        for vector_id in ids:
+            row = self.rows.pop(vector_id, None)
+            if row is None:
+                continue
+            last = self.count  # count already excludes the removed id
+            self.db.execute("DELETE FROM rows WHERE row = ?", (row,))
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+                if self.scales is not None:
+                    self.scales[row] = self.scales[last]
+                moved_id = self.db.execute("SELECT id FROM rows WHERE row = ?", (last,)).fetchone()[0]
+                self.db.execute("UPDATE rows SET row = ? WHERE row = ?", (row, last))
+                self.rows[moved_id] = row
+        self.db.commit()
+        if self.matrix is not None:
+            self.matrix.flush()
+        self.ann = None
+
+    def metadata(self, rows: List[int]) -> Dict[int, tuple]:
+        placeholders = ",".join("?" * len(rows))
+        found = self.db.execute(
+            f"SELECT row, id, metadata FROM rows WHERE row IN ({placeholders})", rows
+        ).fetchall()
+        return {row: (vector_id, json.loads(metadata)) for row, vector_id, metadata in found}
+
+    def close(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+        self.matrix = self.scales = None
+        self.rows = {}  # a query that got hold of the collection before it was closed finds it empty
+        self.closed = True
+        self.db.close()
+
+
+class _IVFIndex:
+    """
+    Inverted-file ANN index: rows are clustered with k-means and a query only
+    scores the rows of the nprobe clusters closest to it.
+    """
+
+    def __init__(self, collection: _LocalCollection, nprobe: int = 8, iterations: int = 8, seed: int = 0):
+        count = collection.count
+        data = collection.decode(0, count)
+        nlist = max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample = data[rng.choice(count, size=min(count, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assign = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        self.centroids = centroids
+        self.rows = order
+        self.offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.nprobe = min(nprobe, nlist)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        nearest = np.argpartition(-(self.centroids @ query), self.nprobe - 1)[:self.nprobe]
+        return np.concatenate([self.rows[self.offsets[c]:self.offsets[c + 1]] for c in nearest])
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store: one memory-mapped matrix per doc_id under
+    directory, searched with vectorized NumPy (exact top-k). Vectors can be
+    kept as float32, float16 or int8 (per-vector scale) to trade accuracy for
+    memory. Collections with at least ann_threshold vectors are searched with
+    an IVF index instead, which is built lazily after each change.
+    Each collection has its own lock, so different doc_ids can be searched
+    (e.g. a multi-doc fan-out) and written at the same time. Open collections
+    pick up changes other processes (crawl workers) made to their files.
+    """
+
+    SEARCH_BLOCK = 65536
+
+    def __init__(
+        self,
+        directory: str,
+        dim: int = 1536,
+        dtype: str = "float32",
+        ann_threshold: int = 50_000,
+        ann_nprobe: int = 8,
+    ):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.directory = directory
+        self.dim = dim
+        self.dtype = dtype
+        self.ann_threshold = ann_threshold
+        self.ann_nprobe = ann_nprobe
+        self._collections: Dict[str, _LocalCollection] = {}
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, doc_id: str) -> str:
+        """
+        Directory of doc_id's collection: the sha256 of the doc_id, so every
+        doc_id gets its own directory whatever characters it contains.
+        """
+        if doc_id in ("", ".", ".."):
+            raise ValueError(f"Invalid doc_id: {doc_id!r}")
+        path = os.path.join(self.directory, hashlib.sha256(doc_id.encode("utf-8")).hexdigest())
+        if not os.path.isdir(path):
+            self._adopt_legacy(doc_id, path)
+        return path
+
+    def _adopt_legacy(self, doc_id: str, path: str):
+        """
+        Collections used to be named after the doc_id with unsafe characters
+        replaced by "_", which let different doc_ids share a directory. Move
+        such a directory to its new name if it only holds doc_id's vectors.
+        """
+        legacy = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", doc_id))
+        if doc_id in (".", "..") or not os.path.isfile(os.path.join(legacy, "meta.sqlite3")):
+            return
+        db = sqlite3.connect(os.path.join(legacy, "meta.sqlite3"))
+        try:
+            owners = {json.loads(m).get("doc_id") for (m,) in db.execute("SELECT metadata FROM rows")}
+        except sqlite3.Error:
+            return
+        finally:
+            db.close()
+        if owners <= {doc_id}:
+            try:
+                os.rename(legacy, path)
+            except OSError:  # another process moved it first
+                pass
+
+    def _collection(self, doc_id: str, create: bool = False) -> Optional[_LocalCollection]:
+        collection = self._collections.get(doc_id)
+        if collection is not None and collection.replaced():
+            # Deleted by another process, and maybe crawled again since.
+            del self._collections[doc_id]
+            with collection.lock:
+                collection.close()
+            collection = None
+        if collection is None:
+            path = self._path(doc_id)
+            if not create and not os.path.isdir(path):
+                return None
+            collection = _LocalCollection(path, self.dim, self.dtype)
+            self._collections[doc_id] = collection
+        return collection
+
+    def upsert(self, vectors: List[dict]):
+        by_doc: Dict[str, List[dict]] = {}
+        for v in vectors:
+            by_doc.setdefault(v["metadata"]["doc_id"], []).append(v)
+        for doc_id, doc_vectors in by_doc.items():
+            with self._lock:
+                collection = self._collection(doc_id, create=True)
+            with collection.lock:
+                collection.refresh()
+                collection.upsert(doc_vectors)
+
+    def query(self, vector: List[float], doc_id: str, top_k: int) -> List[dict]:
+        with self._lock:
+            collection = self._collection(doc_id)
+        if collection is None:
+            return []
+        with collection.lock:
+            collection.refresh()
+            if collection.count == 0:
+                return []
+            q = np.asarray(vector, dtype=np.float32)
+            q /= np.linalg.norm(q) or 1.0
+            if collection.count >= self.ann_threshold:
+                if collection.ann is None:
+                    collection.ann = _IVFIndex(collection, nprobe=self.ann_nprobe)
+                rows = np.sort(collection.ann.candidates(q))
+                scores = np.asarray(collection.matrix[rows], dtype=np.float32) @ q
+                if collection.scales is not None:
+                    scores *= np.asarray(collection.scales[rows])
+            else:
+                rows = np.arange(collection.count)
+                scores = np.concatenate([
+                    collection.decode(start, min(start + self.SEARCH_BLOCK, collection.count)) @ q
+                    for start in range(0, collection.count, self.SEARCH_BLOCK)
+                ])
+            k = min(top_k, len(scores))
+            if k == 0:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            found = collection.metadata([int(rows[i]) for i in best])
+        results = []
+        for i in best:
+            row = int(rows[i])
+            if row in found:
+                vector_id, metadata = found[row]
+                results.append({"id": vector_id, "score": float(scores[i]), "metadata": metadata})
+        return results
+
+    def delete(self, doc_id: str, ids: List[str]):
+        with self._lock:
+            collection = self._collection(doc_id)
+        if collection is not None:
+            with collection.lock:
+                collection.refresh()
+                collection.delete(ids)
+
+    def delete_doc(self, doc_id: str):
+        with self._lock:
+            collection = self._collections.pop(doc_id, None)
+            if collection is not None:
+                with collection.lock:
+                    collection.close()
+            path = os.path.realpath(self._path(doc_id))
+            # Never remove anything outside the store's own directory.
+            if os.path.dirname(path) != os.path.realpath(self.directory):
+                raise ValueError(f"Invalid doc_id: {doc_id!r}")
+            if os.path.isdir(path):
+                shutil.rmtree(path)
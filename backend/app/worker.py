@@ -0,0 +1,187 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+
+from app.utils import metrics
+
+# How long an idle worker waits before looking for new jobs again, in seconds.
+POLL_INTERVAL = 2.0
+# Only the first failures are kept in the job result, the rest are counted.
+MAX_REPORTED_FAILURES = 50
+
+JOBS_FINISHED = metrics.REGISTRY.counter(
+    "docs_jobs_finished_total", "Crawl jobs that left a worker, by outcome (completed, failed, cancelled, released)."
+)
+
+
+async def run_crawl_job(api, job: dict, shutdown: asyncio.Event) -> dict:
+    """
+    Run one crawl job, checkpointing every finished URL. Browsers come from
+    the process-wide pool, so they stay warm from one job to the next. A background task
+    refreshes the job's heartbeat and stops the crawl when the job is
+    cancelled or the worker is shutting down.
+
+    The crawl runs in a trace whose id is the job id; its per-stage summary
+    (count, total and max time of every stage) is stored in the job result.
+    """
+    job_id = job["id"]
+    payload = job["payload"]
+    completed = await asyncio.to_thread(api.job_store.completed_urls, job_id)
+    if completed:
+        print(f"[INFO] Resuming job {job_id}: {len(completed)} URLs already done.")
+    cancelled = asyncio.Event()
+
+    async def watch():
+        elapsed = 0.0
+        while not cancelled.is_set():
+            await asyncio.sleep(1.0)
+            elapsed += 1.0
+            if shutdown.is_set():
+                cancelled.set()
+            elif elapsed >= api.JOB_HEARTBEAT_INTERVAL:
+                elapsed = 0.0
+                if await asyncio.to_thread(api.job_store.heartbeat, job_id):
+                    print(f"[INFO] Job {job_id} was cancelled, stopping.")
+                    cancelled.set()
+
+    job_trace = metrics.start_trace(
+        "crawl_job", trace_id=job_id, keep=False, doc_id=job["doc_id"], attempt=job["attempts"]
+    )
+    watcher = asyncio.create_task(watch())
+    try:
+        with job_trace.activate():
+            result = await api.crawl_document(
+                job["doc_id"],
+                payload["base_url"],
+                incremental=payload.get("incremental", False),
+                stream_discovery=payload.get("stream_discovery", False),
+                completed_urls=completed,
+                on_url_done=lambda url, ok: api.job_store.checkpoint(job_id, url, ok),
+                cancelled=cancelled,
+                render_mode=payload.get("render_mode")
+            )
+    except Exception as e:
+        job_trace.finish(error=type(e).__name__)
+        raise
+    finally:
+        watcher.cancel()
+    job_trace.finish()
+    failures = result["failed"]
+    result["failed"] = len(failures)
+    result["failures"] = failures[:MAX_REPORTED_FAILURES]
+    result["trace"] = job_trace.to_dict(spans=False)
+    return result
+
+
+async def worker_loop(index: int, max_jobs_per_tenant: int):
+    from app import test as api
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    shutdown = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, shutdown.set)
+    print(f"[INFO] Worker {worker_id} started.")
+
+    # The API serves these on /metrics, added to its own.
+    metrics_source = f"{socket.gethostname()}:worker-{index}"
+
+    async def publish_metrics():
+        while True:
+            await asyncio.sleep(api.METRICS_PUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(api.job_store.save_metrics, metrics_source, metrics.REGISTRY.snapshot())
+            except Exception as e:
+                print(f"[ERROR] Publishing metrics of worker {worker_id} failed: {e}")
+
+    publisher = asyncio.create_task(publish_metrics())
+
+    while not shutdown.is_set():
+        await asyncio.to_thread(api.job_store.requeue_stale, api.JOB_STALE_TIMEOUT, api.JOB_MAX_ATTEMPTS)
+        job = await asyncio.to_thread(api.job_store.claim, worker_id, max_jobs_per_tenant)
+        if job is None:
+            try:
+                await asyncio.wait_for(shutdown.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        job_id = job["id"]
+        print(f"[INFO] Worker {worker_id} running job {job_id} (doc_id: {job['doc_id']}, attempt {job['attempts']})")
+        try:
+            result = await run_crawl_job(api, job, shutdown)
+        except Exception as e:
+            print(f"[ERROR] Job {job_id} failed: {e}")
+            await asyncio.to_thread(api.job_store.finish, job_id, "failed", None, str(e))
+            await asyncio.to_thread(api.finish_document_status, job["doc_id"], "failed")
+            JOBS_FINISHED.inc(outcome="failed")
+            continue
+        current = await asyncio.to_thread(api.job_store.get, job_id)
+        if current["cancel_requested"]:
+            await asyncio.to_thread(api.job_store.finish, job_id, "cancelled", result)
+            await asyncio.to_thread(api.finish_document_status, job["doc_id"], "cancelled")
+            JOBS_FINISHED.inc(outcome="cancelled")
+        elif shutdown.is_set():
+            # Checkpoints are kept, so the next worker picks up where this one stopped.
+            await asyncio.to_thread(api.job_store.release, job_id)
+            JOBS_FINISHED.inc(outcome="released")
+            print(f"[INFO] Worker {worker_id} shutting down, job {job_id} goes back to the queue.")
+        else:
+            await asyncio.to_thread(api.job_store.finish, job_id, "completed", result)
+            JOBS_FINISHED.inc(outcome="completed")
+            print(f"[INFO] Job {job_id} completed.")
+    publisher.cancel()
+    await asyncio.to_thread(api.job_store.save_metrics, metrics_source, metrics.REGISTRY.snapshot())
+    await api.browser_pool.close()
+    await api.clients.aclose()
+    print(f"[INFO] Worker {worker_id} stopped.")
+
+
+def worker_main(index: int, max_jobs_per_tenant: int):
+    asyncio.run(worker_loop(index, max_jobs_per_tenant))
+
+
+def main():
+    from app import test as api
+
+    parser = argparse.ArgumentParser(description="Run the crawl job worker pool.")
+    parser.add_argument("--processes", type=int, default=api.WORKER_PROCESSES)
+    parser.add_argument("--max-jobs-per-tenant", type=int, default=api.MAX_JOBS_PER_TENANT)
+    args = parser.parse_args()
+
+    # Workers split budgets like EMBEDDING_TOKENS_PER_MINUTE between them.
+    os.environ["WORKER_PROCESSES"] = str(max(1, args.processes))
+    # Every worker owns its own browser, event loop and clients, so use fresh
+    # interpreters instead of forking one that already has them.
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=worker_main, args=(i, args.max_jobs_per_tenant), name=f"crawl-worker-{i}")
+        for i in range(max(1, args.processes))
+    ]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()  # SIGTERM: workers finish their checkpoints and requeue their job
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
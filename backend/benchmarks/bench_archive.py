@@ -0,0 +1,165 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+
+Offline import benchmark: stream a tar.gz (or zip) of a generated docs site
+through POST /ingest/archive, then upload it again as an incremental import,
+where every page is unchanged. OpenAI, the vector store and the Supabase
+documents table are the local stand-ins from benchmarks/fakes.py.
+
+Run from the backend directory:
+    poetry run python -m benchmarks.bench_archive --pages 50000
+
+Results are written as JSON to --results-dir and compared with the previous
+run found there.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import httpx
+
+from benchmarks import fakes
+from benchmarks.bench_e2e import git_revision, load_app, peak_rss_mb, previous_result
+
+UPLOAD_CHUNK = 256 * 1024
+BASE_URL = "https://docs.example.com"
+
+
+def run_openai(conn, options: dict):
+    """Child process: serve the fake OpenAI API."""
+    server = fakes.serve_fake_openai(**options)
+    conn.send(f"http://127.0.0.1:{server.server_address[1]}/v1")
+    conn.recv()  # Block until the parent is done.
+
+
+def build_archive(site_dir: str, path: str, archive_format: str):
+    if archive_format == "zip":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for root, _, files in os.walk(site_dir):
+                for name in files:
+                    full = os.path.join(root, name)
+                    archive.write(full, os.path.join("site", os.path.relpath(full, site_dir)))
+    else:
+        with tarfile.open(path, "w:gz") as archive:
+            archive.add(site_dir, arcname="site")
+
+
+async def upload(client: httpx.AsyncClient, path: str, params: dict) -> dict:
+    async def body():
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+
+    start = time.perf_counter()
+    response = await client.post("/ingest/archive", params=params, content=body())
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    result = response.json()
+    pipeline = result["pipeline"]
+    return {
+        "doc_id": result["doc_id"],
+        "status": result["status"],
+        "processed": result["processed"],
+        "skipped": result["skipped"],
+        "failed": result["failed"],
+        "elapsed_seconds": round(elapsed, 3),
+        "pages_per_second": round(result["processed"] / elapsed, 2),
+        "chunks": pipeline["chunks_upserted"],
+        "chunks_per_second": round(pipeline["chunks_upserted"] / elapsed, 2),
+        "upload_mb_per_second": round(os.path.getsize(path) / 1e6 / elapsed, 2),
+        "dedup": result["dedup"],
+        "archive": result["archive"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5000, help="pages in the generated docs site")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--format", default="tar.gz", choices=["tar.gz", "zip"])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embeddings request")
+    parser.add_argument("--results-dir", default=os.path.join(".cache", "benchmarks"))
+    parser.add_argument("--label", default=None, help="free-form note stored with the results")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-archive-")
+    site_dir = os.path.join(workdir, "site")
+    start = time.perf_counter()
+    fakes.generate_docs_site(site_dir, pages=args.pages, duplicate_ratio=args.duplicate_ratio)
+    archive_path = os.path.join(workdir, f"site.{args.format}")
+    build_archive(site_dir, archive_path, args.format)
+    archive_mb = round(os.path.getsize(archive_path) / 1e6, 1)
+    print(f"[INFO] Built a {archive_mb} MB {args.format} of {args.pages} pages in {time.perf_counter() - start:.1f}s")
+
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    server = ctx.Process(
+        target=run_openai, args=(child_conn, {"embed_latency": args.embed_latency}), daemon=True
+    )
+    server.start()
+    openai_url = parent_conn.recv()
+    api = load_app(workdir, openai_url, "http")
+    from app.main import create_app
+
+    async def run():
+        transport = httpx.ASGITransport(app=create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            params = {"user_id": "bench-user", "base_url": BASE_URL, "strip_components": 1}
+            first = await upload(client, archive_path, params)
+            print(f"[INFO] Import: {json.dumps(first)}")
+            params.update(doc_id=first["doc_id"], incremental="true")
+            again = await upload(client, archive_path, params)
+            print(f"[INFO] Incremental re-import: {json.dumps(again)}")
+        return first, again
+
+    try:
+        first, again = asyncio.run(run())
+    finally:
+        parent_conn.send("stop")
+        server.join(timeout=5)
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "label": args.label,
+        "args": vars(args),
+        "archive_mb": archive_mb,
+        "import": first,
+        "reimport": again,
+        "vectors_stored": api.clients.vector_store.count(first["doc_id"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    previous = previous_result(args.results_dir, kind="archive")
+    path = os.path.join(args.results_dir, f"archive-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n{'run':>10} {'seconds':>9} {'pages/s':>9} {'chunks/s':>9} {'MB/s':>7}")
+    for name, row in (("import", first), ("reimport", again)):
+        print(f"{name:>10} {row['elapsed_seconds']:>9} {row['pages_per_second']:>9} "
+              f"{row['chunks_per_second']:>9} {row['upload_mb_per_second']:>7}")
+    print(f"\n[INFO] Peak RSS {result['peak_rss_mb']} MB for a {archive_mb} MB archive. Results saved to {path}")
+    if previous is not None:
+        print(f"\nCompared with {previous['timestamp']} ({previous.get('git_revision')}):")
+        for name in ("import", "reimport"):
+            old, new = previous[name]["pages_per_second"], result[name]["pages_per_second"]
+            print(f"  {name:<9} pages_per_second {old!s:>10} -> {new!s:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+
+Micro-benchmark: the token-aware markdown chunker against the old word
+splitter on large generated docs pages.
+
+Run from the backend directory:
+    poetry run python -m benchmarks.bench_chunker --pages 20 --sections 200
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from app.utils.chunker import chunk_markdown, get_token_counter, split_text
+
+WORDS = (
+    "request response token client server endpoint header query parameter "
+    "authentication database function returns object string integer the a to "
+    "of and in is for with you can this that be use"
+).split()
+
+
+def generate_page(sections: int, seed: int) -> str:
+    """A markdown page shaped like crawl4ai's fit_markdown output."""
+    rng = random.Random(seed)
+    parts = [f"# Reference page {seed}"]
+    for s in range(sections):
+        parts.append(f"{'#' * rng.randint(2, 4)} Section {s}")
+        for _ in range(rng.randint(1, 4)):
+            parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))))
+        if rng.random() < 0.4:
+            code = "\n".join(f"    call_{i}(arg_{i}, value={i})" for i in range(rng.randint(3, 30)))
+            parts.append(f"```python\ndef example_{s}():\n{code}\n```")
+    return "\n\n".join(parts)
+
+
+def run(name, fn, pages, count_tokens):
+    timings = []
+    chunks = []
+    tracemalloc.start()
+    for page in pages:
+        start = time.perf_counter()
+        chunks = list(fn(page))
+        timings.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total_mb = sum(len(p) for p in pages) / 1e6
+    texts = [c["text"] if isinstance(c, dict) else c for c in chunks]
+    sizes = [count_tokens(t) for t in texts]
+    print(
+        f"{name:<16} {total_mb / sum(timings):8.2f} MB/s  "
+        f"median {statistics.median(timings) * 1000:8.2f} ms/page  "
+        f"peak {peak / 1e6:7.2f} MB  "
+        f"chunks/page {len(texts):5d}  tokens max {max(sizes):6d} mean {statistics.mean(sizes):8.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    args = parser.parse_args()
+
+    pages = [generate_page(args.sections, seed) for seed in range(args.pages)]
+    count_tokens = get_token_counter()
+    print(f"{args.pages} pages, {sum(len(p) for p in pages) / 1e6:.1f} MB of markdown")
+    run("split_text", split_text, pages, count_tokens)
+    run("chunk_markdown", lambda p: chunk_markdown(p, max_tokens=args.max_tokens), pages, count_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+
+End-to-end offline benchmark: crawl + embed a generated docs site, then
+load /chat at several concurrency levels. OpenAI, the vector store and the
+Supabase documents table are replaced by the local stand-ins in
+benchmarks/fakes.py, so nothing leaves the machine.
+
+Run from the backend directory:
+    poetry run python -m benchmarks.bench_e2e --pages 2000 --concurrency 1,8,32
+
+Results are written as JSON to --results-dir and compared with the previous
+run found there.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+
+from benchmarks import fakes
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_servers(conn, site_dir: str, pages: int, duplicate_ratio: float, openai_options: dict):
+    """Child process: generate + serve the docs site and the fake OpenAI API."""
+    paths = fakes.generate_docs_site(site_dir, pages=pages, duplicate_ratio=duplicate_ratio)
+    site = fakes.serve_directory(site_dir)
+    site_url = f"http://127.0.0.1:{site.server_address[1]}"
+    fakes.write_sitemap(site_dir, site_url, paths)
+    openai_server = fakes.serve_fake_openai(**openai_options)
+    conn.send((site_url, f"http://127.0.0.1:{openai_server.server_address[1]}/v1", len(paths)))
+    conn.recv()  # Block until the parent is done.
+
+
+def load_app(
+    workdir: str,
+    openai_url: str,
+    render_mode: str,
+    tokens_per_minute: Optional[int] = None,
+    answer_cache: bool = True,
+):
+    """Import app.test against the local stand-ins, with the fake OpenAI's token limit as budget."""
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": openai_url,
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_KEY": "bench.bench.bench",
+        "VECTOR_STORE": "local",
+        "LOCAL_VECTOR_DIR": os.path.join(workdir, "vectors"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "CRAWL_STATE_PATH": os.path.join(workdir, "crawl_state.sqlite3"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "CHUNK_STORE_PATH": os.path.join(workdir, "chunks.sqlite3"),
+        "RENDER_MODE": render_mode,
+        "EMBEDDING_TOKENS_PER_MINUTE": str(tokens_per_minute or 0),
+        "WORKER_PROCESSES": "1",  # the crawl runs in this process
+    })
+    if not answer_cache:
+        os.environ["ANSWER_CACHE_MAX_PER_DOC"] = "0"
+    from app import test as api
+
+    api.clients.supabase = fakes.StubStatusStore()
+    api.clients.vector_store = fakes.InMemoryVectorStore()
+    return api
+
+
+async def bench_ingest(api, site_url: str, max_urls: int) -> dict:
+    doc_id = "bench-doc"
+    api.create_document(doc_id, site_url, "bench-user")
+    start = time.perf_counter()
+    lastmods = {}
+    urls = await api.get_relevant_urls(site_url + "/docs/", max_urls=max_urls, lastmods=lastmods)
+    discovered = time.perf_counter()
+    result = await api.scrape_and_embed_docs_parallel(urls, doc_id, lastmods=lastmods)
+    elapsed = time.perf_counter() - start
+    pipeline = result["pipeline"]
+    return {
+        "doc_id": doc_id,
+        "urls": len(urls),
+        "processed": result["processed"],
+        "failed": len(result["failed"]),
+        "discovery_seconds": round(discovered - start, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "pages_per_second": round(result["processed"] / elapsed, 2),
+        "chunks": pipeline["chunks_upserted"],
+        "chunks_per_second": round(pipeline["chunks_upserted"] / elapsed, 2),
+        "rendered": result["rendered"],
+        "dedup": result["dedup"],
+        "status_writes": api.clients.supabase.writes,
+        "vectors_stored": api.clients.vector_store.count(doc_id),
+        "chunk_store": api.chunk_store.stats(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def bench_chat(api, doc_id: str, concurrency: int, requests: int, unique_queries: int, stream: bool) -> dict:
+    rng = random.Random(concurrency)
+    queries = [
+        "how do I " + " ".join(rng.choice(fakes.WORDS) for _ in range(6)) + "?" for _ in range(unique_queries)
+    ]
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    context_tokens: List[int] = []
+    cached = 0
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+    from app.main import create_app
+
+    transport = httpx.ASGITransport(app=create_app())
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def one(i: int):
+            nonlocal errors, cached
+            payload = {"doc_id": doc_id, "query": queries[i % len(queries)], "top_k": 3, "stream": stream}
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    if stream:
+                        async with client.stream("POST", "/chat", json=payload) as response:
+                            first = None
+                            event = None
+                            async for line in response.aiter_lines():
+                                if line.startswith("event: "):
+                                    event = line[len("event: "):]
+                                if first is None and event == "token":
+                                    first = time.perf_counter() - start
+                                if event == "done" and line.startswith("data: "):
+                                    done = json.loads(line[len("data: "):])
+                                    context_tokens.append(done.get("context_tokens", 0))
+                                    cached += bool(done.get("cached"))
+                            if first is not None:
+                                first_tokens.append(first)
+                            ok = response.status_code == 200
+                    else:
+                        response = await client.post("/chat", json=payload)
+                        ok = response.status_code == 200
+                        if ok:
+                            body = response.json()
+                            context_tokens.append(body.get("context_tokens", 0))
+                            cached += bool(body.get("cached"))
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "context_tokens": round(statistics.mean(context_tokens)) if context_tokens else 0,
+        "answer_cache_hits": cached,
+    }
+    if stream:
+        result["ttft_p50_ms"] = round(percentile(first_tokens, 50) * 1000, 1)
+        result["ttft_p95_ms"] = round(percentile(first_tokens, 95) * 1000, 1)
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def previous_result(results_dir: str, kind: str = "e2e") -> Optional[dict]:
+    files = sorted(glob.glob(os.path.join(results_dir, f"{kind}-*.json")))
+    if not files:
+        return None
+    with open(files[-1], encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(previous: dict, current: dict):
+    def change(old, new, higher_is_better: bool) -> str:
+        if not old:
+            return ""
+        delta = (new - old) / old * 100
+        better = delta > 0 if higher_is_better else delta < 0
+        return f"{delta:+.1f}% ({'better' if better else 'worse'})" if abs(delta) >= 1 else "~"
+
+    print(f"\nCompared with {previous['timestamp']} ({previous.get('git_revision')}):")
+    for key, higher in (("pages_per_second", True), ("chunks_per_second", True), ("peak_rss_mb", False)):
+        old, new = previous["ingest"].get(key), current["ingest"].get(key)
+        print(f"  ingest {key:<18} {old!s:>10} -> {new!s:>10}  {change(old, new, higher)}")
+    old_chat = {row["concurrency"]: row for row in previous.get("chat", [])}
+    for row in current["chat"]:
+        old = old_chat.get(row["concurrency"])
+        if old is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms", "context_tokens"):
+            if key not in old:
+                continue
+            print(f"  chat c={row['concurrency']:<4} {key:<14} {old[key]!s:>10} -> {row[key]!s:>10}  "
+                  f"{change(old[key], row[key], False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000, help="pages in the generated docs site")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated /chat concurrency levels")
+    parser.add_argument("--chat-requests", type=int, default=200, help="/chat requests per concurrency level")
+    parser.add_argument("--unique-queries", type=int, default=50, help="distinct questions (repeats hit the caches)")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="disable the semantic answer cache, so every request is retrieved and generated")
+    parser.add_argument("--stream", action="store_true", help="benchmark streamed /chat and report time to first token")
+    parser.add_argument("--render-mode", default="http", choices=["auto", "http", "browser"])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embeddings request")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="seconds before the first answer token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per answer token")
+    parser.add_argument("--rpm", type=int, default=None, help="fake OpenAI requests per minute")
+    parser.add_argument("--tpm", type=int, default=None, help="fake OpenAI tokens per minute")
+    parser.add_argument("--results-dir", default=os.path.join(".cache", "benchmarks"))
+    parser.add_argument("--label", default=None, help="free-form note stored with the results")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-e2e-")
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    servers = ctx.Process(
+        target=run_servers,
+        args=(child_conn, os.path.join(workdir, "site"), args.pages, args.duplicate_ratio, {
+            "embed_latency": args.embed_latency,
+            "chat_latency": args.chat_latency,
+            "token_latency": args.token_latency,
+            "rpm": args.rpm,
+            "tpm": args.tpm,
+        }),
+        daemon=True,
+    )
+    servers.start()
+    site_url, openai_url, site_pages = parent_conn.recv()
+    print(f"[INFO] Docs site with {site_pages} pages at {site_url}, fake OpenAI at {openai_url}")
+
+    api = load_app(workdir, openai_url, args.render_mode, args.tpm, answer_cache=not args.no_answer_cache)
+
+    async def run():
+        # One event loop for everything, like uvicorn / the worker.
+        ingest = await bench_ingest(api, site_url, max_urls=site_pages)
+        print(f"[INFO] Ingest: {json.dumps(ingest)}")
+        chat = []
+        for level in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            api.retrieval_cache = type(api.retrieval_cache)(
+                max_entries=api.RETRIEVAL_CACHE_MAX_ENTRIES, ttl_seconds=api.RETRIEVAL_CACHE_TTL
+            )
+            row = await bench_chat(api, ingest["doc_id"], level, args.chat_requests, args.unique_queries, args.stream)
+            chat.append(row)
+            print(f"[INFO] Chat: {json.dumps(row)}")
+        return ingest, chat
+
+    try:
+        ingest, chat = asyncio.run(run())
+    finally:
+        parent_conn.send("stop")
+        servers.join(timeout=5)
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "label": args.label,
+        "python": platform.python_version(),
+        "args": vars(args),
+        "ingest": ingest,
+        "chat": chat,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    previous = previous_result(args.results_dir)
+    path = os.path.join(args.results_dir, f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n{'pages/s':>10} {'chunks/s':>10} {'peak RSS':>10}")
+    print(f"{ingest['pages_per_second']:>10} {ingest['chunks_per_second']:>10} {result['peak_rss_mb']:>8}MB")
+    print(f"\n{'conc':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'ctx tok':>8} {'cached':>7}")
+    for row in chat:
+        print(f"{row['concurrency']:>6} {row['requests_per_second']:>8} {row['p50_ms']:>8} "
+              f"{row['p95_ms']:>8} {row['p99_ms']:>8} {row['errors']:>7} {row.get('context_tokens', '-'):>8} "
+              f"{row.get('answer_cache_hits', '-'):>7}")
+    print(f"\n[INFO] Results saved to {path}")
+    if previous is not None:
+        compare(previous, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+
+Startup benchmark: how long a fresh interpreter takes to import the API
+(app.main), run its lifespan startup and answer a first request, and how
+long a crawl worker takes to import app.test. Every run is a new process,
+and the network connections opened while starting are counted (there
+should be none, clients are created lazily).
+
+Run from the backend directory:
+    poetry run python -m benchmarks.bench_startup --runs 5
+
+Results are written as JSON to --results-dir and compared with the previous
+run found there. With --max-regression 0.2 the exit code is 1 when a median
+got more than 20% slower, so CI can catch startup regressions.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| +(\S+)$")
+TIMINGS = ("import_ms", "startup_ms", "first_request_ms", "process_ms")
+
+
+def child(target: str):
+    """Runs in the measured process: start the API or a worker, print timings as JSON."""
+    import socket
+
+    connections: List[str] = []
+    connect = socket.socket.connect
+
+    def counting_connect(sock, address):
+        connections.append(repr(address))
+        return connect(sock, address)
+
+    socket.socket.connect = counting_connect
+    result = {}
+    start = time.perf_counter()
+    if target == "worker":
+        from app import test  # noqa: F401  (what every worker process imports before polling)
+        result["import_ms"] = (time.perf_counter() - start) * 1000
+    else:
+        import asyncio
+        import httpx
+        from app.main import create_app
+
+        result["import_ms"] = (time.perf_counter() - start) * 1000
+
+        async def start_and_request():
+            app = create_app()
+            started = time.perf_counter()
+            async with app.router.lifespan_context(app):
+                result["startup_ms"] = (time.perf_counter() - started) * 1000
+                requested = time.perf_counter()
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    response = await client.get("/")
+                    response.raise_for_status()
+                result["first_request_ms"] = (time.perf_counter() - requested) * 1000
+
+        asyncio.run(start_and_request())
+    result["connections"] = connections
+    print("BENCH_RESULT " + json.dumps(result))
+
+
+def top_imports(stderr: str, limit: int = 10) -> List[dict]:
+    """
+    Slowest third-party/stdlib packages from python -X importtime output: the
+    cumulative time of each top-level package where it was first imported
+    (our own app and benchmarks packages are the totals, so they are left out).
+    """
+    packages: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if not match:
+            continue
+        package = match.group(3).split(".")[0]
+        if package not in ("app", "benchmarks"):
+            packages[package] = max(packages.get(package, 0), int(match.group(2)))
+    rows = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"module": package, "ms": round(us / 1000, 1)} for package, us in rows]
+
+
+def run_once(target: str, env: Dict[str, str]) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "benchmarks.bench_startup", "--child", target],
+        capture_output=True, text=True, env=env,
+    )
+    process_ms = (time.perf_counter() - start) * 1000
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("BENCH_RESULT ")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"{target} startup failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(lines[-1][len("BENCH_RESULT "):])
+    result["process_ms"] = process_ms
+    result["top_imports"] = top_imports(proc.stderr)
+    return result
+
+
+def summarize(runs: List[dict]) -> dict:
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in TIMINGS if all(key in run for run in runs)
+    }
+    summary["connections"] = sorted({c for run in runs for c in run["connections"]})
+    summary["top_imports"] = runs[-1]["top_imports"]
+    return summary
+
+
+def regressions(previous: dict, current: dict, threshold: float) -> List[str]:
+    found = []
+    for target, summary in current["targets"].items():
+        before = previous.get("targets", {}).get(target, {})
+        for key in TIMINGS:
+            old, new = before.get(key), summary.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            print(f"  {target:<7} {key:<17} {old:>9.1f} -> {new:>9.1f}  {change * 100:+.1f}%")
+            if change > threshold:
+                found.append(f"{target} {key} {change * 100:+.1f}%")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per target")
+    parser.add_argument("--targets", default="api,worker", help="comma-separated: api, worker")
+    parser.add_argument("--results-dir", default=os.path.join(".cache", "benchmarks"))
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="fail if a median is this much slower than the previous run (0.2 = 20%%)")
+    parser.add_argument("--label", default=None, help="free-form note stored with the results")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    from benchmarks.bench_e2e import git_revision, previous_result
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    # Placeholder credentials: nothing may be contacted while starting up.
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "PINECONE_API_KEY": "bench",
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_KEY": "bench.bench.bench",
+        "PRELOAD_CLIENTS": "false",
+        "VECTOR_STORE": "local",
+        "LOCAL_VECTOR_DIR": os.path.join(workdir, "vectors"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "CRAWL_STATE_PATH": os.path.join(workdir, "crawl_state.sqlite3"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "CHUNK_STORE_PATH": os.path.join(workdir, "chunks.sqlite3"),
+    }
+
+    targets = {}
+    for target in [t.strip() for t in args.targets.split(",") if t.strip()]:
+        runs = [run_once(target, env) for _ in range(args.runs)]
+        targets[target] = summarize(runs)
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "label": args.label,
+        "python": sys.version.split()[0],
+        "args": {k: v for k, v in vars(args).items() if k != "child"},
+        "targets": targets,
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    previous = previous_result(args.results_dir, kind="startup")
+    path = os.path.join(args.results_dir, f"startup-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\n{'target':<8} {'import ms':>10} {'startup ms':>11} {'1st req ms':>11} {'process ms':>11} {'conns':>6}")
+    for target, summary in targets.items():
+        print(f"{target:<8} {summary.get('import_ms', '-'):>10} {summary.get('startup_ms', '-'):>11} "
+              f"{summary.get('first_request_ms', '-'):>11} {summary.get('process_ms', '-'):>11} "
+              f"{len(summary['connections']):>6}")
+    for target, summary in targets.items():
+        print(f"\nSlowest imports ({target}):")
+        for row in summary["top_imports"]:
+            print(f"  {row['ms']:>8.1f} ms  {row['module']}")
+        if summary["connections"]:
+            print(f"[ERROR] {target} opened network connections while starting: {summary['connections']}")
+    print(f"\n[INFO] Results saved to {path}")
+
+    if previous is not None:
+        print(f"\nCompared with {previous['timestamp']} ({previous.get('git_revision')}):")
+        slower = regressions(previous, result, args.max_regression if args.max_regression is not None else float("inf"))
+        if args.max_regression is not None and slower:
+            print(f"[ERROR] Startup got slower than allowed: {', '.join(slower)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+
+Local stand-ins used by the offline benchmarks: a fake OpenAI API, an
+in-memory vector store, a stub for the Supabase documents table and a
+generated static docs site.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.utils.vector_store import VectorStore
+
+EMBEDDING_DIM = 1536
+WORDS = (
+    "request response token client server endpoint header query parameter authentication "
+    "database function returns object string integer webhook session cursor pagination "
+    "timeout retry schema index filter limit offset upload bucket policy role migration "
+    "the a to of and in is for with you can this that be use when your"
+).split()
+
+
+# ---------------- Fake OpenAI API ----------------
+class RateLimiter:
+    """Requests and tokens per minute, refilled continuously like OpenAI's limits."""
+
+    def __init__(self, rpm: Optional[int], tpm: Optional[int]):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def allow(self, tokens: int) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            if self.rpm:
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+            if self.tpm:
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+            if (self.rpm and self._requests < 1) or (self.tpm and self._tokens < tokens):
+                self.rejected += 1
+                return False
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            return True
+
+    def headers(self) -> Dict[str, str]:
+        """OpenAI-style x-ratelimit-* headers with what is left right now."""
+        headers = {}
+        if self.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(int(self._requests))
+            headers["x-ratelimit-reset-requests"] = f"{60 / self.rpm:.3f}s"
+        if self.tpm:
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, int(self._tokens)))
+            headers["x-ratelimit-reset-tokens"] = f"{max(0.0, self.tpm - self._tokens) * 60 / self.tpm:.3f}s"
+        return headers
+
+
+def fake_embedding(text: str) -> np.ndarray:
+    """Deterministic unit vector for text; similar texts are not close, which is fine for timing."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set on the subclass created by serve_fake_openai.
+    config: dict = {}
+    limiter: RateLimiter = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rate_limited(self, tokens: int) -> bool:
+        if self.limiter.allow(tokens):
+            return False
+        self._send_json(
+            429,
+            {"error": {"message": "Rate limit reached (fake server)", "type": "requests", "code": "rate_limit_exceeded"}},
+            {"Retry-After": "0.5", **self.limiter.headers()},
+        )
+        return True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _embeddings(self, body: dict):
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        if self._rate_limited(tokens):
+            return
+        time.sleep(self.config["embed_latency"] + self.config["embed_latency_per_input"] * len(texts))
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(text)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }, self.limiter.headers())
+
+    def _chat(self, body: dict):
+        prompt_tokens = sum(len(m.get("content") or "") // 4 + 1 for m in body.get("messages", []))
+        if self._rate_limited(prompt_tokens + self.config["answer_tokens"]):
+            return
+        rng = random.Random(prompt_tokens)
+        words = [rng.choice(WORDS) for _ in range(self.config["answer_tokens"])]
+        created = int(time.time())
+        time.sleep(self.config["chat_latency"])
+        if not body.get("stream"):
+            time.sleep(self.config["token_latency"] * len(words))
+            self._send_json(200, {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)},
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(payload: str):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        for i, word in enumerate(words + [None]):
+            delta = {"content": (" " if i else "") + word} if word is not None else {}
+            write_event(json.dumps({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None if word is not None else "stop"}],
+            }))
+            if word is not None:
+                time.sleep(self.config["token_latency"])
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def serve_fake_openai(
+    port: int = 0,
+    embed_latency: float = 0.05,
+    embed_latency_per_input: float = 0.0005,
+    chat_latency: float = 0.2,
+    token_latency: float = 0.01,
+    answer_tokens: int = 60,
+    rpm: Optional[int] = None,
+    tpm: Optional[int] = None,
+) -> ThreadingHTTPServer:
+    """Start a fake OpenAI API on a background thread; base URL is http://127.0.0.1:<port>/v1."""
+    handler = type("Handler", (FakeOpenAIHandler,), {
+        "config": {
+            "embed_latency": embed_latency,
+            "embed_latency_per_input": embed_latency_per_input,
+            "chat_latency": chat_latency,
+            "token_latency": token_latency,
+            "answer_tokens": answer_tokens,
+        },
+        "limiter": RateLimiter(rpm, tpm),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---------------- In-memory vector store ----------------
+class InMemoryVectorStore(VectorStore):
+    """Brute-force cosine search over normalized vectors kept in a dict per doc_id."""
+
+    def __init__(self):
+        self._docs: Dict[str, Dict[str, tuple]] = {}
+        self._matrices: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[dict]):
+        with self._lock:
+            for v in vectors:
+                doc_id = v["metadata"]["doc_id"]
+                values = np.asarray(v["values"], dtype=np.float32)
+                norm = np.linalg.norm(values)
+                self._docs.setdefault(doc_id, {})[v["id"]] = (values / norm if norm else values, v["metadata"])
+                self._matrices.pop(doc_id, None)
+
+    def _matrix(self, doc_id: str):
+        with self._lock:
+            cached = self._matrices.get(doc_id)
+            if cached is None:
+                items = list(self._docs.get(doc_id, {}).items())
+                matrix = np.stack([vec for _, (vec, _) in items]) if items else np.zeros((0, EMBEDDING_DIM), np.float32)
+                cached = ([vid for vid, _ in items], [md for _, (_, md) in items], matrix)
+                self._matrices[doc_id] = cached
+            return cached
+
+    def query(self, vector: List[float], doc_id: str, top_k: int) -> List[dict]:
+        ids, metadata, matrix = self._matrix(doc_id)
+        if not ids:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        k = min(top_k, len(ids))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [{"id": ids[i], "score": float(scores[i]), "metadata": metadata[i]} for i in best]
+
+    def delete(self, doc_id: str, ids: List[str]):
+        with self._lock:
+            vectors = self._docs.get(doc_id, {})
+            for vector_id in ids:
+                vectors.pop(vector_id, None)
+            self._matrices.pop(doc_id, None)
+
+    def delete_doc(self, doc_id: str):
+        with self._lock:
+            self._docs.pop(doc_id, None)
+            self._matrices.pop(doc_id, None)
+
+    def count(self, doc_id: str) -> int:
+        return len(self._docs.get(doc_id, {}))
+
+
+# ---------------- Stub Supabase documents table ----------------
+class _StubResponse:
+    def __init__(self, data: List[dict]):
+        self.data = data
+
+
+class _StubQuery:
+    def __init__(self, store: "StubStatusStore", table: str):
+        self._store = store
+        self._table = table
+        self._op = None
+        self._data: Optional[dict] = None
+        self._filters: Dict[str, object] = {}
+
+    def insert(self, data: dict):
+        self._op, self._data = "insert", data
+        return self
+
+    def update(self, data: dict):
+        self._op, self._data = "update", data
+        return self
+
+    def select(self, columns: str = "*"):
+        self._op = "select"
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self._filters[column] = value
+        return self
+
+    def execute(self) -> _StubResponse:
+        return self._store._execute(self._table, self._op, self._data, self._filters)
+
+
+class StubStatusStore:
+    """Just enough of the Supabase client (table().insert/update/select/delete().eq().execute()) for ingestion."""
+
+    def __init__(self, write_latency: float = 0.0):
+        self.write_latency = write_latency
+        self.rows: Dict[str, Dict[str, dict]] = {}
+        self.writes = 0
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _StubQuery:
+        return _StubQuery(self, name)
+
+    def _execute(self, table: str, op: str, data: Optional[dict], filters: Dict[str, object]) -> _StubResponse:
+        if op in ("insert", "update", "delete") and self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            rows = self.rows.setdefault(table, {})
+            if op == "insert":
+                self.writes += 1
+                rows[data["id"]] = dict(data)
+                return _StubResponse([dict(data)])
+            matched = [row for row in rows.values() if all(row.get(k) == v for k, v in filters.items())]
+            if op == "update":
+                self.writes += 1
+                for row in matched:
+                    row.update(data)
+            elif op == "delete":
+                self.writes += 1
+                for row in matched:
+                    del rows[row["id"]]
+            else:
+                self.reads += 1
+            return _StubResponse([dict(row) for row in matched])
+
+
+# ---------------- Generated static docs site ----------------
+def _page_html(rng: random.Random, index: int, pages: int, title: str) -> str:
+    links = "".join(
+        f'<li><a href="/docs/page-{rng.randrange(pages)}/">Page {i}</a></li>' for i in range(12)
+    )
+    body = [f"<h1>{title}</h1>"]
+    for s in range(rng.randint(4, 12)):
+        body.append(f"<h2>Section {s} of {title}</h2>")
+        for _ in range(rng.randint(1, 4)):
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 140)))
+            body.append(f"<p>{words} <code>param_{rng.randrange(100)}</code>.</p>")
+        if rng.random() < 0.4:
+            code = "\n".join(f"client.call_{i}(arg_{i}, value={i})" for i in range(rng.randint(3, 20)))
+            body.append(f'<pre><code class="language-python">{code}</code></pre>')
+        if rng.random() < 0.3:
+            items = "".join(f"<li>{rng.choice(WORDS)} {rng.choice(WORDS)}</li>" for _ in range(rng.randint(2, 8)))
+            body.append(f"<ul>{items}</ul>")
+    return (
+        f"<!doctype html><html><head><title>{title}</title><script src=\"/app.js\"></script></head><body>"
+        f"<nav class=\"navbar\"><ul>{links}</ul></nav><div class=\"sidebar\"><ul>{links}</ul></div>"
+        f"<main>{''.join(body)}</main><footer>Generated docs page {index}</footer></body></html>"
+    )
+
+
+def generate_docs_site(directory: str, pages: int = 2000, duplicate_ratio: float = 0.05, seed: int = 0) -> List[str]:
+    """
+    Write a static docs site with sitemap.xml under directory and return the
+    page paths. About duplicate_ratio of the pages are "print views" with the
+    same content as another page, like real docs sites have.
+    """
+    rng = random.Random(seed)
+    paths = []
+    html_by_index = {}
+    for i in range(pages):
+        path = f"/docs/page-{i}/"
+        page_dir = os.path.join(directory, "docs", f"page-{i}")
+        os.makedirs(page_dir, exist_ok=True)
+        html = _page_html(rng, i, pages, f"Reference page {i}")
+        html_by_index[i] = html
+        with open(os.path.join(page_dir, "index.html"), "w", encoding="utf-8") as f:
+            f.write(html)
+        paths.append(path)
+    for i in range(int(pages * duplicate_ratio)):
+        source = rng.randrange(pages)
+        page_dir = os.path.join(directory, "docs", f"print-{i}")
+        os.makedirs(page_dir, exist_ok=True)
+        with open(os.path.join(page_dir, "index.html"), "w", encoding="utf-8") as f:
+            f.write(html_by_index[source])
+        paths.append(f"/docs/print-{i}/")
+    return paths
+
+
+def write_sitemap(directory: str, base_url: str, paths: List[str]):
+    with open(os.path.join(directory, "sitemap.xml"), "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for path in paths:
+            f.write(f"<url><loc>{base_url}{path}</loc></url>\n")
+        f.write("</urlset>\n")
+
+
+def serve_directory(directory: str, port: int = 0) -> ThreadingHTTPServer:
+    """Serve directory over HTTP on a background thread."""
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
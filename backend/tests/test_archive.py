@@ -0,0 +1,131 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from app.utils.archive import ArchiveReader, aiter_archive, decode_entry, entry_url
+
+
+class Unseekable(io.RawIOBase):
+    """A write-only stream without tell(), so zipfile writes data descriptors."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def make_tar(files, mode="w:gz"):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def make_zip(files, streamed=False, compression=zipfile.ZIP_DEFLATED):
+    out = Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression=compression) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return out.buffer.getvalue() if streamed else out.getvalue()
+
+
+def read(data, **options):
+    reader = ArchiveReader(io.BytesIO(data), **options)
+    return dict(reader.entries()), reader
+
+
+def test_entry_url_strips_components():
+    assert entry_url("site/docs/guide.html", "https://docs.test/", strip_components=1) == "https://docs.test/docs/guide.html"
+    assert entry_url("site/docs/index.html", "https://docs.test", strip_components=1) == "https://docs.test/docs/"
+    assert entry_url("./site/a b.md", strip_components=1) == "archive:///a%20b.md"
+    assert entry_url("site/guide.html", strip_components=2) is None
+    assert entry_url("site", strip_components=1) is None
+
+
+@pytest.mark.parametrize("name", ["../secret.html", "docs/../../secret.html", "docs\\..\\secret.html"])
+def test_entry_url_rejects_parent_directories(name):
+    assert entry_url(name, "https://docs.test") is None
+
+
+def test_entry_url_keeps_absolute_names_under_the_base():
+    assert entry_url("/etc/passwd.txt", "https://docs.test") == "https://docs.test/etc/passwd.txt"
+    assert entry_url("C:\\docs\\guide.html").startswith("archive:///")
+    assert entry_url("//host/guide.html", "https://docs.test") == "https://docs.test/host/guide.html"
+
+
+def test_decode_entry_falls_back_to_latin1():
+    assert decode_entry("\ufeffcafé".encode("utf-8")) == "café"
+    assert decode_entry("café".encode("latin-1")) == "café"
+    assert decode_entry(b"\xff\xfe\x80") == "\xff\xfe\x80"
+
+
+@pytest.mark.parametrize("data", [
+    make_tar({"a.html": b"<p>a</p>", "big.html": b"x" * 100, "notes.bin": b"\0"}),
+    make_tar({"a.html": b"<p>a</p>", "big.html": b"x" * 100, "notes.bin": b"\0"}, mode="w"),
+    make_zip({"a.html": b"<p>a</p>", "big.html": b"x" * 100, "notes.bin": b"\0"}),
+    make_zip({"a.html": b"<p>a</p>", "big.html": b"x" * 100, "notes.bin": b"\0"}, streamed=True),
+    make_zip({"a.html": b"<p>a</p>", "big.html": b"x" * 100, "notes.bin": b"\0"}, compression=zipfile.ZIP_STORED),
+])
+def test_entries_over_max_entry_bytes_are_skipped(data):
+    entries, reader = read(data, max_entry_bytes=50)
+    assert entries == {"a.html": b"<p>a</p>", "big.html": None}
+    assert (reader.files, reader.skipped, reader.too_large) == (2, 1, 1)
+
+
+def test_entry_exactly_at_max_entry_bytes_is_kept():
+    entries, _ = read(make_zip({"a.html": b"x" * 50}, streamed=True), max_entry_bytes=50)
+    assert entries == {"a.html": b"x" * 50}
+
+
+def test_non_utf8_members():
+    body = "<p>café</p>".encode("latin-1")
+    entries, _ = read(make_tar({"café.html": body}))
+    assert decode_entry(entries["café.html"]) == "<p>café</p>"
+    # A zip name without the UTF-8 flag is cp437, where 0x82 is "é".
+    data = make_zip({"cafX.html": body}).replace(b"cafX", b"caf\x82")
+    entries, _ = read(data)
+    assert entries == {"café.html": body}
+    assert decode_entry(entries["café.html"]) == "<p>café</p>"
+
+
+def test_not_an_archive():
+    with pytest.raises(ValueError):
+        read(b"just some text, not an archive")
+
+
+def test_aiter_archive_streams_small_chunks():
+    files = {f"docs/page{i}.md": f"# Page {i}\n".encode() * 200 for i in range(20)}
+    data = make_zip(files, streamed=True)
+
+    async def chunks():
+        for i in range(0, len(data), 1000):
+            yield data[i:i + 1000]
+
+    async def main():
+        stats = {}
+        entries = {name: body async for name, body in aiter_archive(chunks(), max_buffer=4096, stats=stats)}
+        return entries, stats
+
+    entries, stats = asyncio.run(main())
+    assert entries == files
+    assert stats["format"] == "zip"
+    assert stats["files"] == 20
+    assert stats["bytes"] <= len(data)
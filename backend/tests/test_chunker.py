@@ -0,0 +1,36 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import pytest
+
+from app.utils.chunker import block_text, chunk_markdown
+
+PAGE = "\n\n".join(
+    [
+        "# Install",
+        "Short intro paragraph.",
+        "## Options",
+        " ".join(f"option{i}  value" for i in range(400)),
+        "```\n" + "\n".join(f"line {i} " + "word " * (i % 30) for i in range(200)) + "\n```",
+        "- item one\n- item two",
+    ]
+)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+@pytest.mark.parametrize("max_tokens", [8, 30, 200, 1000])
+def test_chunk_offsets_slice_block_text(max_tokens):
+    text = block_text(PAGE)
+    chunks = list(chunk_markdown(PAGE, max_tokens=max_tokens, overlap_tokens=max_tokens // 4, count_tokens=count_words))
+    assert chunks
+    for chunk in chunks:
+        assert chunk["text"] == text[chunk["start"]:chunk["end"]]
+        assert chunk["tokens"] <= max_tokens
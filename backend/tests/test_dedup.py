@@ -0,0 +1,154 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from app.utils.dedup import Deduplicator, SimHashIndex, exact_hash, hamming, simhash
+
+WORDS = "alpha beta gamma delta server client install configure token request response cache index".split()
+
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def words(seed, count=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def test_hamming_counts_differing_bits():
+    assert hamming(0, 0) == 0
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(0, (1 << 64) - 1) == 64
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 7])
+def test_find_within_max_distance_only(max_distance):
+    index = SimHashIndex(max_distance)
+    value = random.Random(max_distance).getrandbits(64)
+    index.add("page", value)
+    # Spread the flipped bits so no single band absorbs all of them.
+    bits = [i * 64 // (max_distance + 1) for i in range(max_distance + 1)]
+    assert index.find(flip(value, bits[:max_distance])) == "page"
+    assert index.find(flip(value, bits)) is None
+
+
+def test_find_rejects_a_shared_band_beyond_max_distance():
+    index = SimHashIndex(3)
+    value = random.Random(1).getrandbits(64)
+    index.add("page", value)
+    # Four flips inside band 0: bands 1-3 still match, the distance check must reject it.
+    assert index.find(flip(value, [0, 1, 2, 3])) is None
+    assert index.find(flip(value, [0, 1, 2])) == "page"
+
+
+def test_bands_cover_the_hash():
+    index = SimHashIndex(3)
+    assert index.bands == 4
+    value = random.Random(2).getrandbits(64)
+    bands = index._band_values(value)
+    assert len(bands) == 4
+    assert sum(band << (i * index._band_bits) for i, band in enumerate(bands)) == value
+
+
+def test_hashes_within_max_distance_always_share_a_band():
+    rng = random.Random(3)
+    index = SimHashIndex(3)
+    for _ in range(500):
+        value = rng.getrandbits(64)
+        near = flip(value, rng.sample(range(64), rng.randint(0, 3)))
+        assert any(a == b for a, b in zip(index._band_values(value), index._band_values(near)))
+
+
+def test_find_returns_the_closest_key_and_honours_remove_and_exclude():
+    index = SimHashIndex(3)
+    value = random.Random(4).getrandbits(64)
+    index.add("far", flip(value, [0, 20]))
+    index.add("near", flip(value, [40]))
+    assert index.find(value) == "near"
+    assert index.find(value, exclude="near") == "far"
+    index.remove("near")
+    assert index.find(value) == "far"
+    index.add("far", flip(value, [0, 20, 40, 60]))  # re-adding moves the key
+    assert index.find(value) is None
+
+
+def test_simhash_needs_enough_words():
+    assert simhash("too short to fingerprint") is None
+    assert simhash(words(0)) is not None
+
+
+def test_check_page_finds_exact_and_near_duplicates():
+    dedup = Deduplicator(max_distance=3)
+    text = words(5)
+    assert dedup.check_page("a", text)[0] is None
+    canonical, digest, _ = dedup.check_page("b", "  " + text.upper() + "\n")
+    assert canonical == "a"
+    assert digest == exact_hash(text)
+    near = text.rsplit(" ", 1)[0] + " zeta"
+    assert exact_hash(near) != exact_hash(text)
+    assert hamming(simhash(near), simhash(text)) <= 3
+    assert dedup.check_page("c", near)[0] == "a"
+    assert dedup.check_page("d", words(6))[0] is None
+
+
+def test_forgotten_page_is_no_longer_canonical():
+    dedup = Deduplicator(max_distance=3)
+    text = words(7)
+    dedup.check_page("a", text)
+    dedup.forget_page("a")
+    assert dedup.check_page("b", text)[0] is None
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    from benchmarks import bench_e2e
+
+    return bench_e2e.load_app(str(tmp_path_factory.mktemp("app")), "http://127.0.0.1:9/v1", "http")
+
+
+def test_changed_canonical_page_requeues_its_duplicates(api, monkeypatch):
+    async def fake_embeddings(texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(api, "acreate_embeddings", fake_embeddings)
+    shared = words(8)
+    texts = {"https://docs.test/a": shared, "https://docs.test/b": shared, "https://docs.test/c": words(9)}
+
+    def run(incremental):
+        async def page_source(url):
+            return {"url": url, "status": 200, "content_type": "text/plain", "text": texts[url], "headers": {}}
+
+        return asyncio.run(api.scrape_and_embed_docs_parallel(
+            list(texts), "dedup-doc", incremental=incremental, page_source=page_source
+        ))
+
+    run(False)
+    pages = api.crawl_state_store.get_pages("dedup-doc")
+    # Pages are crawled concurrently, so either copy may come out canonical.
+    duplicate = next(url for url in ("https://docs.test/a", "https://docs.test/b") if pages[url]["canonical_url"])
+    canonical = pages[duplicate]["canonical_url"]
+    assert pages[canonical]["chunk_count"] > 0
+    assert pages[duplicate]["chunk_count"] == 0
+    stored = api.clients.vector_store._docs["dedup-doc"]
+    assert not any(vector_id.startswith(duplicate + "#") for vector_id in stored)
+
+    texts[canonical] = words(10)
+    result = run(True)
+    pages = api.crawl_state_store.get_pages("dedup-doc")
+    assert pages[duplicate]["canonical_url"] is None
+    assert pages[duplicate]["chunk_count"] > 0
+    stored = api.clients.vector_store._docs["dedup-doc"]
+    assert f"{duplicate}#0" in stored
+    assert result["failed"] == []
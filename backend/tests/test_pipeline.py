@@ -0,0 +1,120 @@
+"""
+Capstone II STG-452
+Authors: Brian Cook, Dima Bondar, James Green
+Professor: Bill Hughes
+Our Own Work
+License: MIT
+"""
+
+import asyncio
+
+from app.utils.pipeline import IngestionPipeline
+
+
+def fake_embed(texts):
+    if any(text.startswith("bad") for text in texts):
+        raise RuntimeError("embedding failed")
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+def run_pipeline(pages, **options):
+    """Feed {url: [chunk texts]} through a pipeline; returns (stats, upserted vectors, on_url_done calls)."""
+    upserted = []
+    done = []
+
+    async def main():
+        pipeline = IngestionPipeline(
+            embed_fn=fake_embed,
+            upsert_fn=upserted.extend,
+            flush_interval=0.01,
+            on_url_done=lambda url, ok: done.append((url, ok)),
+            **{"embed_batch_size": 2, "upsert_batch_size": 3, "embed_concurrency": 1, **options},
+        )
+        await pipeline.start()
+        for url, texts in pages.items():
+            for i, text in enumerate(texts):
+                await pipeline.put("doc", url, i, text)
+            await pipeline.seal(url)
+        return await pipeline.close()
+
+    stats = asyncio.run(main())
+    return stats, upserted, dict(done)
+
+
+def test_failed_embed_batch_marks_its_url_failed():
+    stats, upserted, done = run_pipeline({"a": ["a0", "a1"], "b": ["bad0", "b1"], "c": ["c0", "c1"]})
+    assert done == {"a": True, "b": False, "c": True}
+    assert sorted(v["id"] for v in upserted) == ["a#0", "a#1", "c#0", "c#1"]
+    assert stats["failed_chunks"] == 2
+
+
+def test_failed_upsert_marks_its_url_failed():
+    def upsert(vectors):
+        raise RuntimeError("upsert failed")
+
+    done = []
+
+    async def main():
+        pipeline = IngestionPipeline(
+            embed_fn=fake_embed, upsert_fn=upsert, flush_interval=0.01,
+            on_url_done=lambda url, ok: done.append((url, ok)),
+        )
+        await pipeline.start()
+        await pipeline.put("doc", "a", 0, "a0")
+        await pipeline.seal("a")
+        return await pipeline.close()
+
+    stats = asyncio.run(main())
+    assert done == [("a", False)]
+    assert stats["chunks_embedded"] == 1
+    assert stats["chunks_upserted"] == 0
+    assert stats["failed_chunks"] == 1
+
+
+def test_seal_without_chunks_reports_done_right_away():
+    stats, upserted, done = run_pipeline({"empty": []})
+    assert done == {"empty": True}
+    assert upserted == []
+    assert stats["chunks_queued"] == 0
+
+
+def test_stats_count_chunks_and_batches():
+    pages = {f"p{i}": [f"p{i}-{j}" for j in range(2)] for i in range(5)}
+    stats, upserted, done = run_pipeline(pages)
+    assert len(upserted) == 10
+    assert done == {url: True for url in pages}
+    assert stats["chunks_queued"] == stats["chunks_embedded"] == stats["chunks_upserted"] == 10
+    assert stats["embed_batches"] == 5  # embed_batch_size 2, one worker
+    assert stats["upsert_batches"] >= 4  # at most 3 vectors per upsert
+    assert stats["failed_chunks"] == 0
+    assert upserted[0]["metadata"] == {"doc_id": "doc", "source_url": "p0", "chunk_index": 0, "text": "p0-0"}
+
+
+def test_put_waits_while_the_queue_is_full():
+    release = asyncio.Event()
+    embedded = []
+
+    async def slow_embed(texts):
+        await release.wait()
+        embedded.extend(texts)
+        return [[1.0] for _ in texts]
+
+    async def main():
+        pipeline = IngestionPipeline(
+            embed_fn=slow_embed, upsert_fn=lambda vectors: None, embed_batch_size=1,
+            flush_interval=0.01, queue_size=1, embed_concurrency=1,
+        )
+        await pipeline.start()
+        await pipeline.put("doc", "a", 0, "a0")  # taken by the embed worker, which then waits
+        await pipeline.put("doc", "a", 1, "a1")  # fills the queue
+        blocked = asyncio.create_task(pipeline.put("doc", "a", 2, "a2"))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        release.set()
+        await asyncio.wait_for(blocked, timeout=1)
+        await pipeline.seal("a")
+        return await pipeline.close()
+
+    stats = asyncio.run(main())
+    assert embedded == ["a0", "a1", "a2"]
+    assert stats["chunks_upserted"] == 3
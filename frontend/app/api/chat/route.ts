@@ -17,10 +17,24 @@ export async function POST(request: Request) {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload),
+    // Aborts the backend request (and the LLM call) when the browser disconnects.
+    signal: request.signal,
   });
   console.log("[Chat API] Downstream response status:", res.status);
 
   const contentType = res.headers.get("content-type") || "";
+  if (contentType.includes("text/event-stream") && res.body) {
+    // Pass server-sent events straight through instead of buffering the answer.
+    return new Response(res.body, {
+      status: res.status,
+      headers: {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        Connection: "keep-alive",
+      },
+    });
+  }
+
   let data;
   if (contentType.includes("application/json")) {
     data = await res.json();
@@ -28,6 +28,40 @@ type Message = {
   content: string;
 };
 
+// Reads the server-sent events streamed by /api/chat and returns the full answer.
+async function readAnswerStream(
+  body: ReadableStream<Uint8Array>,
+  onUpdate: (partial: string) => void
+): Promise<string> {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (event === "token") {
+        answer += JSON.parse(data).content;
+        onUpdate(answer);
+      } else if (event === "error") {
+        throw new Error(JSON.parse(data).detail);
+      }
+    }
+  }
+  return answer;
+}
+
 export default function ConversationPage() {
   const params = useParams();
   console.log("[ConversationPage] Route params:", params);
@@ -94,69 +128,71 @@ export default function ConversationPage() {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
-  // Poll for document processing status if docId exists.
+  // Follow document processing progress (server-sent events) if docId exists.
   useEffect(() => {
     if (!docId) return;
-    console.log("[ConversationPage] Starting document processing polling for docId:", docId);
+    console.log("[ConversationPage] Subscribing to document progress for docId:", docId);
     setIsProcessing(true);
-    const intervalId = setInterval(async () => {
-      try {
-        const res = await fetch(`http://127.0.0.1:8000/document_status/${docId}`);
-        console.log("[ConversationPage] Document status fetch response:", res.status);
-        if (res.ok) {
-          const status = await res.json();
-          console.log("[ConversationPage] Document status:", status);
-          const percentage =
-            status.total_urls > 0
-              ? Math.round((status.processed_urls / status.total_urls) * 100)
-              : 0;
-          toast.message("Processing Documentation", {
-            id: "doc-status",
-            duration: Infinity,
-            description: (
-              <div className="mt-2 space-y-1">
-                <div className="flex justify-between text-sm">
-                  <span>Status: {status.status}</span>
-                  <span>{percentage}%</span>
-                </div>
-                <div className="w-full rounded-full h-2" style={{ backgroundColor: "transparent" }}>
-                  <div
-                    className="h-2 rounded-full transition-all duration-300"
-                    style={{
-                      width: `${percentage}%`,
-                      background: "linear-gradient(to right, var(--primary-foreground), var(--primary))",
-                    }}
-                  />
-                </div>
-                <div className="flex justify-between text-xs text-muted-foreground">
-                  <span>Processed: {status.processed_urls}/{status.total_urls}</span>
-                  <span>Failed: {status.failed_urls}</span>
-                </div>
-              </div>
-            ),
-          });
+    const source = new EventSource(`http://127.0.0.1:8000/document_progress/${docId}/stream`);
+
+    source.addEventListener("progress", (event) => {
+      const status = JSON.parse((event as MessageEvent).data);
+      console.log("[ConversationPage] Document progress:", status);
+      const percentage =
+        status.total_urls > 0
+          ? Math.round((status.processed_urls / status.total_urls) * 100)
+          : 0;
+      toast.message("Processing Documentation", {
+        id: "doc-status",
+        duration: Infinity,
+        description: (
+          <div className="mt-2 space-y-1">
+            <div className="flex justify-between text-sm">
+              <span>Status: {status.status}</span>
+              <span>{percentage}%</span>
+            </div>
+            <div className="w-full rounded-full h-2" style={{ backgroundColor: "transparent" }}>
+              <div
+                className="h-2 rounded-full transition-all duration-300"
+                style={{
+                  width: `${percentage}%`,
+                  background: "linear-gradient(to right, var(--primary-foreground), var(--primary))",
+                }}
+              />
+            </div>
+            <div className="flex justify-between text-xs text-muted-foreground">
+              <span>Processed: {status.processed_urls}/{status.total_urls}</span>
+              <span>Failed: {status.failed_urls}</span>
+            </div>
+          </div>
+        ),
+      });
+    });
 
-          if (status.status === "completed") {
-            console.log("[ConversationPage] Document processing completed");
-            clearInterval(intervalId);
-            setTimeout(() => {
-              toast.success("Documentation processing completed!", { id: "doc-status" });
-              setIsProcessing(false);
-              setJustEnabled(true);
-              setTimeout(() => setJustEnabled(false), 1000);
-            }, 1000);
-          }
+    source.addEventListener("done", (event) => {
+      const { status } = JSON.parse((event as MessageEvent).data);
+      console.log("[ConversationPage] Document processing finished:", status);
+      source.close();
+      setTimeout(() => {
+        if (status === "completed") {
+          toast.success("Documentation processing completed!", { id: "doc-status" });
         } else {
-          console.error("[ConversationPage] Failed to fetch document status for docId:", docId);
+          toast.error(`Documentation processing ${status}.`, { id: "doc-status" });
         }
-      } catch (error) {
-        console.error("[ConversationPage] Error fetching document status:", error);
-      }
-    }, 2000);
+        setIsProcessing(false);
+        setJustEnabled(true);
+        setTimeout(() => setJustEnabled(false), 1000);
+      }, 1000);
+    });
+
+    source.onerror = (error) => {
+      // EventSource reconnects on its own; just log it.
+      console.error("[ConversationPage] Document progress stream error:", error);
+    };
 
     return () => {
-      console.log("[ConversationPage] Clearing document polling interval");
-      clearInterval(intervalId);
+      console.log("[ConversationPage] Closing document progress stream");
+      source.close();
     };
   }, [docId]);
 
@@ -190,12 +226,18 @@ export default function ConversationPage() {
       const res = await fetch("/api/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ doc_id: docId, query: userMessage, top_k: 3 }),
+        body: JSON.stringify({ doc_id: docId, query: userMessage, top_k: 3, stream: true }),
       });
       console.log("[ConversationPage] /api/chat response status:", res.status);
-      const data = await res.json();
-      console.log("[ConversationPage] Received chat API data:", data);
-      const answer = data.answer;
+      if (!res.ok || !res.body) {
+        throw new Error(`Chat request failed with status ${res.status}`);
+      }
+      // Show the assistant message right away and fill it in as tokens arrive.
+      setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+      const answer = await readAnswerStream(res.body, (partial) => {
+        setMessages((prev) => [...prev.slice(0, -1), { role: "assistant", content: partial }]);
+      });
+      console.log("[ConversationPage] Received streamed answer:", answer);
 
       console.log("[ConversationPage] Inserting assistant message into Supabase");
       const { error: assistantError } = await supabase.from("chat_messages").insert({
@@ -207,7 +249,6 @@ export default function ConversationPage() {
         console.error("[ConversationPage] Error inserting assistant message:", assistantError);
         toast.error("Error saving assistant response");
       }
-      setMessages((prev) => [...prev, { role: "assistant", content: answer }]);
       toast.success("Response generated!", { id: "chat-response" });
     } catch (error) {
       console.error("[ConversationPage] Error generating response:", error);